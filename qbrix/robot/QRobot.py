@@ -1,4 +1,7 @@
+import os
+import shutil
 from time import sleep
+from urllib.parse import urlparse
 from robot.libraries.BuiltIn import BuiltIn
 from Browser import SupportedBrowsers
 
@@ -53,19 +56,31 @@ class QRobot:
     if record_video:
       rec={"dir": "../video"}
 
+    # Parallel runs share one authenticated session through a storage state file
+    storage_state = self.builtin.get_variable_value("${QROBOT_STORAGE_STATE}", None)
+    shared_session = bool(storage_state) and os.path.isfile(storage_state)
+
     # Open New Browser
     browser_id = self.browser.new_browser(browser=browser_enum, headless=headless)
     context_id = self.browser.new_context(
-        viewport={"width": 1920, "height": 1080}, recordVideo=rec
+        viewport={"width": 1920, "height": 1080}, recordVideo=rec,
+        storageState=storage_state if shared_session else None
     )
     self.browser.set_browser_timeout("240 seconds")
-    sleep(1)
 
     # Login to Org
     page_details = self.browser.new_page()
     #page = self.browser.get_current_page()
     #page.set_default_navigation_timeout(120000)
 
+    if shared_session:
+        self.browser.go_to(f"{self.cumulusci.org.instance_url}/lightning/setup/SetupOneHome/home", timeout="120s")
+        # An expired session is redirected to the login page, which also has lightning in its startURL
+        current_url = urlparse(str(self.browser.get_url()))
+        my_domain = urlparse(self.cumulusci.org.instance_url).hostname.split(".")[0]
+        if str(current_url.hostname).startswith(f"{my_domain}.") and current_url.path.endswith("/lightning/setup/SetupOneHome/home"):
+            return browser_id, context_id, page_details
+
     retries = 0
     while retries < 4:
         try:
@@ -81,6 +96,9 @@ class QRobot:
     if retries >= 3:
         raise Exception("Unable to launch robot. Please try again.")
 
+    if storage_state:
+        shutil.copyfile(self.browser.save_storage_state(), storage_state)
+
     # Browse to Setup Page if not there already
     if not str(self.browser.get_url()).endswith("/lightning/setup/SetupOneHome/home"):
       self.browser.go_to(f"{self.cumulusci.org.instance_url}/lightning/setup/SetupOneHome/home", timeout="120s")
@@ -1,12 +1,33 @@
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from time import sleep
 import os
 
-from Browser import ElementState, SelectAttribute
 from cumulusci.robotframework.base_library import BaseLibrary
 from qbrix.robot.QbrixSharedKeywords import QbrixSharedKeywords
 from cumulusci.robotframework.SalesforceAPI import SalesforceAPI
-
+from qbrix.tools.shared.qbrix_content_tasks import find_content_document, upload_content_version
+
+CMS_API_PATH = "connect/cms"
+CMS_JOB_POLL_INITIAL_SECONDS = 2
+CMS_JOB_POLL_MAX_SECONDS = 15
+CMS_JOB_TIMEOUT_SECONDS = 600
+CMS_JOB_FAILED_STATES = ["failed", "error", "cancelled"]
+CMS_EXPORT_MAX_PARALLEL = 4
+
+# ElectronicMediaGroup developer names and the key used for them in the product media mapping file
+PRODUCT_MEDIA_GROUPS = {
+    "productlistimage": "ProductImages",
+    "productdetailimage": "ProductDetailImages",
+    "attachment": "Attachments"
+}
+PRODUCT_MEDIA_LIMITS = {
+    "ProductDetailImages": 8,
+    "ProductImages": 1,
+    "Attachments": 5
+}
+PRODUCT_MEDIA_BATCH_SIZE = 200
 
 class QbrixCMS(BaseLibrary):
 
@@ -33,24 +54,213 @@ class QbrixCMS(BaseLibrary):
 
     def download_all_content(self):
 
+        """
+        Exports the content from every workspace. Exports are run through the Connect CMS API several workspaces at a time, and any workspace which cannot be exported through the API is exported through the UI afterwards.
+        """
+
         # Get Workspace Names
-        results = self.salesforceapi.soql_query(f"SELECT Name FROM ManagedContentSpace WHERE IsDeleted=False")
+        results = self.salesforceapi.soql_query(f"SELECT Id, Name FROM ManagedContentSpace WHERE IsDeleted=False")
         if results["totalSize"] == 0:
             return
 
-        # Download content from each workspace
-        for workspace in results["records"]:
-            self.download_cms_content(workspace["Name"])
+        # Export content from each workspace. Worker threads only use the API connection, not the robot libraries
+        sf = self.cumulusci.sf
+        with ThreadPoolExecutor(max_workers=min(CMS_EXPORT_MAX_PARALLEL, results["totalSize"])) as executor:
+            futures = {workspace["Name"]: executor.submit(self._export_workspace, sf, workspace["Id"], workspace["Name"], True) for workspace in results["records"]}
+
+        failed_workspaces = []
+        for workspace, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Unable to export {workspace} through the API. Error details: {e}")
+                failed_workspaces.append(workspace)
+
+        # The browser can only be driven one workspace at a time
+        for workspace in failed_workspaces:
+            self._download_cms_content_ui(workspace)
+
+    def get_workspace_id(self, workspace):
+        """
+        Looks up the Id of a workspace
+        @param workspace: Name of the workspace
+        @return: The ManagedContentSpace Id, or None if the workspace does not exist
+        """
+
+        results = self.salesforceapi.soql_query(f"SELECT Id FROM ManagedContentSpace where Name = '{workspace}' LIMIT 1")
+        if results["totalSize"] == 1:
+            return results["records"][0]["Id"]
+        return None
+
+    def list_cms_content(self, workspace):
+        """
+        Lists the content items authored in a workspace
+        @param workspace: Name of the workspace
+        @return: List of ManagedContent Ids
+        """
+
+        workspace_id = self.get_workspace_id(workspace)
+        if not workspace_id:
+            raise Exception(f"Workspace not found: {workspace}")
+
+        return self._list_workspace_content(self.cumulusci.sf, workspace_id)
+
+    def create_cms_workspace(self, workspace_name, enhanced_workspace=True):
+        """
+        Creates a workspace through the Connect CMS API. Unlike Create Workspace, no channels or contributors are added to the new workspace.
+        @param workspace_name: Name of the workspace. This must be unique from other workspaces
+        @param enhanced_workspace: Set to True if you are creating an Enhanced workspace, otherwise set to False. Defaults to True.
+        @return: The Id of the new workspace
+        """
+
+        response = self._cms_request(self.cumulusci.sf, "POST", "spaces", {
+            "name": workspace_name,
+            "description": workspace_name,
+            "spaceType": "Enhanced" if enhanced_workspace else "Standard",
+            "defaultLanguage": "en_US"
+        })
+        return response["id"]
+
+    def import_cms_content(self, file_path, workspace, publish=False, wait=True):
+        """
+        Imports a CMS export .zip file into a workspace through the Connect CMS API
+        @param file_path: Relative path to the .zip file containing the export
+        @param workspace: Name of the workspace to import the content into
+        @param publish: Set to True to publish the imported content, otherwise it is imported as draft. Defaults to False.
+        @param wait: Set to True to wait for the import job to finish. Defaults to True.
+        @return: The import job Id
+        """
+
+        workspace_id = self.get_workspace_id(workspace)
+        if not workspace_id:
+            raise Exception(f"Workspace not found: {workspace}")
+
+        sf = self.cumulusci.sf
+        content_document_id = self.upload_media_file(file_path)
+        response = self._cms_request(sf, "POST", "content/jobs/import", {
+            "inputs": {
+                "contentDocumentId": content_document_id,
+                "contentSpaceId": workspace_id,
+                "importConfig": {"actionOnImport": "publish" if publish else "draft"}
+            }
+        })
+
+        job_id = response["id"]
+        if wait:
+            self._wait_for_job(sf, job_id)
+        return job_id
+
+    def export_cms_content(self, workspace, wait=False):
+        """
+        Exports all the content in a workspace to a content .zip file (which is emailed to the admin) through the Connect CMS API
+        @param workspace: Name of the workspace
+        @param wait: Set to True to wait for the export job to finish. Defaults to False.
+        @return: The export job Id, or None if the workspace has no content
+        """
+
+        workspace_id = self.get_workspace_id(workspace)
+        if not workspace_id:
+            raise Exception(f"Workspace not found: {workspace}")
+
+        return self._export_workspace(self.cumulusci.sf, workspace_id, workspace, wait)
+
+    def wait_for_cms_job(self, job_id, timeout=CMS_JOB_TIMEOUT_SECONDS):
+        """
+        Waits for a CMS import or export job to finish
+        @param job_id: Id of the job
+        @param timeout: (Optional) Maximum time (in seconds) to wait. Defaults to 600 seconds.
+        @return: The job details
+        """
+
+        return self._wait_for_job(self.cumulusci.sf, job_id, timeout)
+
+    def _export_workspace(self, sf, workspace_id, workspace, wait):
+        content_ids = self._list_workspace_content(sf, workspace_id)
+        if not content_ids:
+            print(f"No content found in {workspace}. Skipping")
+            return None
+
+        response = self._cms_request(sf, "POST", "content/jobs/export", {
+            "inputs": {
+                "contentSpaceId": workspace_id,
+                "managedContentIds": content_ids
+            }
+        })
+
+        job_id = response["id"]
+        print(f"Started export of {len(content_ids)} item(s) from {workspace}")
+        if wait:
+            self._wait_for_job(sf, job_id)
+        return job_id
+
+    def _list_workspace_content(self, sf, workspace_id):
+        results = sf.query_all(f"SELECT Id FROM ManagedContent WHERE AuthoredManagedContentSpaceId = '{workspace_id}'")
+        return [record["Id"] for record in results["records"]]
+
+    def _wait_for_job(self, sf, job_id, timeout=CMS_JOB_TIMEOUT_SECONDS):
+        deadline = time.monotonic() + float(timeout)
+        interval = CMS_JOB_POLL_INITIAL_SECONDS
+        while True:
+            job = self._cms_request(sf, "GET", f"content/jobs/{job_id}")
+            status = str(job.get("status", "")).lower()
+            if status == "completed":
+                return job
+            if status in CMS_JOB_FAILED_STATES:
+                raise Exception(f"CMS job {job_id} finished with status {job.get('status')}. Error details: {job.get('errorMessage')}")
+            if time.monotonic() >= deadline:
+                raise Exception(f"CMS job {job_id} did not finish within {timeout} seconds")
+            sleep(interval)
+            interval = min(interval * 2, CMS_JOB_POLL_MAX_SECONDS)
+
+    def _cms_request(self, sf, method, path, body=None):
+        if body is None:
+            return sf.restful(f"{CMS_API_PATH}/{path}", method=method)
+        return sf.restful(f"{CMS_API_PATH}/{path}", method=method, data=json.dumps(body))
+
+    def upload_media_file(self, file_path, title=None):
+        """
+        Uploads a local media file (image, video, PDF etc.) to Salesforce Files, streaming it from disk. If the same file has already been uploaded, the existing file is returned instead.
+        @param file_path: Path to the file within the project
+        @param title: (Optional) Title for the file. Defaults to the file name without the extension
+        @return: The ContentDocumentId of the file
+        """
+
+        if not os.path.exists(file_path):
+            raise Exception(f"Media file does not exist: {file_path}")
+
+        sf = self.cumulusci.sf
+        content_document_id = find_content_document(sf, file_path)
+        if content_document_id:
+            return content_document_id
+
+        content_version = upload_content_version(sf, file_path, title)
+        results = self.salesforceapi.soql_query(f"SELECT ContentDocumentId FROM ContentVersion WHERE Id = '{content_version['id']}'")
+        return results["records"][0]["ContentDocumentId"]
 
     def upload_cms_import_file(self, file_path, workspace):
 
         """
-        Uploads the Content from the CMS import .zip file
+        Uploads the Content from the CMS import .zip file. The import is run through the Connect CMS API, falling back to the UI if the import job cannot be created.
         @return:
         @param file_path: Relative path to the .zip file containing the export
         @param workspace: Name of the workspace to upload the content to
         """
 
+        if not workspace:
+            print("Workspace cannot be None. Skipping")
+            return
+
+        try:
+            job_id = self.import_cms_content(file_path, workspace, wait=False)
+        except Exception as e:
+            print(f"Unable to import {file_path} through the API, using the UI instead. Error details: {e}")
+            self._upload_cms_import_file_ui(file_path, workspace)
+            return
+
+        # Once the job exists a failure is raised rather than importing the same file again through the UI
+        self.wait_for_cms_job(job_id)
+
+    def _upload_cms_import_file_ui(self, file_path, workspace):
         self.go_to_digital_experiences()
         sleep(5)
 
@@ -91,11 +301,23 @@ class QbrixCMS(BaseLibrary):
     def download_cms_content(self, workspace):
 
         """
-        Initiate the export of a workspace to a content .zip file (which is emailed to the admin)
+        Initiate the export of a workspace to a content .zip file (which is emailed to the admin). The export is run through the Connect CMS API, falling back to the UI if the API export fails.
         @param workspace: Name of workspace
         @return:
         """
 
+        if not workspace:
+            return
+
+        try:
+            self.export_cms_content(workspace)
+            return
+        except Exception as e:
+            print(f"Unable to export {workspace} through the API, using the UI instead. Error details: {e}")
+
+        self._download_cms_content_ui(workspace)
+
+    def _download_cms_content_ui(self, workspace):
         self.go_to_digital_experiences()
         sleep(5)
 
@@ -173,9 +395,7 @@ class QbrixCMS(BaseLibrary):
         """
 
         # Check for existing workspace
-        results = self.salesforceapi.soql_query(f"SELECT Id FROM ManagedContentSpace where Name = '{workspace_name}' LIMIT 1")
-
-        if results["totalSize"] == 1:
+        if self.get_workspace_id(workspace_name):
             print("Workspace exists already, skipping.")
             return
 
@@ -237,78 +457,34 @@ class QbrixCMS(BaseLibrary):
     def generate_product_media_file(self):
 
         """
-        Generates a Product Media Mapping File, which stores information about Product List Images, Product Detail Images and Attachments related to the products.
+        Generates a Product Media Mapping File, which stores information about Product List Images, Product Detail Images and Attachments related to the products. The mapping is built from ProductMedia, ElectronicMediaGroup and ManagedContent records.
         @return: .json file is created within the project and stored at this path: cms_data/product_images.json
         """
 
-        # Get All Active Products which have attached ElectronicMedia
-        results = self.salesforceapi.soql_query(f"SELECT Id, External_ID__c, Name from Product2 WHERE Id IN (Select ProductId from ProductMedia)")
+        sf = self.cumulusci.sf
 
-        if results["totalSize"] == 0:
+        # Get All Products which have attached ElectronicMedia
+        product_media = sf.query_all("SELECT ProductId, Product.External_ID__c, ElectronicMediaId, ElectronicMediaGroup.DeveloperName FROM ProductMedia ORDER BY ProductId, SortOrder")["records"]
+
+        if len(product_media) == 0:
             print("No Products found with attached media")
             return
 
+        # Look up the CMS titles for all the media in bulk
+        content_titles = {}
+        for record in self._query_in(sf, "SELECT Id, Name FROM ManagedContent WHERE Id IN ({})", [media["ElectronicMediaId"] for media in product_media]):
+            content_titles[record["Id"]] = record["Name"]
+
         result_dict = {}
-        self.shared.go_to_app("Commerce - Admin")
-
-        for product in results["records"]:
-
-            product_dict = {}
-
-            # Set External ID
-            product_dict.update({"External_ID__c": product["External_ID__c"]})
-
-            self.browser.go_to(f"{self.cumulusci.org.instance_url}/lightning/r/Product2/{product['Id']}/view", timeout='30s')
-            sleep(4)
-
-            self.browser.click(f"div.uiTabBar >> span.title:text-is('Media')")
-            sleep(10)
-
-            # Get Product Detail Images (Max. 8)
-            if self.browser.get_element_count(f"article.slds-card:has-text('Product Detail Images'):visible >> img.fileCardImage:visible") > 0:
-                product_detail_image_list = []
-                product_detail_images = self.browser.get_elements(f"article.slds-card:has-text('Product Detail Images'):visible >> img.fileCardImage:visible")
-                if product_detail_images:
-                    for prod in product_detail_images:
-                        prod_property = self.browser.get_property(prod, "alt")
-                        if prod_property:
-                            print(prod_property)
-                            product_detail_image_list.append(prod_property)
-
-                if len(product_detail_image_list) > 0:
-                    product_dict.update({"ProductDetailImages": product_detail_image_list})
-
-            # Get Product List Image (Max. 1)
-            if self.browser.get_element_count(f"article.slds-card:has-text('Product List Image'):visible >> img.fileCardImage:visible") > 0:
-                product_image_list = []
-                product_images = self.browser.get_elements(f"article.slds-card:has-text('Product List Image'):visible >> img.fileCardImage:visible")
-                if product_images:
-                    for prod in product_images:
-                        prod_property = self.browser.get_property(prod, "alt")
-                        if prod_property:
-                            print(prod_property)
-                            product_image_list.append(prod_property)
-
-                if len(product_image_list) > 0:
-                    product_dict.update({"ProductImages": product_image_list})
-
-            # Get Attachments (Max. 5)
-            if self.browser.get_element_count(f"article.slds-card:has-text('Attachments'):visible >> span.slds-file__text") > 0:
-                attachment_list = []
-                attachment_images = self.browser.get_elements(f"article.slds-card:has-text('Attachments'):visible >> span.slds-file__text")
-                if attachment_images:
-                    for prod in attachment_images:
-                        prod_property = self.browser.get_property(prod, "title")
-                        if prod_property:
-                            print(prod_property)
-                            attachment_list.append(prod_property)
-
-                if len(attachment_list) > 0:
-                    product_dict.update({"Attachments": attachment_list})
-
-            self.browser.click(f"li.oneConsoleTabItem:has-text('{product['Name']}'):visible >> div.close")
-
-            result_dict.update({f"Product_{product['External_ID__c']}": product_dict})
+        for media in product_media:
+            media_key = PRODUCT_MEDIA_GROUPS.get(str(media["ElectronicMediaGroup"]["DeveloperName"]).lower())
+            title = content_titles.get(media["ElectronicMediaId"])
+            if not media_key or not title:
+                continue
+
+            external_id = media["Product"]["External_ID__c"]
+            product_dict = result_dict.setdefault(f"Product_{external_id}", {"External_ID__c": external_id})
+            product_dict.setdefault(media_key, []).append(title)
 
         # Save dict to file
         if not os.path.exists("cms_data"):
@@ -320,7 +496,7 @@ class QbrixCMS(BaseLibrary):
     def reassign_product_media_files(self):
 
         """
-        Assigns Media Files stored in Salesforce CMS to the relevant Products in the target org.
+        Assigns Media Files stored in Salesforce CMS to the relevant Products in the target org. ProductMedia records are created in batches, skipping media which is already assigned and respecting the maximum number of images and attachments per product.
         """
 
         # Check for default file
@@ -332,189 +508,95 @@ class QbrixCMS(BaseLibrary):
         with open("cms_data/product_images.json", "r") as cms_file:
             product_dict = json.load(cms_file)
 
-        if product_dict:
+        if not product_dict:
+            return
+
+        sf = self.cumulusci.sf
 
-            # Go to Admin Console
-            self.shared.go_to_app("Commerce - Admin")
+        # Look up Products, Media Groups and CMS content in bulk
+        products = {}
+        for record in self._query_in(sf, "SELECT Id, External_ID__c FROM Product2 WHERE External_ID__c IN ({})", [product["External_ID__c"] for product in product_dict.values()]):
+            products[record["External_ID__c"]] = record["Id"]
 
-            # Setup Selectors
-            media_tab_selector = "div.uiTabBar >> span.title:text-is('Media')"
+        media_groups = {}
+        for record in sf.query_all("SELECT Id, DeveloperName FROM ElectronicMediaGroup")["records"]:
+            media_key = PRODUCT_MEDIA_GROUPS.get(str(record["DeveloperName"]).lower())
+            if media_key:
+                media_groups[media_key] = record["Id"]
 
-            # Process Product Records
-            for product in dict(product_dict).items():
+        titles = set()
+        for product in product_dict.values():
+            for media_key in PRODUCT_MEDIA_LIMITS:
+                titles.update(product.get(media_key, []))
 
-                results = self.salesforceapi.soql_query(f"SELECT Id, External_ID__c, Name from Product2 WHERE External_ID__c = '{product[1]['External_ID__c']}' LIMIT 1")
+        content_ids = {}
+        for record in self._query_in(sf, "SELECT Id, Name FROM ManagedContent WHERE Name IN ({})", list(titles)):
+            content_ids.setdefault(record["Name"], record["Id"])
 
-                if results["totalSize"] == 0:
-                    print(f"No Products found for the External ID Provided {product[1]['External_ID__c']}. Skipping...")
+        # Get the media already assigned to the products
+        existing_media = {}
+        for record in self._query_in(sf, "SELECT ProductId, ElectronicMediaId, ElectronicMediaGroupId FROM ProductMedia WHERE ProductId IN ({})", list(products.values())):
+            existing_media.setdefault((record["ProductId"], record["ElectronicMediaGroupId"]), set()).add(record["ElectronicMediaId"])
+
+        # Build the new ProductMedia records
+        new_records = []
+        for product in product_dict.values():
+
+            product_id = products.get(product["External_ID__c"])
+            if not product_id:
+                print(f"No Products found for the External ID Provided {product['External_ID__c']}. Skipping...")
+                continue
+
+            for media_key, max_count in PRODUCT_MEDIA_LIMITS.items():
+                if media_key not in product:
                     continue
 
-                try:
-                    # Go To Record Page for Product and select Media tab
-                    self.browser.go_to(f"{self.cumulusci.org.instance_url}/lightning/r/Product2/{results['records'][0]['Id']}/view", timeout='30s')
-                    self.browser.wait_for_elements_state(media_tab_selector, ElementState.visible, timeout="10s")
-                    self.browser.click(media_tab_selector)
-                    sleep(8)
-                except TimeoutError:
-                    print(f"Unable to access the Media tab for the current Product record with Id ({results['records'][0]['Id']}). Skipping...")
+                group_id = media_groups.get(media_key)
+                if not group_id:
+                    print(f"No Electronic Media Group found for {media_key}. Skipping...")
                     continue
-                except Exception as e:
-                    raise e
-
-                # Process Product Detail Images
-                if "ProductDetailImages" in dict(product[1]).keys() and self.browser.get_element_count(f"article.slds-card:has-text('Product Detail Images'):visible >> img.fileCardImage:visible") < 8:
-
-                    for product_detail_image in list(product[1]["ProductDetailImages"]):
-
-                        # Check Max. Number of Product Detail Images has not been reached
-                        if self.browser.get_element_count(f"article.slds-card:has-text('Product Detail Images'):visible >> img.fileCardImage:visible") == 8:
-                            print("The maximum number of images have already been assigned to the Product. Skipping...")
-                            continue
-
-                        # Check that CMS content has not already been assigned
-                        skip = False
-                        if self.browser.get_element_count(f"article.slds-card:has-text('Product Detail Images'):visible >> img.fileCardImage:visible") > 0:
-                            product_detail_images = self.browser.get_elements(f"article.slds-card:has-text('Product Detail Images'):visible >> img.fileCardImage:visible")
-                            if product_detail_images:
-                                for prod in product_detail_images:
-                                    prod_property = self.browser.get_property(prod, "alt")
-                                    print(f"Found alt text: {prod_property}")
-                                    if prod_property:
-                                        if prod_property in list(product[1]["ProductDetailImages"]):
-                                            print("Skipping duplicate...")
-                                            skip = True
-                        if skip:
-                            continue
-
-                        # Assign New Image
-
-                        self.browser.click("article.slds-card:has-text('Product Detail Images'):visible >> :nth-match(button.slds-button:text-is('Add Image'), 1)")
-                        self.browser.wait_for_elements_state("sfdc_cms-content-uploader-header.slds-col:visible >> input.slds-input", ElementState.visible, timeout="10s")
-                        self.browser.fill_text("sfdc_cms-content-uploader-header.slds-col:visible >> input.slds-input", product_detail_image)
-
-                        # Handle Search Results
-                        try:
-                            sleep(2)
-                            search_results = self.browser.get_elements(f"tr.slds-hint-parent:has-text('{product_detail_image}'):visible")
-                            if len(search_results) == 0:
-                                self.browser.click(f"button.slds-button:text-is('Cancel')")
-                                continue
-                            if len(search_results) > 0:
-                                self.browser.click("tr:has(span:text-matches('^{}$')) >> th >> span.slds-checkbox_faux".format(product_detail_image))
-                                self.browser.click(f"button.slds-button:text-is('Save')")
-                                self.browser.wait_for_elements_state(media_tab_selector, ElementState.visible, timeout="15s")
-                                self.browser.click(media_tab_selector)
-                        except TimeoutError:
-                            print("Unable to find any matches for search results. Skipping...")
-                            self.browser.click(f"button.slds-button:text-is('Cancel')")
-                            continue
-                else:
-                    print("The maximum number of images have already been assigned to the Product or there are no Product Detail Images to process. Skipping...")
-
-                # Process Product List Image
-
-                if "ProductImages" in dict(product[1]).keys() and self.browser.get_element_count(f"article.slds-card:has-text('Product List Image'):visible >> img.fileCardImage:visible") < 1:
-
-                    for product_image in list(product[1]["ProductImages"]):
-
-                        # Check Max. Number of Product List Images has not been reached
-                        if self.browser.get_element_count(f"article.slds-card:has-text('Product List Image'):visible >> img.fileCardImage:visible") == 1:
-                            print("The maximum number of images have already been assigned to the Product. Skipping...")
-                            continue
-
-                        # Check that CMS content has not already been assigned
-                        skip = False
-                        if self.browser.get_element_count(f"article.slds-card:has-text('Product List Image'):visible >> img.fileCardImage:visible") > 0:
-                            product_images = self.browser.get_elements(f"article.slds-card:has-text('Product List Image'):visible >> img.fileCardImage:visible")
-                            if product_images:
-                                for prod in product_images:
-                                    prod_property = self.browser.get_property(prod, "alt")
-                                    print(f"Found alt text: {prod_property}")
-                                    if prod_property:
-                                        if prod_property in list(product[1]["ProductImages"]):
-                                            print("Skipping duplicate...")
-                                            skip = True
-                        if skip:
-                            continue
-
-                        # Assign New Image
-
-                        self.browser.click("article.slds-card:has-text('Product List Image'):visible >> :nth-match(button.slds-button:text-is('Add Image'), 1)")
-                        self.browser.wait_for_elements_state("sfdc_cms-content-uploader-header.slds-col:visible >> input.slds-input", ElementState.visible, timeout="10s")
-                        self.browser.fill_text("sfdc_cms-content-uploader-header.slds-col:visible >> input.slds-input", product_image)
-
-                        # Handle Search Results
-                        try:
-                            sleep(2)
-                            search_results = self.browser.get_elements(f"tr.slds-hint-parent:has-text('{product_image}'):visible")
-                            if len(search_results) == 0:
-                                self.browser.click(f"button.slds-button:text-is('Cancel')")
-                                continue
-                            if len(search_results) > 0:
-                                self.browser.click("tr:has(span:text-matches('^{}$')) >> td >> span.slds-radio".format(product_image))
-                                self.browser.click(f"button.slds-button:text-is('Save')")
-                                self.browser.wait_for_elements_state(media_tab_selector, ElementState.visible, timeout="15s")
-                                self.browser.click(media_tab_selector)
-                        except TimeoutError:
-                            print("Unable to find any matches for search results. Skipping...")
-                            self.browser.click(f"button.slds-button:text-is('Cancel')")
-                            continue
-                else:
-                    print("The maximum number of images have already been assigned to the Product or there are no Product List Images to process. Skipping...")
-
-                # Process Attachments
-
-                if "Attachments" in dict(product[1]).keys() and self.browser.get_element_count(f"article.slds-card:has-text('Attachments'):visible >> span.slds-file__text") < 5:
-
-                    for product_attachment in list(product[1]["Attachments"]):
-
-                        # Check Max. Number of Attachments has not been reached
-                        if self.browser.get_element_count(f"article.slds-card:has-text('Attachments'):visible >> span.slds-file__text") == 5:
-                            print("The maximum number of attachments have already been assigned to the Product. Skipping...")
-                            continue
-
-                        # Check that CMS content has not already been assigned
-                        skip = False
-                        if self.browser.get_element_count(f"article.slds-card:has-text('Attachments'):visible >> span.slds-file__text") > 0:
-                            product_attachments = self.browser.get_elements(f"article.slds-card:has-text('Attachments'):visible >> span.slds-file__text")
-                            if product_attachments:
-                                for prod in product_attachments:
-                                    prod_property = self.browser.get_property(prod, "title")
-                                    print(f"Found title text: {prod_property}")
-                                    if prod_property:
-                                        if prod_property in list(product[1]["Attachments"]):
-                                            print("Skipping duplicate...")
-                                            skip = True
-                        if skip:
-                            continue
-
-                        # Assign New Attachment
-
-                        self.browser.click("article.slds-card:has-text('Attachments'):visible >> :nth-match(button.slds-button:text-is('Add Attachment'), 1)")
-                        self.browser.wait_for_elements_state("sfdc_cms-content-uploader-header.slds-col:visible >> input.slds-input", ElementState.visible, timeout="10s")
-                        self.browser.fill_text("sfdc_cms-content-uploader-header.slds-col:visible >> input.slds-input", product_attachment)
-
-                        # Handle Search Results
-                        try:
-                            sleep(2)
-                            search_results = self.browser.get_elements(f"tr.slds-hint-parent:has-text('{product_attachment}'):visible")
-                            if len(search_results) == 0:
-                                self.browser.click(f"button.slds-button:text-is('Cancel')")
-                                continue
-                            if len(search_results) > 0:
-                                self.browser.click("tr:has(span:text-matches('^{}$')) >> th >> span.slds-checkbox_faux".format(product_attachment))
-                                self.browser.click(f"button.slds-button:text-is('Save')")
-                                self.browser.wait_for_elements_state(media_tab_selector, ElementState.visible, timeout="15s")
-                                self.browser.click(media_tab_selector)
-                        except TimeoutError:
-                            print("Unable to find any matches for search results. Skipping...")
-                            self.browser.click(f"button.slds-button:text-is('Cancel')")
-                            continue
+
+                assigned = existing_media.setdefault((product_id, group_id), set())
+                for title in product[media_key]:
+                    content_id = content_ids.get(title)
+                    if not content_id:
+                        print(f"Unable to find any CMS content named {title}. Skipping...")
+                        continue
+                    if content_id in assigned:
+                        print("Skipping duplicate...")
+                        continue
+                    if len(assigned) >= max_count:
+                        print(f"The maximum number of {media_key} have already been assigned to the Product {product['External_ID__c']}. Skipping...")
+                        break
+
+                    assigned.add(content_id)
+                    new_records.append({
+                        "attributes": {"type": "ProductMedia"},
+                        "ProductId": product_id,
+                        "ElectronicMediaGroupId": group_id,
+                        "ElectronicMediaId": content_id
+                    })
+
+        # Insert the records in batches
+        created = 0
+        for i in range(0, len(new_records), PRODUCT_MEDIA_BATCH_SIZE):
+            batch = new_records[i:i + PRODUCT_MEDIA_BATCH_SIZE]
+            results = sf.restful("composite/sobjects", method="POST", data=json.dumps({"allOrNone": False, "records": batch}))
+            for record, result in zip(batch, results):
+                if result.get("success"):
+                    created += 1
                 else:
-                    print("The maximum number of attachments have already been assigned to the Product or there are no Product Attachments to process. Skipping...")
+                    print(f"Unable to assign media {record['ElectronicMediaId']} to Product {record['ProductId']}. Error details: {result.get('errors')}")
 
-                # Close Tab
-                try:
-                    self.browser.click(f"li.oneConsoleTabItem:has-text('{results['records'][0]['Name']}'):visible >> div.close")
-                except:
-                    continue
+        print(f"Assigned {created} media file(s) to {len(products)} product(s)")
+
+    def _query_in(self, sf, soql, values):
+        """
+        Runs a query with an IN clause in batches, so long lists of values do not exceed the SOQL length limit
+        """
+        values = sorted(set(v for v in values if v))
+        records = []
+        for i in range(0, len(values), PRODUCT_MEDIA_BATCH_SIZE):
+            in_clause = ",".join("'{}'".format(str(v).replace("\\", "\\\\").replace("'", "\\'")) for v in values[i:i + PRODUCT_MEDIA_BATCH_SIZE])
+            records.extend(sf.query_all(soql.format(in_clause))["records"])
+        return records
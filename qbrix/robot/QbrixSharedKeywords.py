@@ -1,12 +1,16 @@
 import json
 import re
+import time
 from time import sleep
 from datetime import datetime
 from typing import Optional
-from Browser import ElementState, SelectAttribute
+from Browser import ElementState, PageLoadStates, SelectAttribute
 from cumulusci.robotframework.base_library import BaseLibrary
 from cumulusci.robotframework.SalesforceAPI import SalesforceAPI
 
+# Lightning can add its loading spinner shortly after a click or navigation, so allow this long for one to appear
+PAGE_READY_SPINNER_GRACE_SECONDS = 2
+PAGE_SPINNER_SELECTOR = ".slds-spinner_container:visible, .slds-spinner:visible, .loadingSpinner:visible"
 
 class QbrixSharedKeywords(BaseLibrary):
 
@@ -37,7 +41,7 @@ class QbrixSharedKeywords(BaseLibrary):
 
     def disable_mfa(self):
         self.browser.go_to(f"{self.cumulusci.org.instance_url}/lightning/setup/SecuritySession/home", timeout="90s")
-        sleep(2)
+        self.wait_for_page_ready(ready_selector="iframe >> nth=0")
         if "checked" in self.browser.get_element_states(f"{self.iframe_handler()} td:has(label:text-is('Require identity verification during multi-factor authentication (MFA) registration')) >> input"):
             self.browser.click(f"{self.iframe_handler()} td:has(label:text-is('Require identity verification during multi-factor authentication (MFA) registration')) >> input")
         existing_list = self.browser.get_select_options(f"{self.iframe_handler()} #duel_select_1")
@@ -47,7 +51,7 @@ class QbrixSharedKeywords(BaseLibrary):
             self.browser.click(f"{self.iframe_handler()} div.duelingListBox >> img.leftArrowIcon")  
 
         self.browser.click(f"{self.iframe_handler()} input.btn:has-text('Save')")
-        sleep(2)
+        self.wait_for_network_idle()
 
 
     def go_to_app(self, app_name):
@@ -75,17 +79,16 @@ class QbrixSharedKeywords(BaseLibrary):
         """
         try:
             self.go_to_setup_admin_page("OrgWideEmailAddresses/home")
-            sleep(3)
             iframe_handler = self.iframe_handler()
             self.browser.wait_for_elements_state(f"{iframe_handler} h2:text-is('Organization-Wide Email Addresses for User Selection and Default No-Reply Use')", ElementState.visible, '15s')
             if self.browser.get_element_count(f"{iframe_handler} td:has-text('{org_wide_email_address}')") == 0:
                 self.browser.click(f"{iframe_handler} div.pbHeader >> input.btn:text-is('Add')")
-                sleep(3)
+                self.wait_for_selector(f"{iframe_handler} tr:has-text('Display Name') >> input")
                 self.browser.fill_text(f"{iframe_handler} tr:has-text('Display Name') >> input", "Default Email")
                 self.browser.fill_text(f"{iframe_handler} tr:has-text('Email Address') >> input", org_wide_email_address)
                 self.browser.select_options_by(f"{iframe_handler} tr:has-text('Purpose') >> select", SelectAttribute.text, "User Selection and Default No-Reply Address")
                 self.browser.click(f"{iframe_handler} :nth-match(.btn:text-is('Save'), 1)")
-                sleep(2)
+                self.wait_for_page_ready()
         except Exception as e:
             self.browser.take_screenshot()
             raise e
@@ -95,7 +98,7 @@ class QbrixSharedKeywords(BaseLibrary):
         Browses to a lightning setup URL, provide everything after lightning/setup/ in the URL
 
         :param setup_page_url: Requires the section of the URL Path which comes after lightning/setup
-        :param sleep_length: (Optional) Set the length of time (in seconds) which the robot will wait for the page to load. Defaults to 2 seconds.
+        :param sleep_length: (Optional) Timeout (in seconds) for the page to load. This is the maximum time the robot waits; it moves on as soon as the page is ready. Values below 30 seconds are raised to 30 seconds. Defaults to 2 seconds.
         """
 
         # Handle empty URL
@@ -129,12 +132,118 @@ class QbrixSharedKeywords(BaseLibrary):
                         continue
 
             # Allow time for page load to complete
-            sleep(sleep_length)
+            self.wait_for_page_ready(max(int(sleep_length), 30))
             
         except Exception as e:
             self.browser.take_screenshot()
             raise e
 
+    def wait_for_page_ready(self, timeout: Optional[int] = 30, ready_selector: Optional[str] = None):
+        """
+        Waits for the current page to finish loading and for any Lightning spinners to disappear, instead of
+        sleeping for a fixed time. Right after a click the spinner may not have appeared yet, so the robot first waits
+        for ready_selector to be visible, or when none is given, allows a couple of seconds for a spinner to appear.
+
+        :param timeout: (Optional) Maximum time (in seconds) to wait. The robot carries on when this is reached. Defaults to 30 seconds.
+        :param ready_selector: (Optional) Selector for an element which is visible once the page has loaded
+        :return: The number of seconds spent waiting
+        """
+        started = time.monotonic()
+        deadline = started + float(timeout)
+
+        try:
+            self.browser.wait_for_load_state(timeout=f"{float(timeout)}s")
+        except Exception:
+            pass
+
+        if ready_selector:
+            try:
+                self.browser.wait_for_elements_state(ready_selector, ElementState.visible, f"{max(0.0, deadline - time.monotonic())}s")
+            except Exception:
+                pass
+        else:
+            grace_deadline = min(deadline, time.monotonic() + PAGE_READY_SPINNER_GRACE_SECONDS)
+            while time.monotonic() < grace_deadline and self.browser.get_element_count(PAGE_SPINNER_SELECTOR) == 0:
+                sleep(0.25)
+
+        while time.monotonic() < deadline:
+            if self.browser.get_element_count(PAGE_SPINNER_SELECTOR) == 0:
+                break
+            sleep(0.25)
+
+        return round(time.monotonic() - started, 2)
+
+    def wait_for_selector(self, selector: str, state: Optional[str] = "visible", timeout: Optional[int] = 30, required: Optional[bool] = True):
+        """
+        Waits for an element to reach the given state, carrying on as soon as it does.
+
+        :param selector: Selector for the element
+        :param state: (Optional) Element state to wait for, for example visible, hidden, attached, detached, enabled or checked. Defaults to visible
+        :param timeout: (Optional) Maximum time (in seconds) to wait. Defaults to 30 seconds.
+        :param required: (Optional) When True an error is raised if the element does not reach the state in time, otherwise the robot carries on. Defaults to True
+        :return: The number of seconds spent waiting, or None if the element did not reach the state in time
+        """
+        started = time.monotonic()
+        try:
+            self.browser.wait_for_elements_state(selector, getattr(ElementState, state), f"{timeout}s")
+        except Exception:
+            if required:
+                raise
+            print(f"Gave up waiting for {selector} to be {state} after {round(time.monotonic() - started, 2)} seconds")
+            return None
+
+        return self._report_wait(f"{selector} to be {state}", started)
+
+    def wait_for_network_idle(self, timeout: Optional[int] = 10):
+        """
+        Waits for the page to stop making network requests. Lightning pages keep some connections open, so the robot carries on when the timeout is reached.
+
+        :param timeout: (Optional) Maximum time (in seconds) to wait. Defaults to 10 seconds.
+        :return: The number of seconds spent waiting
+        """
+        started = time.monotonic()
+        try:
+            self.browser.wait_for_load_state(PageLoadStates.networkidle, f"{timeout}s")
+        except Exception:
+            pass
+
+        return self._report_wait("network idle", started)
+
+    def wait_for_record(self, soql: str, timeout: Optional[int] = 60, interval: Optional[float] = 1):
+        """
+        Runs a SOQL query until it returns at least one record, for example to wait for a setup change to be saved.
+
+        :param soql: The SOQL query to run
+        :param timeout: (Optional) Maximum time (in seconds) to wait. Defaults to 60 seconds.
+        :param interval: (Optional) Time (in seconds) between queries. Defaults to 1 second.
+        :return: The first record returned by the query
+        """
+        started = time.monotonic()
+        results = self._wait_until(lambda: self.salesforceapi.soql_query(soql), timeout, interval, lambda r: r["totalSize"] > 0)
+        if results is None:
+            raise Exception(f"No record found after {timeout} seconds for query: {soql}")
+
+        self._report_wait(f"record: {soql}", started)
+        return results["records"][0] if results["records"] else None
+
+    def _wait_until(self, check, timeout, interval=0.25, is_done=bool):
+        """
+        Calls check until is_done returns True for its result, returning that result, or None if the timeout is reached
+        """
+        deadline = time.monotonic() + float(timeout)
+        while True:
+            result = check()
+            if is_done(result):
+                return result
+            if time.monotonic() >= deadline:
+                return None
+            sleep(interval)
+
+    def _report_wait(self, description, started):
+        elapsed = round(time.monotonic() - started, 2)
+        print(f"Waited {elapsed} seconds for {description}")
+        return elapsed
+
     def iframe_handler(self):
 
         """
@@ -142,17 +251,8 @@ class QbrixSharedKeywords(BaseLibrary):
         :return:
         """
 
-        sleep(2)
-
-        if self.browser.get_element_count("iframe") == 0:
-            retries = 0
-            while retries < 4:
-                retries += 1
-                sleep(2)
-                if self.browser.get_element_count("iframe") == 0 and retries == 3:
-                    return ""
-                if self.browser.get_element_count("iframe") > 0:
-                    self.iframe_handler()
+        if self._wait_until(lambda: self.browser.get_element_count("iframe") > 0, 8) is None:
+            return ""
 
         # Handles Console Layouts and Setup Pages where guidance prompts have opened
         if self.browser.get_element_count("div.mainContentMark") == 1:
@@ -184,13 +284,13 @@ class QbrixSharedKeywords(BaseLibrary):
         if visible and new_state.lower() == "on":
             toggle_switch = self.browser.get_element("label:has-text('Off')")
             self.browser.click(toggle_switch)
-            sleep(1)
+            self.wait_for_selector("label:has-text('On')", timeout=10, required=False)
         if not visible and new_state.lower() == "off":
             visible = "visible" in self.browser.get_element_states("label:has-text('On')")
             if visible:
                 toggle_switch = self.browser.get_element("label:has-text('On')")
                 self.browser.click(toggle_switch)
-                sleep(2)
+                self.wait_for_selector("label:has-text('Off')", timeout=10, required=False)
 
     def click_button_with_text(self, button_text, uses_iframe: Optional[bool] = False, sleep_length: Optional[int] = 2):
         """
@@ -199,7 +299,7 @@ class QbrixSharedKeywords(BaseLibrary):
 
         :param button_text: Exact text for the button you want to click
         :param uses_iframe: Set to True to add iframe support to the button selector
-        :param sleep_length: (Optional) Set the length of time (in seconds) which the robot will wait for the page to load after button is clicked. Defaults to 2 seconds.
+        :param sleep_length: (Optional) Timeout (in seconds) for the page to load after the button is clicked. This is the maximum time the robot waits; it moves on as soon as the page is ready. Values below 30 seconds are raised to 30 seconds. Defaults to 2 seconds.
         """
 
         if button_text is None:
@@ -214,7 +314,7 @@ class QbrixSharedKeywords(BaseLibrary):
         button_visible = "visible" in self.browser.get_element_states(button_selector)
         if button_visible:
             self.browser.click(button_selector)
-            sleep(sleep_length)
+            self.wait_for_page_ready(max(int(sleep_length), 30))
 
     def click_button_in_frame_with_text(self, button_text: str):
         """
@@ -283,16 +383,15 @@ class QbrixSharedKeywords(BaseLibrary):
 
         self.go_to_setup_admin_page("LiveChatButtonSettings/home")
         self.browser.click(f"iframe >>> a:text-is('{button_name}')")
-        sleep(2)
+        self.wait_for_selector("iframe >>> .btn:has-text('Edit')")
         self.browser.click("iframe >>> .btn:has-text('Edit')")
-        sleep(2)
+        self.wait_for_selector("iframe >>> tr:has-text('Routing Type') >> select")
         self.browser.select_options_by("iframe >>> tr:has-text('Routing Type') >> select", SelectAttribute.text,
                                        "Omni-Channel")
-        sleep(2)
+        self.wait_for_selector("iframe >>> tr:has-text('Queue') >> span.lookupInput >> input")
         self.browser.fill_text("iframe >>> tr:has-text('Queue') >> span.lookupInput >> input", f"{queue_name}")
-        sleep(2)
         self.browser.click("iframe >>> :nth-match(.btn:has-text('Save'), 1)")
-        sleep(2)
+        self.wait_for_page_ready()
 
     def create_chat_button_and_automated_invitations(self):
         """
@@ -306,78 +405,73 @@ class QbrixSharedKeywords(BaseLibrary):
         :param buttonName: Name of the Chat Button
         :param buttonAPIName: API Name for the Chat Button
         """
-        sleep(3)
         if buttonName is None:
             raise Exception("buttonName must be specified")
         if buttonAPIName is None:
             raise Exception("buttonAPIName must be specified")
         self.go_to_setup_admin_page("LiveChatButtonSettings/home")
         self.browser.wait_for_elements_state("iframe >>> h1:has-text('Chat Buttons')", ElementState.visible, '60s')
-        sleep(10)
+        self.wait_for_page_ready()
         visible = "visible" in self.browser.get_element_states(
             f"iframe >>> .listRelatedObject:has-text('{buttonName}')")
         if not visible:
             self.click_input_button_in_iframe_with_text('New')
             self.browser.wait_for_elements_state("iframe >>> h3:has-text('Basic Information')", ElementState.visible,
                                                  '45')
-            sleep(5)
+            self.wait_for_selector("iframe >>> select[name='j_id0:theForm:thePageBlock:editDataSection:editTypeItem:editType']", "enabled")
             self.browser.select_options_by(
                 "iframe >>> select[name='j_id0:theForm:thePageBlock:editDataSection:editTypeItem:editType']",
                 SelectAttribute.text, "Chat Button")
-            sleep(1)
             self.browser.fill_text(
                 "iframe >>> input[name='j_id0:theForm:thePageBlock:editDataSection:nameSection:editMasterLabel']",
                 buttonName)
             self.browser.fill_text(
                 "iframe >>> input[name='j_id0:theForm:thePageBlock:editDataSection:developerNameSection:editDeveloperName']",
                 '')
-            sleep(1)
             self.browser.fill_text(
                 "iframe >>> input[name='j_id0:theForm:thePageBlock:editDataSection:developerNameSection:editDeveloperName']",
                 buttonAPIName)
-            sleep(2)
             if not "checked" in self.browser.get_element_states(
                     "iframe >>> id=j_id0:theForm:thePageBlock:editDataSection:hasChasitorIdleTimeout:hasChasitorIdleTimeout"):
                 self.browser.click(
                     "iframe >>> id=j_id0:theForm:thePageBlock:editDataSection:hasChasitorIdleTimeout:hasChasitorIdleTimeout")
-                sleep(1)
                 # Customer Timeout
+                self.wait_for_selector("iframe >>> id=j_id0:theForm:thePageBlock:editDataSection:j_id76:editChasitorIdleTimeout", "enabled")
                 self.browser.fill_text(
                     "iframe >>> id=j_id0:theForm:thePageBlock:editDataSection:j_id76:editChasitorIdleTimeout", "300")
-                sleep(1)
                 # Customer Timeout Warning
                 self.browser.fill_text(
                     "iframe >>> id=j_id0:theForm:thePageBlock:editDataSection:j_id79:editChasitorIdleTimeoutWarning",
                     "250")
-                sleep(1)
             self.browser.select_options_by(
                 "iframe >>> id=j_id0:theForm:thePageBlock:editRoutingSection:rountingTypeSection:editRoutingType",
                 SelectAttribute.text, "Omni-Channel")
-            sleep(2)
+            self.wait_for_selector("iframe >>> id=j_id0:theForm:thePageBlock:editRoutingSection:queueSection:editQueue_lkwgt")
+
+            # Queue lookup opens in a popup window
+            page_count = len(self.browser.get_page_ids())
             self.browser.click(
                 "iframe >>> id=j_id0:theForm:thePageBlock:editRoutingSection:queueSection:editQueue_lkwgt")
-            sleep(5)
+            self._wait_until(lambda: len(self.browser.get_page_ids()) > page_count, 30)
             mainpage = self.browser.switch_page('NEW')
-            sleep(2)
+            self.wait_for_selector(":nth-match(frame,1) >>> xpath=//*[@id=\"lksrch\"]")
             self.browser.fill_text(":nth-match(frame,1) >>> xpath=//*[@id=\"lksrch\"]", "Chat")
-            sleep(1)
             button_to_click = self.browser.get_element(f":nth-match(frame,1) >>> input:has-text('Go!')")
             self.browser.click(button_to_click)
-            sleep(6)
-            search_header = self.browser.get_element(
-                ":nth-match(frame,2) >>> xpath=//*[@id=\"new\"]/div/div[3]/div/div[2]/table/tbody/tr[2]/th")
+            search_result = ":nth-match(frame,2) >>> xpath=//*[@id=\"new\"]/div/div[3]/div/div[2]/table/tbody/tr[2]/th"
+            self.wait_for_selector(search_result)
+            search_header = self.browser.get_element(search_result)
             self.browser.click(search_header)
-            sleep(5)
+            self._wait_until(lambda: len(self.browser.get_page_ids()) <= page_count, 30)
             self.browser.switch_page(mainpage)
             if "checked" not in self.browser.get_element_states(
                     "iframe >>> id=j_id0:theForm:thePageBlock:editRoutingSection:j_id192:editHasQueue"):
                 self.browser.click("iframe >>> id=j_id0:theForm:thePageBlock:editRoutingSection:j_id192:editHasQueue")
-                sleep(1)
+                self.wait_for_selector("iframe >>> id=j_id0:theForm:thePageBlock:editRoutingSection:j_id195:editPerAgentQueueLength", "enabled")
                 self.browser.fill_text(
                     "iframe >>> id=j_id0:theForm:thePageBlock:editRoutingSection:j_id195:editPerAgentQueueLength", "5")
-                sleep(1)
             self.browser.click("iframe >>> :nth-match(.btn[value='Save'], 1)")
-            sleep(8)
+            self.wait_for_record(f"SELECT Id FROM LiveChatButton WHERE DeveloperName = '{buttonAPIName}'")
 
     def find_profileid_by_name(self, profilename: str):
         """
@@ -501,27 +595,45 @@ class QbrixSharedKeywords(BaseLibrary):
 
     def compile_all_apex(self, waittime="600"):
         """
-        Does an Apex Recompile of all Classes
-        :param waittime: Max wait time for the compile to run. Default is 2 minutes. 
+        Does an Apex Recompile of all Classes. The compile is skipped if every Apex Class is already valid, otherwise the robot waits until the compile has completed or all classes are valid.
+        :param waittime: Max wait time (in seconds) for the compile to run. Default is 600 seconds.
+        :return: The number of seconds spent waiting for the compile
         """
+        if self._count_invalid_apex_classes() == 0:
+            print("All Apex Classes are valid. Skipping compile.")
+            return 0
+
         self.browser.go_to(f"{self.cumulusci.org.instance_url}/lightning/setup/ApexClasses/home")
-        sleep(30)
-        self.browser.click(f"iframe >>> id=all_classes_page:theTemplate:messagesForm:compileAll")
-        sleep(30)
-        
-        sleep_countdown = 600
-        itcnt=0
-        while itcnt<sleep_countdown:
-            
-             #we are done
-            visible = "visible" in self.browser.get_element_states("iframe >>> h4:has-text('Compilation Complete')")
-            enabled = "enabled" in self.browser.get_element_states("iframe >>> h4:has-text('Compilation Complete')")
-            if visible and enabled:
-                sleep(20)
+        compile_link = "iframe >>> id=all_classes_page:theTemplate:messagesForm:compileAll"
+        self.browser.wait_for_elements_state(compile_link, ElementState.visible, timeout="60s")
+        self.browser.click(compile_link)
+
+        started = time.monotonic()
+        deadline = started + float(waittime)
+        next_class_check = started + 5
+        complete_header = "iframe >>> h4:has-text('Compilation Complete')"
+
+        while time.monotonic() < deadline:
+            # Compile has finished when the completion message shows or the org reports no invalid classes
+            if self.browser.get_element_count(f"{complete_header}:visible") > 0:
                 break
-            
-            itcnt+=1
-            sleep(30)
+
+            if time.monotonic() >= next_class_check:
+                if self._count_invalid_apex_classes() == 0:
+                    break
+                next_class_check = time.monotonic() + 5
+
+            sleep(0.5)
+        else:
+            raise Exception(f"Apex compile did not complete within {waittime} seconds")
+
+        elapsed = round(time.monotonic() - started, 2)
+        print(f"Apex compile completed in {elapsed} seconds")
+        return elapsed
+
+    def _count_invalid_apex_classes(self):
+        results = self.salesforceapi.soql_query("SELECT COUNT() FROM ApexClass WHERE IsValid = false")
+        return results["totalSize"]
 
     def enable_custom_help_in_user_engagement(self):
         """
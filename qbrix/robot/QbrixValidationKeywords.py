@@ -1,6 +1,7 @@
 import json
 import sys
 import os
+from urllib.parse import quote
 from xml import etree
 
 import pandas as pd
@@ -20,12 +21,20 @@ from qbrix.robot.QbrixSharedKeywords import QbrixSharedKeywords
 
 class QbrixValidationKeywords(BaseLibrary):
 
+    ROBOT_LISTENER_API_VERSION = 3
+
     def __init__(self):
         super().__init__()
+        # the library listens to its own tests so queued rowcount checks are never silently dropped
+        self.ROBOT_LIBRARY_LISTENER = self
         self._browser = None
         self._salesforceapi = None
         self.shared = QbrixSharedKeywords()
         self._validationresults = None
+        self._issandbox = None
+        self._batchrowcounts = False
+        self._pendingrowcounts = []
+        self._rowcountcache = {}
 
     @property
     def browser(self):
@@ -144,6 +153,12 @@ class QbrixValidationKeywords(BaseLibrary):
         :param continueonfail: (Optional) Boolean flag to continue testing or abort
         """
 
+        # When batching is enabled, defer this validation until the row counts have been fetched in bulk
+        if self.__queuerowcount(self.validate_minimal_rowcount, targetobject=targetobject, count=count, filter=filter,
+                                tooling=tooling, continueonfail=continueonfail, datatag=datatag,
+                                targetruntime=targetruntime):
+            return
+
         resulttype = "Data"
         resultname = f'Validate Minimal Count of {targetobject} for {count} rows'
 
@@ -192,6 +207,12 @@ class QbrixValidationKeywords(BaseLibrary):
         :param continueonfail: (Optional) Boolean flag to continue testing or abort
         """
 
+        # When batching is enabled, defer this validation until the row counts have been fetched in bulk
+        if self.__queuerowcount(self.validate_exact_rowcount, targetobject=targetobject, count=count, filter=filter,
+                                tooling=tooling, continueonfail=continueonfail, datatag=datatag,
+                                targetruntime=targetruntime):
+            return
+
         resulttype = "Data"
         resultname = f'Validate Exact Count of {targetobject} for {count} rows'
 
@@ -239,6 +260,12 @@ class QbrixValidationKeywords(BaseLibrary):
         :param continueonfail: (Optional) Boolean flag to continue testing or abort
         """
 
+        # When batching is enabled, defer this validation until the row counts have been fetched in bulk
+        if self.__queuerowcount(self.validate_maximum_rowcount, targetobject=targetobject, count=count, filter=filter,
+                                tooling=tooling, continueonfail=continueonfail, datatag=datatag,
+                                targetruntime=targetruntime):
+            return
+
         resulttype = "Data"
         resultname = f'Validate Maximum Count of {targetobject} for {count} rows'
 
@@ -285,6 +312,12 @@ class QbrixValidationKeywords(BaseLibrary):
         :param tooling: (Optional) Set to True if the target object requires the Tooling API
         :param continueonfail: (Optional) Boolean flag to continue testing or abort
         """
+        # When batching is enabled, defer this validation until the row counts have been fetched in bulk
+        if self.__queuerowcount(self.validate_range_rowcount, targetobject=targetobject, lowercount=lowercount, uppercount=uppercount, filter=filter,
+                                tooling=tooling, continueonfail=continueonfail, datatag=datatag,
+                                targetruntime=targetruntime):
+            return
+
         resulttype = "Data"
         resultname = f'Validate Range Count of {targetobject} between {lowercount} and {uppercount} rows'
 
@@ -340,14 +373,12 @@ class QbrixValidationKeywords(BaseLibrary):
         if targetobject is None or targetobject == "":
             raise Exception("A target object must be specified")
 
-        # default:
-        soql = f"select count(Id) DataCount from {targetobject}"
+        # Counts fetched in bulk by run_batched_rowcount_validations are reused here
+        rowcountkey = (targetobject, filter, bool(tooling))
+        if rowcountkey in self._rowcountcache:
+            return self._rowcountcache[rowcountkey]
 
-        if self.does_not_support_count(targetobject):
-            soql = f"select Id from {targetobject}"
-
-        if filter is not None:
-            soql = f"{soql} where ({filter})"
+        soql = self.__buildcountsoql(targetobject, filter)
 
         self.shared.log_to_file(f"Running::tooling::{tooling}::{soql}")
 
@@ -362,15 +393,126 @@ class QbrixValidationKeywords(BaseLibrary):
         # totalSize
         # done
 
-        # we use the totalsize instead of aggregate count
-        if self.does_not_support_count(targetobject):
+        # count() queries return no records, so totalSize holds the row count
+        if results is not None and "totalSize" in results:
             return int(results["totalSize"])
-        else:
-            if results["totalSize"] == 1:
-                return int(results["records"][0]["DataCount"])
 
         return None
 
+    def start_batched_rowcount_validation(self):
+        """
+        Starts collecting validate_*_rowcount keywords instead of running them straight away. The collected
+        validations are run when Run Batched Rowcount Validations is called within the same test.
+        """
+        self._batchrowcounts = True
+        self._pendingrowcounts = []
+
+    def run_batched_rowcount_validations(self):
+        """
+        Fetches the row counts for all collected validate_*_rowcount keywords using Composite Batch requests
+        (25 queries per call) and then records the result for each validation.
+        """
+        self._batchrowcounts = False
+        pending = self._pendingrowcounts
+        self._pendingrowcounts = []
+
+        if not pending:
+            return
+
+        rowcountkeys = []
+        for keyword, kwargs in pending:
+            rowcountkey = (kwargs["targetobject"], kwargs["filter"], bool(kwargs["tooling"]))
+            if kwargs["targetobject"] and rowcountkey not in rowcountkeys:
+                rowcountkeys.append(rowcountkey)
+
+        try:
+            self.__fetchbatchedrowcounts(rowcountkeys)
+
+            for keyword, kwargs in pending:
+                keyword(**kwargs)
+        finally:
+            self._rowcountcache = {}
+
+    def _end_test(self, data, result):
+        """
+        Fails the test when batched rowcount validations were started but never run
+        """
+        pending = len(self._pendingrowcounts)
+        self._batchrowcounts = False
+        self._pendingrowcounts = []
+        if not pending:
+            return
+
+        result.status = "FAIL"
+        result.message = (f"{result.message}\n\n" if result.message else "") + \
+            f"{pending} batched rowcount validation(s) were started but Run Batched Rowcount Validations was not called."
+
+    def _close(self):
+        if self._pendingrowcounts:
+            print(f"{len(self._pendingrowcounts)} batched rowcount validation(s) were never run", file=sys.stderr)
+
+    def __queuerowcount(self, keyword, **kwargs):
+        """
+        Queues the validation when batched mode is enabled
+        :param keyword: The validation keyword to run once the counts are known
+        :param kwargs: Arguments for the validation keyword
+        :return: True if the validation was queued
+        """
+        if not self._batchrowcounts:
+            return False
+
+        self._pendingrowcounts.append((keyword, kwargs))
+        return True
+
+    def __buildcountsoql(self, targetobject, filter=None):
+        """
+        Builds the SOQL used to count the records for the target object
+        :param targetobject: Target Object
+        :param filter: (Optional) SOQL Filter for the target object
+        :return: SOQL Query
+        """
+
+        # default:
+        soql = f"select count() from {targetobject}"
+
+        if self.does_not_support_count(targetobject):
+            soql = f"select Id from {targetobject}"
+
+        if filter is not None:
+            soql = f"{soql} where ({filter})"
+
+        return soql
+
+    def __fetchbatchedrowcounts(self, rowcountkeys):
+        """
+        Runs the count queries as Composite Batch subrequests and caches the results for find_record_count
+        :param rowcountkeys: List of (targetobject, filter, tooling) tuples
+        """
+        apiversion = self.cumulusci.sf.sf_version
+
+        for i in range(0, len(rowcountkeys), 25):
+            chunk = rowcountkeys[i:i + 25]
+            batchrequests = []
+
+            for targetobject, filter, tooling in chunk:
+                soql = self.__buildcountsoql(targetobject, filter)
+                endpoint = "tooling/query" if tooling else "query"
+                self.shared.log_to_file(f"Batching::tooling::{tooling}::{soql}")
+                batchrequests.append({"method": "GET", "url": f"v{apiversion}/{endpoint}?q={quote(soql)}"})
+
+            response = self.cumulusci.sf.restful(
+                "composite/batch",
+                data=json.dumps({"batchRequests": batchrequests, "haltOnError": False}),
+                method="POST",
+            )
+
+            for rowcountkey, result in zip(chunk, response["results"]):
+                if result["statusCode"] == 200:
+                    self._rowcountcache[rowcountkey] = int(result["result"]["totalSize"])
+                else:
+                    # Left uncached so the validation falls back to a direct query and reports the real error
+                    self.shared.log_to_file(f"Batch Subrequest Failed::{rowcountkey}::{result['result']}")
+
     def does_not_support_count(self, objectname: str):
 
         if objectname.lower() == "standardvalueset":
@@ -573,14 +715,19 @@ class QbrixValidationKeywords(BaseLibrary):
         if targetruntime == "ALL":
             return True
 
-        results = self.cumulusci.sf.query_all(f"SELECT IsSandbox FROM Organization ")
+        # The org type does not change during a run, so only look it up once
+        if self._issandbox is None:
+            results = self.cumulusci.sf.query_all(f"SELECT IsSandbox FROM Organization ")
 
-        if results["totalSize"] == 1:
+            if results["totalSize"] != 1:
+                return False
 
-            if targetruntime == "SCRATCHONLY" and bool(results["records"][0]["IsSandbox"]):
-                return True
+            self._issandbox = bool(results["records"][0]["IsSandbox"])
 
-            if targetruntime == "PRODONLY" and not bool(results["records"][0]["IsSandbox"]):
-                return True
+        if targetruntime == "SCRATCHONLY" and self._issandbox:
+            return True
+
+        if targetruntime == "PRODONLY" and not self._issandbox:
+            return True
 
         return False
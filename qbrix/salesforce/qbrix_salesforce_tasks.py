@@ -1,10 +1,10 @@
-import base64
 import json
 import os
-import pathlib
 import subprocess
+import requests
 import yaml
 from abc import ABC
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 
 import click
@@ -12,13 +12,13 @@ from cumulusci.core.config import ScratchOrgConfig, TaskConfig
 from cumulusci.core.dependencies.dependencies import PackageVersionIdDependency, PackageNamespaceVersionDependency, UnmanagedGitHubRefDependency
 from cumulusci.core.dependencies.resolvers import dependency_filter_ignore_deps, get_static_dependencies
 from cumulusci.core.exceptions import CumulusCIException
-from cumulusci.core.flowrunner import FlowCoordinator
 from cumulusci.tasks.salesforce.update_dependencies import UpdateDependencies
 from cumulusci.tasks.sfdx import SFDXOrgTask
 from cumulusci.core.tasks import BaseTask
 from qbrix.tools.data.qbrix_analytics import AnalyticsManager
 from qbrix.tools.shared.qbrix_cci_tasks import run_cci_flow, run_cci_task
 from qbrix.tools.shared.qbrix_console_utils import init_logger
+from qbrix.tools.shared.qbrix_content_tasks import find_content_document, upload_content_version
 from cumulusci.tasks.salesforce import BaseSalesforceApiTask
 from cumulusci.core.utils import process_list_of_pairs_dict_arg
 from cumulusci.tasks.salesforce.sourcetracking import RetrieveChanges
@@ -30,6 +30,11 @@ from qbrix.tools.utils.qbrix_orgconfig_hydrate import NGOrgConfig
 log = init_logger()
 now = datetime.now()
 
+# Salesforce limits for IN clause batches and sObject Collection inserts
+SOQL_IN_BATCH_SIZE = 200
+COLLECTION_BATCH_SIZE = 200
+UPLOAD_PROGRESS_MIN_BYTES = 10 * 1024 * 1024
+
 
 def salesforce_query(soql, org_config, raw_return=False):
     if soql != "" and org_config is not None:
@@ -65,6 +70,40 @@ def salesforce_query(soql, org_config, raw_return=False):
             return None
 
 
+def get_installed_qbrix(org_config, api_version="57.0"):
+    """
+    Reads the Q Brix Register from the org in a single query.
+
+    Args:
+        org_config (OrgConfig): The target org config
+        api_version (str): Salesforce API version to use. Defaults to 57.0
+
+    Returns:
+        set: Lower case repository URLs of every Q Brix recorded as installed. Empty if the register has not been installed.
+    """
+
+    headers = {"Authorization": f"Bearer {org_config.access_token}"}
+    url = f"{org_config.instance_url}/services/data/v{api_version}/query"
+    params = {"q": "SELECT xDO_Repository_URL__c FROM xDO_Base_QBrix_Register__mdt"}
+
+    installed = set()
+    response = requests.get(url, headers=headers, params=params)
+    if response.status_code == 400:
+        log.info("No Q Brix installed")
+        return installed
+    response.raise_for_status()
+
+    while True:
+        result = response.json()
+        installed.update(str(r["xDO_Repository_URL__c"] or "").lower() for r in result["records"])
+        if result.get("done", True):
+            break
+        response = requests.get(f"{org_config.instance_url}{result['nextRecordsUrl']}", headers=headers)
+        response.raise_for_status()
+
+    return installed
+
+
 def QbrixInstallCheck(qbrix_name, org_config):
     log.info(f"Checking for Qbrix: {qbrix_name}")
     subprocess.run(f"sfdx config:set instanceUrl={org_config.instance_url}", shell=True, capture_output=True)
@@ -438,17 +477,13 @@ class CreateUser(BaseSalesforceApiTask,NGOrgConfig, ABC):
         else:
             try:
                 api = self.sf
-                path = pathlib.Path(path_to_image)
-                photo_id = api.ContentVersion.create(
-                    {
-                        "PathOnClient": path.name,
-                        "Title": path.stem,
-                        "VersionData": base64.b64encode(path.read_bytes()).decode("utf-8"),
-                    }
-                )
 
-                content_version_id = photo_id["id"]
-                content_document_id = api.query(f"SELECT Id, ContentDocumentId FROM ContentVersion WHERE Id = '{content_version_id}'")["records"][0]["ContentDocumentId"]
+                # Reuse the image if the same file has already been uploaded
+                content_document_id = find_content_document(api, path_to_image)
+                if not content_document_id:
+                    photo_id = upload_content_version(api, path_to_image)
+                    content_version_id = photo_id["id"]
+                    content_document_id = api.query(f"SELECT Id, ContentDocumentId FROM ContentVersion WHERE Id = '{content_version_id}'")["records"][0]["ContentDocumentId"]
 
                 api.restful(
                     f"connect/user-profiles/{user_id}/photo",
@@ -813,8 +848,7 @@ class QbrixDeployer(BaseSalesforceApiTask, ABC):
         for name, value in self.project_config.sources.items():
             if 'github' in value and self.qbrix_name in value['github']:
                 if not QbrixInstallCheck(self.qbrix_name, self.org_config):
-                    coordinator = FlowCoordinator(self.project_config)
-                    coordinator.run(f'{self.qbrix_name}:deploy_qbrix')
+                    run_cci_flow(f'{self.qbrix_name}:deploy_qbrix', org_config=self.org_config, project_config=self.project_config)
             else:
                 print("Source name not found in Q Brix")
     
@@ -894,6 +928,10 @@ class UploadFiles(BaseSalesforceApiTask, ABC):
          "exclude_extension": {
             "description": "Exclued the file extension from the title",
             "required": False
+        },
+        "maxparallel": {
+            "description": "Number of files to upload at the same time. Defaults to 4",
+            "required": False
         }
     }
 
@@ -909,6 +947,8 @@ class UploadFiles(BaseSalesforceApiTask, ABC):
         else:
             self.exclude_extension = False
 
+        self.maxparallel = max(1, int(self.options["maxparallel"])) if "maxparallel" in self.options else 4
+
     def create_document_link(self, content_doc_id, entity_id):
         """
         Creates a document link between a ContentDocument and a given Entity
@@ -937,91 +977,165 @@ class UploadFiles(BaseSalesforceApiTask, ABC):
             }
             self.sf.ContentDistribution.create(content_version_data)
 
+    def _soql_list(self, values):
+        return ", ".join("'" + str(v).replace("\\", "\\\\").replace("'", "\\'") + "'" for v in values)
+
+    def find_existing_files(self, filenames):
+        """
+        Finds files which have already been uploaded, matching on PathOnClient or Title, using one query per batch of file names
+
+        Returns:
+            dict: ContentDocumentId for each file name which already exists
+        """
+
+        existing_files = {}
+        for i in range(0, len(filenames), SOQL_IN_BATCH_SIZE):
+            names = filenames[i:i + SOQL_IN_BATCH_SIZE]
+            name_list = self._soql_list(names)
+            result = self.sf.query_all(f"SELECT Id, ContentDocumentId, PathOnClient, Title FROM ContentVersion WHERE PathOnClient IN ({name_list}) OR Title IN ({name_list})")
+            for record in result["records"]:
+                for name in (record["PathOnClient"], record["Title"]):
+                    if name in names and name not in existing_files:
+                        existing_files[name] = record["ContentDocumentId"]
+        return existing_files
+
+    def get_library_id(self):
+        """
+        Returns the Id of the library set in the library option, creating the library if it does not exist
+        """
+
+        workspace_record = self.sf.query(f"SELECT Id, RootContentFolderId FROM ContentWorkspace WHERE Name = {self._soql_list([self.library])} LIMIT 1")
+        if workspace_record['totalSize'] > 0:
+            return workspace_record['records'][0]['Id']
+
+        self.logger.info(f" -> {self.library} was not found. Creating new Library")
+        workspace_record = self.sf.ContentWorkspace.create({
+            'name': self.library
+        })
+        return workspace_record['id'] if workspace_record else None
+
+    def upload_content_version(self, file_path, title):
+        """
+        Uploads a file as a new ContentVersion, streaming it from disk and logging progress for large files
+
+        Returns:
+            str: The new ContentVersion Id
+        """
+
+        filename = os.path.basename(file_path)
+        logged_steps = set()
+
+        def log_progress(bytes_sent, total_bytes):
+            if total_bytes < UPLOAD_PROGRESS_MIN_BYTES:
+                return
+            step = int(bytes_sent * 4 / total_bytes) * 25
+            if step not in logged_steps:
+                logged_steps.add(step)
+                self.logger.info(f" -> {filename}: {step}% of {round(total_bytes / 1048576, 1)} MB sent")
+
+        result = upload_content_version(self.sf, file_path, title, progress_callback=log_progress)
+        self.logger.info(f" -> {filename} checksum: {result['checksum']}")
+        return result["id"]
+
+    def create_document_links(self, links):
+        """
+        Creates any missing ContentDocumentLinks for a list of (ContentDocumentId, LinkedEntityId) pairs using sObject Collections
+        """
+
+        if not links:
+            return
+
+        document_ids = sorted({doc_id for doc_id, _ in links})
+        entity_ids = sorted({entity_id for _, entity_id in links})
+        existing_links = set()
+        for i in range(0, len(document_ids), SOQL_IN_BATCH_SIZE):
+            for j in range(0, len(entity_ids), SOQL_IN_BATCH_SIZE):
+                result = self.sf.query_all(
+                    f"SELECT ContentDocumentId, LinkedEntityId FROM ContentDocumentLink WHERE ContentDocumentId IN ({self._soql_list(document_ids[i:i + SOQL_IN_BATCH_SIZE])}) AND LinkedEntityId IN ({self._soql_list(entity_ids[j:j + SOQL_IN_BATCH_SIZE])})"
+                )
+                existing_links.update((r["ContentDocumentId"], r["LinkedEntityId"]) for r in result["records"])
+
+        new_links = [link for link in dict.fromkeys(links) if link not in existing_links]
+        self.logger.info(f" -> Creating {len(new_links)} Document Link(s). {len(links) - len(new_links)} already exist.")
+
+        for i in range(0, len(new_links), COLLECTION_BATCH_SIZE):
+            records = [{
+                'attributes': {'type': 'ContentDocumentLink'},
+                'ContentDocumentId': doc_id,
+                'LinkedEntityId': entity_id,
+                'Visibility': 'AllUsers'
+            } for doc_id, entity_id in new_links[i:i + COLLECTION_BATCH_SIZE]]
+            results = self.sf.restful("composite/sobjects", method="POST", data=json.dumps({"allOrNone": False, "records": records}))
+            for result in results:
+                if not result.get("success"):
+                    self.logger.error(f" -> Unable to create Document Link: {result.get('errors')}")
+
     def upload_files_to_salesforce(self):
         """
         Uploads all files from the specified directory to the Salesforce and associates them as required.
         """
         self.logger.info("\nStarting File Upload:")
 
-        # Query Salesforce to find the record ID that matches the where clause
-        multi_record = False
-        record_id = None
+        # Query Salesforce to find the record IDs that match the where clause
+        record_ids = []
         if self.where:
-            record = self.sf.query(f"SELECT Id FROM {self.object} WHERE {self.where}")
-            if record['totalSize'] == 0:
+            record = self.sf.query_all(f"SELECT Id FROM {self.object} WHERE {self.where}")
+            record_ids = [r["Id"] for r in record['records'] if r["Id"]]
+            if not record_ids:
                 self.logger.error(f"No record(s) found for {self.object} with the specified where clause '{self.where}'. Skipping File.")
-            elif record['totalSize'] == 1:
-                record_id = record['records'][0]['Id']
-                self.logger.info(f" -> Single Record Located with ID: {record_id}")
-            elif record['totalSize'] > 1:
-                self.logger.info(" -> Multiple Record Association Enabled")
-                multi_record = True
-
-        # Loop through each file in the directory
-        for filename in os.listdir(self.path):
-            # Check File Was not Already Uploaded
-            self.logger.info(f"\nChecking for existing file called {filename}:")
-            content_document_id = None
-            existing_file = self.sf.query(f"SELECT Id, ContentDocumentId FROM ContentVersion WHERE PathOnClient = '{filename}' OR Title = '{filename}' LIMIT 1")
-            if existing_file['totalSize'] > 0:
-                content_document_id = existing_file['records'][0]['ContentDocumentId']
-                self.logger.info(f" -> File already uploaded. Document Id: {content_document_id}")
+            elif len(record_ids) == 1:
+                self.logger.info(f" -> Single Record Located with ID: {record_ids[0]}")
             else:
-                self.logger.info(" -> File was not found in target org")
-
-                # Upload File and create new ContentVersion
-                self.logger.info(f"\nUploading {filename}:")
-                file_path = os.path.join(self.path, filename)
-                with open(file_path, 'rb') as f:
-                    file_contents = f.read()
-
-                # Convert the file contents to base64 encoding
-                base64_file_contents = base64.b64encode(file_contents).decode('utf-8')
-                
-                title=filename
-                if(self.exclude_extension):
-                    filebase=os.path.basename(filename)
-                    title=os.path.splitext(filebase)[0]
-                    
-                
-                    
-
-                content_version_data = {
-                    'Title': title,
-                    'VersionData': base64_file_contents,
-                    'PathOnClient': filename
-                }
+                self.logger.info(" -> Multiple Record Association Enabled")
 
-                content_version = self.sf.ContentVersion.create(content_version_data)
-                content_document_id = self.sf.query(f"SELECT ContentDocumentId FROM ContentVersion WHERE Id = '{content_version['id']}'")['records'][0]['ContentDocumentId']
-
-            # Create Required Relationships
-            self.logger.info(f"\nChecking for creating Document Links")
-            if self.where and record_id and multi_record == False:
-                self.logger.info(f" -> Linking to Record: {record_id}")
-                self.create_document_link(content_document_id, record_id)
-
-            if self.where and multi_record == True and record['records']:
-                for r in record['records']:
-                    if r["Id"]:
-                        self.logger.info(f" -> Linking to Record: {r['Id']}")
-                        self.create_document_link(content_document_id, r["Id"])
-
-            if self.library:
-                workspace_record = self.sf.query(f"SELECT Id, RootContentFolderId FROM ContentWorkspace WHERE Name = '{self.library}' LIMIT 1")
-                if workspace_record['totalSize'] == 0:
-                    self.logger.info(f" -> {self.library} was not found. Creating new Library")
-                    workspace_record = self.sf.ContentWorkspace.create({
-                        'name': self.library
-                    })
-                    if workspace_record and workspace_record['id']:
-                        self.logger.info(f" -> Saving to Library called: {self.library}")
-                        self.create_document_link(content_document_id, workspace_record['id'])
-                else:
-                    self.logger.info(f" -> Saving to Library called: {self.library}")
-                    self.create_document_link(content_document_id, workspace_record['records'][0]['Id'])
+        filenames = sorted(f for f in os.listdir(self.path) if os.path.isfile(os.path.join(self.path, f)))
+        if not filenames:
+            self.logger.info(f" -> No files found in {self.path}")
+            return
 
-            self.logger.info(f" -> Upload Complete!")
+        # Check Files Were not Already Uploaded
+        self.logger.info(f"\nChecking for {len(filenames)} existing file(s):")
+        document_ids = self.find_existing_files(filenames)
+        for filename in document_ids:
+            self.logger.info(f" -> {filename} already uploaded. Document Id: {document_ids[filename]}")
+
+        # Upload New Files
+        files_to_upload = [f for f in filenames if f not in document_ids]
+        if files_to_upload:
+            self.logger.info(f"\nUploading {len(files_to_upload)} file(s):")
+            content_version_ids = {}
+            with ThreadPoolExecutor(max_workers=self.maxparallel) as executor:
+                futures = {}
+                for filename in files_to_upload:
+                    title = os.path.splitext(os.path.basename(filename))[0] if self.exclude_extension else filename
+                    futures[executor.submit(self.upload_content_version, os.path.join(self.path, filename), title)] = filename
+
+                for future in as_completed(futures):
+                    filename = futures[future]
+                    try:
+                        content_version_ids[future.result()] = filename
+                        self.logger.info(f" -> Uploaded {filename}")
+                    except Exception as e:
+                        self.logger.error(f" -> Upload Failed for {filename}. Error details: {e}")
+
+            version_ids = list(content_version_ids)
+            for i in range(0, len(version_ids), SOQL_IN_BATCH_SIZE):
+                result = self.sf.query_all(f"SELECT Id, ContentDocumentId FROM ContentVersion WHERE Id IN ({self._soql_list(version_ids[i:i + SOQL_IN_BATCH_SIZE])})")
+                for r in result["records"]:
+                    document_ids[content_version_ids[r["Id"]]] = r["ContentDocumentId"]
+
+        # Create Required Relationships
+        self.logger.info("\nChecking for creating Document Links")
+        entity_ids = list(record_ids)
+        if self.library:
+            library_id = self.get_library_id()
+            if library_id:
+                self.logger.info(f" -> Saving to Library called: {self.library}")
+                entity_ids.append(library_id)
+
+        self.create_document_links([(doc_id, entity_id) for doc_id in document_ids.values() for entity_id in entity_ids])
+
+        self.logger.info(" -> Upload Complete!")
 
     def _run_task(self):
         if (self.object and not self.where) or (not self.object and self.where):
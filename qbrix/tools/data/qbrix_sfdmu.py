@@ -1,28 +1,39 @@
 import json
 import os
+import shutil
 import subprocess
+import tempfile
+import threading
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 
 from cumulusci.core.config import ScratchOrgConfig
 from cumulusci.tasks.sfdx import SFDXBaseTask
 from cumulusci.core.exceptions import CommandException
 from cumulusci.core.keychain import BaseProjectKeychain
+from cumulusci.core.utils import process_list_arg
 
-LOAD_COMMAND = "sfdx sfdmu:run --sourceusername CSVFILE --targetusername {targetusername} -p {pathtoexportjson} --canmodify {instanceurl} --noprompt --verbose"
-SCRATCHORG_LOAD_COMMAND = "sfdx sfdmu:run --sourceusername CSVFILE --targetusername {targetusername} -p {pathtoexportjson} --noprompt --verbose"
+LOAD_COMMAND = 'sfdx sfdmu:run --sourceusername CSVFILE --targetusername {targetusername} -p "{pathtoexportjson}" --canmodify {instanceurl} --noprompt --verbose'
+SCRATCHORG_LOAD_COMMAND = 'sfdx sfdmu:run --sourceusername CSVFILE --targetusername {targetusername} -p "{pathtoexportjson}" --noprompt --verbose'
 
 
 class SFDMULoad(SFDXBaseTask):
     task_docs = """
     Custom Task for Running Data Uploads with the SFDMU Plugin.
+
+    Several plans can be loaded at once by passing a comma separated list of directories to pathtoexportjson. Each plan runs from its own temporary copy of the directory, so the export.json files in the project are never changed.
     """
 
     keychain_class = BaseProjectKeychain
     task_options = {
         "pathtoexportjson": {
-            "description": "Directory path to the export.json to upload",
+            "description": "Directory path to the export.json to upload. Use a comma separated list to load several independent plans",
             "required": True
         },
+        "maxparallel": {
+            "description": "Maximum number of plans to load at the same time. Defaults to 3",
+            "required": False
+        },
         "targetusername": {
             "description": "Username or AccessToken of the account that will be used to upload the data",
             "required": False
@@ -41,47 +52,50 @@ class SFDMULoad(SFDXBaseTask):
         }
     }
 
-    def _prepareexportjsonfile(self):
+    def _prepareexportjsonfile(self, plan_path):
+        """Copies the plan directory to a temporary folder and adds the target org to the copied export.json. Returns the path to the copy."""
 
-        if not os.path.isdir(self.pathtoexportjson):
-            raise Exception("Path to export.json is not valid")
+        if not os.path.isdir(plan_path):
+            raise Exception(f"Path to export.json is not valid: {plan_path}")
 
-        if not os.path.isfile(f"{self.pathtoexportjson}/export.json"):
-            raise Exception("export.json is missing")
+        if not os.path.isfile(f"{plan_path}/export.json"):
+            raise Exception(f"export.json is missing from {plan_path}")
 
-        with open(f"{self.pathtoexportjson}/export.json", "r") as tmpFile:
-            defcontents = tmpFile.read()
-            tmpFile.close()
+        workdir = os.path.join(tempfile.mkdtemp(prefix="sfdmu_"), os.path.basename(os.path.normpath(plan_path)))
+        shutil.copytree(plan_path, workdir)
 
-            exportjson = json.loads(defcontents)
+        with open(f"{workdir}/export.json", "r") as tmpFile:
+            exportjson = json.load(tmpFile)
 
-            # build the org data
-            orgdata = {'name': self.targetusername, 'accessToken': self.accesstoken, 'instanceUrl': self.instanceurl}
+        # build the org data
+        orgdata = {'name': self.targetusername, 'accessToken': self.accesstoken, 'instanceUrl': self.instanceurl}
+        exportjson["orgs"] = [orgdata]
 
-            exportjson["orgs"] = []
-            exportjson["orgs"].append(orgdata)
+        with open(f"{workdir}/export.json", "w") as tmpFile:
+            json.dump(exportjson, tmpFile)
 
-            tmpdata = json.dumps(exportjson)
+        return workdir
 
-            self.logger.info('Formatted EXPORT.JSON:' + tmpdata)
+    def _cleanupexportjsonfile(self, workdir):
+        shutil.rmtree(os.path.dirname(workdir), ignore_errors=True)
 
-        with open(f"{self.pathtoexportjson}/export.json", "w") as tmpFile:
-            tmpFile.write(tmpdata)
-            tmpFile.close()
+    def _runplan(self, plan_path):
+        """Runs a single plan, logging the SFDMU output as it is produced. Returns the exit code."""
 
-    def _cleanupexportjsonfile(self):
-        if os.path.isdir(self.pathtoexportjson):
-            if os.path.isfile(f"{self.pathtoexportjson}/export.json"):
-                with open(f"{self.pathtoexportjson}/export.json", "r") as tmpFile:
-                    defcontents = tmpFile.read()
-                    tmpFile.close()
-                    exportjson = json.loads(defcontents)
-                    exportjson["orgs"] = []
-                    tmpdata = json.dumps(exportjson)
+        plan_name = os.path.basename(os.path.normpath(plan_path))
+        workdir = self._prepareexportjsonfile(plan_path)
+        self.logger.info(f"Loading {plan_path} from {workdir}")
 
-                    with open(f"{self.pathtoexportjson}/export.json", "w") as tmpFile:
-                        tmpFile.write(tmpdata)
-                        tmpFile.close()
+        try:
+            with subprocess.Popen(self._get_command(workdir), shell=True, cwd=self.options.get("dir"),
+                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1,
+                                  universal_newlines=True) as p:
+                for line in p.stdout:
+                    with self.outputlock:
+                        self.logger.info(f"[{plan_name}] {line.rstrip()}" if len(self.plans) > 1 else line.rstrip())
+            return p.returncode
+        finally:
+            self._cleanupexportjsonfile(workdir)
 
     def _setprojectdefaults(self, instanceurl):
         subprocess.run([f"sfdx config:set instanceUrl={instanceurl}"], shell=True, capture_output=True)
@@ -131,6 +145,12 @@ class SFDMULoad(SFDXBaseTask):
         else:
             self.pathtoexportjson = self.options["pathtoexportjson"]
 
+        # relative plan paths are relative to the task directory
+        basedir = self.options.get("dir") or os.getcwd()
+        self.plans = [os.path.join(basedir, plan) for plan in process_list_arg(self.pathtoexportjson)]
+        self.maxparallel = max(1, int(self.options.get("maxparallel") or 3))
+        self.outputlock = threading.Lock()
+
         # if not passed in - fall back to the key ring data
         if "targetusername" not in self.options or not self.options["targetusername"]:
 
@@ -157,34 +177,29 @@ class SFDMULoad(SFDXBaseTask):
 
         self._prepruntime(self)
         self._setprojectdefaults(self.instanceurl)
-        self._prepareexportjsonfile()
         self.logger.info('Target Path:' + self.pathtoexportjson)
-        self.logger.info('Current Working Directory:' + self.options.get("dir"))
-        self.options["command"] = self._get_command()
-        output = []
+        self.logger.info(f'Current Working Directory:{self.options.get("dir")}')
 
-        cmdtorun = self._get_command()
-        resp = subprocess.run([f"{cmdtorun}"], shell=True, capture_output=True, cwd=self.options.get("dir"))
+        with ThreadPoolExecutor(max_workers=min(self.maxparallel, len(self.plans))) as executor:
+            returncodes = list(executor.map(self._runplan, self.plans))
 
-        # resp = output[0].decode("utf-8")
-        stdoutres = resp.stdout.splitlines()
-        [self.logger.info(i) for i in stdoutres]
-        # self.logger.info(resp.stdout)
-
-        self.logger.info('cleaning up export.json..')
-        self._cleanupexportjsonfile()
+        failed_plans = [plan for plan, returncode in zip(self.plans, returncodes) if returncode]
+        if failed_plans:
+            message = f"SFDMU load failed for: {', '.join(failed_plans)}"
+            self.logger.error(message)
+            raise CommandException(message)
 
-    def _get_command(self):
+    def _get_command(self, pathtoexportjson):
         command = ""
         if not isinstance(self.org_config, ScratchOrgConfig):
             command = LOAD_COMMAND.format(
-                pathtoexportjson=self.pathtoexportjson,
+                pathtoexportjson=pathtoexportjson,
                 instanceurl=self.instanceurl.replace("https://", ""),
                 targetusername=self.targetusername
             )
         else:
             command = SCRATCHORG_LOAD_COMMAND.format(
-                pathtoexportjson=self.pathtoexportjson,
+                pathtoexportjson=pathtoexportjson,
                 targetusername=self.targetusername
             )
 
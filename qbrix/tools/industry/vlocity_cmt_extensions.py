@@ -7,7 +7,10 @@ import re
 import sys
 import subprocess
 import base64
+import time
 from abc import abstractmethod
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
 
 from cumulusci.core.config import ScratchOrgConfig
 from cumulusci.tasks.sfdx import SFDXBaseTask
@@ -17,6 +20,12 @@ from cumulusci.core.keychain import BaseProjectKeychain
 
 LOAD_COMMAND = "sfdx force:apex:execute "
 
+# server side waits start with short polls and back off to the old fixed 10 second cycle
+POLL_INITIAL_SECONDS = 2
+POLL_MAX_SECONDS = 10
+# executeAnonymous takes the apex as a query parameter, so larger scripts are run from the file with sfdx
+MAX_ANONYMOUS_URL_LENGTH = 8000
+
 #this is very specific to Vlocity CMT setup    
 class CMTDeployDefaultLayouts(SFDXBaseTask):
     keychain_class = BaseProjectKeychain
@@ -93,101 +102,147 @@ class CMTDeployDefaultLayouts(SFDXBaseTask):
 
     def deploy_default_layout(self):
         
-        #env setup for sfdx 
-        subprocess.run([f"sfdx config:set instanceUrl={self.instanceurl}"], shell=True, capture_output=True)
-        
         MAX_CYCLES = 60
         
         deleteapex="qbrix_local/scripts/deletecmtdefaultlayouts.cls"
         initialRedeployApex="qbrix_local/scripts/initialcmtredeploydefualtlayouts.cls"
         pollRedeployApex="qbrix_local/scripts/pollcmtdatapackdeployqueue.cls"
         pollRedeployApexClassic="qbrix_local/scripts/pollcmtdatapackdeployqueueclassic.cls"
-        
+
+        # the datapack model does not change during the run, so detect it once
+        isclassdatapackload=self._is_classic_datapack()
+
+        if(isclassdatapackload):
+            statusfield = "vlocity_cmt__Status__c"
+            queuesoql = "select id,vlocity_cmt__Status__c from vlocity_cmt__VlocityDataPack__c where Name='QBrixDeploy'"
+            pollapex = pollRedeployApexClassic
+        else:
+            statusfield = "ProcessStatus"
+            queuesoql = "select id,ProcessStatus from OmniDataPack where Name='QBrixDeploy'"
+            pollapex = pollRedeployApex
+
         #Run the intial delete
-        deletecmd=f"sfdx force:apex:execute -f {deleteapex} -u {self.accesstoken} --json"
-        resp = subprocess.run([deletecmd], shell=True, capture_output=True)
+        deletestarted = datetime.now(timezone.utc) - timedelta(seconds=30)
+        self._execute_anonymous(deleteapex)
         self.logger.info("Delete Executed")
-        #wait a minute - let jobs spin up server side
-        sleep(60)
-        
+
+        #wait (up to a minute) for the delete jobs spun up server side to finish
+        self._wait_for(lambda: self._query_count(
+            "select count() from AsyncApexJob where Status in ('Holding','Queued','Preparing','Processing') "
+            f"and CreatedDate >= {deletestarted.strftime('%Y-%m-%dT%H:%M:%SZ')}") == 0, 60)
+
         #Run the intitial loadta - to seed the server side dp state
-        initdeploycmd=f"sfdx force:apex:execute -f {initialRedeployApex} -u {self.accesstoken} --json"
-        resp = subprocess.run([initdeploycmd], shell=True, capture_output=True)
+        self._execute_anonymous(initialRedeployApex)
         self.logger.info("Running Initial Load")
-        sleep(60)
-        
-        cmd = f"sfdx force:data:soql:query -u {self.accesstoken} -q \"select id,ProcessStatus from OmniDataPack where Name='QBrixDeploy' and ProcessStatus in ('Ready') ORDER BY CREATEDDATE DESC LIMIT 1\" --json"
-        isclassdatapackload=self._is_classic_datapack()
-        
-        if(isclassdatapackload):
-            cmd = f"sfdx force:data:soql:query -u {self.accesstoken} -q \"select id,vlocity_cmt__Status__c from vlocity_cmt__VlocityDataPack__c where Name='QBrixDeploy' and vlocity_cmt__Status__c in ('Ready') ORDER BY CREATEDDATE DESC LIMIT 1\" --json"
-            
-        result = subprocess.run([cmd], shell=True, capture_output=True)
 
-        if result is None:
+        #wait (up to a minute) for the queue record to appear
+        records = self._wait_for(lambda: self._query(
+            f"{queuesoql} and {statusfield} in ('Ready') ORDER BY CREATEDDATE DESC LIMIT 1"), 60)
+
+        if not records:
             return None
 
-        jsonresult = json.loads(result.stdout)
-        self.logger.info(jsonresult)
+        queueid=records[0]["Id"]
+        status = records[0][statusfield]
+        interval = POLL_INITIAL_SECONDS
 
-        if jsonresult["result"]["totalSize"] == 1:
-            
-            queueid=jsonresult["result"]["records"][0]["Id"]
-            
-            if(isclassdatapackload):
-                status = jsonresult["result"]["records"][0]["vlocity_cmt__Status__c"]
-            else:
-                status = jsonresult["result"]["records"][0]["ProcessStatus"]
-            
-            while((status=="Ready" or status=="InProgress") and (MAX_CYCLES>0)) :
-                
-                self.logger.info(f"Loading Status::{status}")
-                
-                if(isclassdatapackload):
-                    pollcmd=f"sfdx force:apex:execute -f {pollRedeployApexClassic} -u {self.accesstoken} --json"
-                else:
-                    pollcmd=f"sfdx force:apex:execute -f {pollRedeployApex} -u {self.accesstoken} --json"
-                
-                
-                subprocess.run([pollcmd], shell=True, capture_output=True)
-    
-    
-                cmd = f"sfdx force:data:soql:query -u {self.accesstoken} -q \"select id,ProcessStatus from OmniDataPack where Name='QBrixDeploy' and Id='{queueid}' ORDER BY CREATEDDATE DESC LIMIT 1\" --json"
-                
-                if(isclassdatapackload):
-                    cmd = f"sfdx force:data:soql:query -u {self.accesstoken} -q \"select id,vlocity_cmt__Status__c from vlocity_cmt__VlocityDataPack__c where Name='QBrixDeploy' and Id='{queueid}' ORDER BY CREATEDDATE DESC LIMIT 1\" --json"
-                    
-                result = subprocess.run([cmd], shell=True, capture_output=True)
-                jsonresult = json.loads(result.stdout)
-                
-                if(isclassdatapackload):
-                    status = jsonresult["result"]["records"][0]["vlocity_cmt__Status__c"]
-                else:
-                    status = jsonresult["result"]["records"][0]["ProcessStatus"]
-                
-                if(status =="Completed" or status =="Error"):
-                    MAX_CYCLES = -1
-                    break
+        while((status=="Ready" or status=="InProgress") and (MAX_CYCLES>0)) :
+
+            self.logger.info(f"Loading Status::{status}")
+
+            self._execute_anonymous(pollapex)
+
+            records = self._query(f"{queuesoql} and Id='{queueid}' ORDER BY CREATEDDATE DESC LIMIT 1")
+            status = records[0][statusfield]
+
+            if(status =="Completed" or status =="Error"):
+                MAX_CYCLES = -1
+                break
+
+            #decrement 
+            MAX_CYCLES -= 1
+
+            self.logger.info(f"Remaining Cycles::{MAX_CYCLES}")
+            sleep(interval)
+            interval = min(interval * 2, POLL_MAX_SECONDS)
+
+    def _wait_for(self, condition, maxseconds):
+        # polls the condition with backoff and returns its result as soon as it is truthy
+        deadline = time.time() + maxseconds
+        interval = POLL_INITIAL_SECONDS
+
+        while True:
+            result = condition()
+            if result or time.time() >= deadline:
+                return result
+
+            sleep(min(interval, max(0, deadline - time.time())))
+            interval = min(interval * 2, POLL_MAX_SECONDS)
+
+    def _apiurl(self, path):
+        apiversion = self.project_config.project__package__api_version or "57.0"
+        return f"{self.instanceurl}/services/data/v{apiversion}/{path}"
+
+    def _execute_anonymous(self, apexfile):
+        # runs the apex through the tooling api instead of launching sfdx
+        with open(apexfile, "r") as tmpFile:
+            apexbody = tmpFile.read()
+
+        url = self._apiurl("tooling/executeAnonymous")
+        if len(url) + len(urlencode({"anonymousBody": apexbody})) + 1 > MAX_ANONYMOUS_URL_LENGTH:
+            jsonresult = self._execute_anonymous_via_sfdx(apexfile)
+        else:
+            response = requests.get(url, headers={"Authorization": f"Bearer {self.accesstoken}"},
+                                    params={"anonymousBody": apexbody})
+            response.raise_for_status()
+            jsonresult = response.json()
+
+        if not jsonresult["compiled"] or not jsonresult["success"]:
+            self.logger.error(f"Apex Failed::{apexfile}::{jsonresult.get('compileProblem') or jsonresult.get('exceptionMessage')}")
+
+        return jsonresult
+
+    def _execute_anonymous_via_sfdx(self, apexfile):
+        # returns the sfdx result in the same shape as executeAnonymous
+        # sfdx only accepts an access token as the username once the instance url has been configured
+        self._setprojectdefaults(self.instanceurl)
+        resp = subprocess.run([f"{LOAD_COMMAND} -f {apexfile} -u {self.accesstoken} --json"], shell=True, capture_output=True)
+
+        try:
+            sfdxresult = json.loads(resp.stdout)
+        except ValueError:
+            sfdxresult = {"message": resp.stderr.decode("utf-8") if resp.stderr else resp.stdout}
+
+        result = sfdxresult.get("result") or {}
+        return {
+            "compiled": bool(result.get("compiled")),
+            "success": bool(result.get("success")),
+            "compileProblem": result.get("compileProblem") or sfdxresult.get("message"),
+            "exceptionMessage": result.get("exceptionMessage") or sfdxresult.get("message")
+        }
+
+    def _query(self, soql):
+        response = requests.get(self._apiurl("query"), headers={"Authorization": f"Bearer {self.accesstoken}"},
+                                params={"q": soql})
+        response.raise_for_status()
+        return response.json()["records"]
+
+    def _query_count(self, soql):
+        response = requests.get(self._apiurl("query"), headers={"Authorization": f"Bearer {self.accesstoken}"},
+                                params={"q": soql})
+        response.raise_for_status()
+        return int(response.json()["totalSize"])
 
-                #decrement 
-                MAX_CYCLES -= 1
-                
-                self.logger.info(f"Remaining Cycles::{MAX_CYCLES}")
-                sleep(10)
-                
     def _is_classic_datapack(self):
         
-        cmd = f"sfdx force:data:soql:query -u {self.accesstoken} -q \"SELECT  QualifiedApiName FROM EntityDefinition Where QualifiedApiName= 'OmniDataPack'\" --json"
-        result = subprocess.run([cmd], shell=True, capture_output=True)
-        jsonresult = json.loads(result.stdout)
+        records = self._query("SELECT  QualifiedApiName FROM EntityDefinition Where QualifiedApiName= 'OmniDataPack'")
         #if it does not exist - we are in classic loading.
-        return int(jsonresult["result"]["totalSize"]) ==0
+        return len(records) == 0
         
                 
     def _run_task(self):
 
         self._prepruntime(self)
-        self._setprojectdefaults(self.instanceurl)
         self.deploy_default_layout()
 
     def _handle_returncode(self, returncode, stderr):
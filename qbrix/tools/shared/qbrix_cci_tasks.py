@@ -1,10 +1,13 @@
+import hashlib
 import os
 import shutil
 import subprocess
+import time
 from abc import ABC
 
 from cumulusci.core.utils import import_global
 from cumulusci.core.exceptions import TaskOptionsError
+from cumulusci.core.flowrunner import FlowCoordinator
 from cumulusci.core.tasks import CURRENT_TASK, BaseTask
 from cumulusci.cli.runtime import CliRuntime
 
@@ -34,6 +37,39 @@ def rebuild_cci_cache(cci_project_cache_directory: str = ".cci/projects") -> boo
     return True
 
 
+def rebuild_cci_cache_if_changed(cci_project_cache_directory: str = ".cci/projects", max_age_hours: int = 24) -> bool:
+    """
+    Rebuilds the CCI projects Cache folder only when the project dependencies (cumulusci.yml) have changed since the last rebuild, the cache is missing or the cache is older than max_age_hours.
+
+    Args:
+        cci_project_cache_directory (str): Relative File Path to the CCI Projects Directory
+        max_age_hours (int): Maximum age of the cache before it is rebuilt anyway, so upstream changes are picked up. Defaults to 24
+
+    Returns:
+        bool: True when the cache was rebuilt, False when the existing cache was kept
+    """
+
+    fingerprint_file = os.path.join(".qbrix", "cci_cache_fingerprint")
+
+    with open("cumulusci.yml", "rb") as cci_file:
+        fingerprint = hashlib.sha256(cci_file.read()).hexdigest()
+
+    if os.path.isdir(cci_project_cache_directory) and os.path.exists(fingerprint_file):
+        with open(fingerprint_file, "r") as f:
+            previous_fingerprint = f.read().strip()
+        cache_age_hours = (time.time() - os.path.getmtime(fingerprint_file)) / 3600
+        if previous_fingerprint == fingerprint and cache_age_hours < max_age_hours:
+            return False
+
+    rebuild_cci_cache(cci_project_cache_directory)
+
+    os.makedirs(os.path.dirname(fingerprint_file), exist_ok=True)
+    with open(fingerprint_file, "w") as f:
+        f.write(fingerprint)
+
+    return True
+
+
 def _parse_task_options(options, task_class, task_config):
     """
     Task Option Parser
@@ -63,13 +99,15 @@ def _run_task(task):
     return task.return_values
 
 
-def run_cci_task(task_name: str, org_name: str = None, **options) -> bool:
+def run_cci_task(task_name: str, org_name: str = None, org_config=None, project_config=None, **options) -> bool:
     """
     Runs a given task using the name of the task.
 
     Args:
         task_name (str): The name of the task to run
         org_name (str): The optional alias for the org, this defaults to "dev"
+        org_config (OrgConfig): Optional org config to run the task against. Defaults to the current task's org, or the org loaded from the keychain.
+        project_config (BaseProjectConfig): Optional project config. Defaults to the current task's project config, or the project in the current directory.
         options: Additional options for the task that you want to provide, for example the 'deploy' task has an option for path, so you can define path='my/path/here'
 
     Example Usage:
@@ -80,17 +118,21 @@ def run_cci_task(task_name: str, org_name: str = None, **options) -> bool:
     if not org_name:
         org_name = "dev"
 
-    if getattr(CURRENT_TASK, "stack", None) and CURRENT_TASK.stack[0].project_config:
+    if project_config:
+        _project_config = project_config
+    elif getattr(CURRENT_TASK, "stack", None) and CURRENT_TASK.stack[0].project_config:
         _project_config = CURRENT_TASK.stack[0].project_config
     else:
         _project_config = CliRuntime().project_config
 
-    if getattr(CURRENT_TASK, "stack", None) and CURRENT_TASK.stack[0].org_config:
+    if org_config:
+        _org = org_config
+    elif getattr(CURRENT_TASK, "stack", None) and CURRENT_TASK.stack[0].org_config:
         _org = CURRENT_TASK.stack[0].org_config
     else:
         _org = CliRuntime().project_config.keychain.get_org(org_name)
 
-    task_config = CliRuntime().project_config.get_task(task_name)
+    task_config = _project_config.get_task(task_name)
     task_class = import_global(task_config.class_path)
     task_config = _parse_task_options(options, task_class, task_config)
     task = task_class(
@@ -106,13 +148,15 @@ def run_cci_task(task_name: str, org_name: str = None, **options) -> bool:
         raise Exception(f"Task Runner Failed. {e}")
 
 
-def run_cci_flow(flow_name: str, org_name: str = None, **options) -> bool:
+def run_cci_flow(flow_name: str, org_name: str = None, org_config=None, project_config=None, **options) -> bool:
     """
     Runs a given flow using the flow name and optional org name along with optional options.
 
     Args:
         flow_name (str): The name of the flow to run, for example deploy_qbrix
         org_name (str): Optional alias for the org. This defaults to "dev"
+        org_config (OrgConfig): Optional org config to run the flow against, for example self.org_config from a running task. This reuses the existing org session instead of loading the org from the keychain.
+        project_config (BaseProjectConfig): Optional project config, for example self.project_config from a running task. Defaults to the current task's project config, or the project in the current directory.
 
     Returns:
         bool: True if the flow has executed without error
@@ -124,8 +168,17 @@ def run_cci_flow(flow_name: str, org_name: str = None, **options) -> bool:
     if not org_name:
         org_name = "dev"
 
-    org_config = CliRuntime().project_config.keychain.get_org(org_name)
-    flow_coordinator = CliRuntime().get_flow(flow_name, options=options)
+    if project_config is None:
+        if getattr(CURRENT_TASK, "stack", None) and CURRENT_TASK.stack[0].project_config:
+            project_config = CURRENT_TASK.stack[0].project_config
+        else:
+            project_config = CliRuntime().project_config
+
+    if org_config is None:
+        org_config = project_config.keychain.get_org(org_name)
+
+    flow_config = project_config.get_flow(flow_name)
+    flow_coordinator = FlowCoordinator(flow_config.project_config, flow_config, name=flow_name, options=options)
 
     try:
         flow_coordinator.run(org_config)
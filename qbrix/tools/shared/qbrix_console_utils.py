@@ -1,12 +1,21 @@
 import logging
+import os
 import subprocess
 import sys
 import textwrap
+import threading
+import time
 import shlex
 from abc import ABC
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 from cumulusci.tasks.command import Command
 
+COMMAND_POLL_SECONDS = 0.25
+COMMAND_KILL_GRACE_SECONDS = 5
+DEFAULT_MAX_PARALLEL_COMMANDS = 4
+
 
 class CustomFormatter(logging.Formatter):
     """Logging colored formatter """
@@ -112,21 +121,42 @@ class CreateBanner(Command, ABC):
         print(self._banner_string())
 
 
+@lru_cache(maxsize=None)
 def get_terminal_width():
+    """ Returns the width of the console, or 0 when there is no console. The width is only looked up once. """
     # if we are running in a headless runner- tty will not be there.
     try:
-        return int(subprocess.check_output(['stty', 'size']).split()[1])
+        return os.get_terminal_size(sys.__stdout__.fileno()).columns
     except Exception as e:
         print(e)
     return 0
 
 
-def run_command(command, cwd=None):
+def _stream_output(stream, log_method, prefix):
+    for line in stream:
+        line = line.rstrip("\n")
+        if line:
+            log_method(f"{prefix}{line}")
+
+
+def _stop_process(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=COMMAND_KILL_GRACE_SECONDS)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def run_command(command, cwd=None, timeout=None, cancel_event=None, prefix=""):
     """
-    Runs a command as a subprocess and returns the result code
-    :param command: string command statement
+    Runs a command as a subprocess and returns the result code. stdout and stderr are read at the same time and logged as they are produced.
+    :param command: string command statement, or a list of arguments
     :param cwd: (Optional) Current Working Directory override
-    :return: code (0 = success, 1 or above = error/failure)
+    :param timeout: (Optional) Number of seconds after which the command is stopped
+    :param cancel_event: (Optional) threading.Event which stops the command when it is set
+    :param prefix: (Optional) Text added to the start of each logged line
+    :return: code (0 = success, 1 or above = error/failure, None if the command could not be started)
     """
 
     if not cwd:
@@ -139,23 +169,78 @@ def run_command(command, cwd=None):
     print(f"Running Command: {command} in directory {cwd}\n")
 
     log = init_logger()
+    args = shlex.split(command) if isinstance(command, str) else list(command)
 
     try:
-        with subprocess.Popen(shlex.split(command), stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='utf-8', text=True) as proc:
-            errs = []
-            for line in proc.stdout:
-                if line:
-                    log.info(line)
-            for line in proc.stderr:
-                if line:
-                    errs.append(line)
-            stdout, _ = proc.communicate()
-        result = subprocess.CompletedProcess(command, proc.returncode, stdout, "\n".join(errs))
-    except subprocess.TimeoutExpired:
-        proc.kill()
-        log.error("Subprocess Timeout. Killing Process")
+        proc = subprocess.Popen(args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='utf-8', text=True, bufsize=1)
     except Exception as e:
-        proc.kill()
         log.error(f"Subprocess Failed. Error details: {e}")
+        return None
+
+    readers = [
+        threading.Thread(target=_stream_output, args=(proc.stdout, log.info, prefix), daemon=True),
+        threading.Thread(target=_stream_output, args=(proc.stderr, log.warning, prefix), daemon=True)
+    ]
+    for reader in readers:
+        reader.start()
+
+    deadline = time.monotonic() + float(timeout) if timeout else None
+    stopped = False
+    try:
+        while True:
+            try:
+                proc.wait(timeout=COMMAND_POLL_SECONDS)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+
+            if deadline and time.monotonic() >= deadline:
+                log.error(f"{prefix}Subprocess Timeout after {timeout} seconds. Killing Process")
+                stopped = True
+                _stop_process(proc)
+                break
+
+            if cancel_event is not None and cancel_event.is_set():
+                log.error(f"{prefix}Subprocess Cancelled. Killing Process")
+                stopped = True
+                _stop_process(proc)
+                break
+    except BaseException:
+        stopped = True
+        _stop_process(proc)
+        raise
+    finally:
+        # Child processes of a stopped command can keep the pipes open, so only wait a short time for the remaining output
+        for reader in readers:
+            reader.join(COMMAND_KILL_GRACE_SECONDS if stopped else None)
+
+    return proc.returncode
+
+
+def run_commands(commands, max_parallel=DEFAULT_MAX_PARALLEL_COMMANDS, cwd=None, timeout=None, stop_on_failure=False):
+    """
+    Runs several commands as subprocesses, with at most max_parallel running at the same time
+    :param commands: list of string command statements
+    :param max_parallel: (Optional) Maximum number of commands to run at the same time. Defaults to 4
+    :param cwd: (Optional) Current Working Directory override
+    :param timeout: (Optional) Number of seconds after which each command is stopped
+    :param stop_on_failure: (Optional) When True, the first failure stops the running commands and skips the rest
+    :return: list of result codes in the same order as the commands (None for commands which were skipped)
+    """
+
+    if not commands:
+        return []
+
+    cancel_event = threading.Event()
+
+    def _run(index, command):
+        if cancel_event.is_set():
+            return None
+        returncode = run_command(command, cwd=cwd, timeout=timeout, cancel_event=cancel_event, prefix=f"[{index + 1}] ")
+        if returncode != 0 and stop_on_failure:
+            cancel_event.set()
+        return returncode
 
-    return result.returncode
+    with ThreadPoolExecutor(max_workers=max(1, min(int(max_parallel), len(commands)))) as executor:
+        futures = [executor.submit(_run, index, command) for index, command in enumerate(commands)]
+        return [future.result() for future in futures]
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import uuid
+from typing import Optional
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class MultipartFileStream:
+    """
+    File-like multipart/form-data body for a ContentVersion insert. The file is read from disk in chunks as the request is sent, and the MD5 checksum (the same value Salesforce stores in ContentVersion.Checksum) is calculated along the way.
+    """
+
+    def __init__(self, file_path, entity_content, progress_callback=None, chunk_size=UPLOAD_CHUNK_SIZE):
+        boundary = uuid.uuid4().hex
+        file_name = os.path.basename(file_path).replace('"', '')
+
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self.file_path = file_path
+        self.file_size = os.path.getsize(file_path)
+        self.bytes_sent = 0
+        self.checksum = hashlib.md5()
+        self._progress_callback = progress_callback
+        self._chunk_size = chunk_size
+        self._head = (
+            f"--{boundary}\r\n"
+            f"Content-Disposition: form-data; name=\"entity_content\"\r\n"
+            f"Content-Type: application/json\r\n\r\n"
+            f"{json.dumps(entity_content)}\r\n"
+            f"--{boundary}\r\n"
+            f"Content-Disposition: form-data; name=\"VersionData\"; filename=\"{file_name}\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n"
+        ).encode("utf-8")
+        self._tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+        self._parts = self._generate_parts()
+        self._buffer = b""
+        self._offset = 0
+
+    def __len__(self):
+        return len(self._head) + self.file_size + len(self._tail)
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self._chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def _generate_parts(self):
+        yield self._head
+        with open(self.file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(self._chunk_size), b""):
+                self.checksum.update(chunk)
+                self.bytes_sent += len(chunk)
+                if self._progress_callback:
+                    self._progress_callback(self.bytes_sent, self.file_size)
+                yield chunk
+        yield self._tail
+
+    def read(self, size=-1):
+        # Hand out the current part in slices, only pulling the next part from disk once it is used up
+        if self._offset >= len(self._buffer):
+            self._buffer = next(self._parts, b"")
+            self._offset = 0
+
+        if size < 0:
+            size = len(self._buffer) - self._offset
+        data = self._buffer[self._offset:self._offset + size]
+        self._offset += len(data)
+        return data
+
+
+def file_checksum(file_path) -> str:
+    """
+    Calculates the MD5 checksum of a file, reading it in chunks. This matches the ContentVersion.Checksum value Salesforce stores for uploaded files.
+
+    Args:
+        file_path (str): Path to the file
+
+    Returns:
+        str: Hex digest of the file contents
+    """
+
+    checksum = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def upload_content_version(sf, file_path, title: Optional[str] = None, fields: Optional[dict] = None, progress_callback=None) -> dict:
+    """
+    Uploads a file as a new ContentVersion, streaming the file from disk as a multipart/form-data request instead of base64 encoding it into a JSON body.
+
+    Args:
+        sf (simple_salesforce.Salesforce): Connected Salesforce API instance, for example self.sf within a CumulusCI task
+        file_path (str): Path to the file to upload
+        title (str): Title for the file. Defaults to the file name without the extension
+        fields (dict): Additional ContentVersion field values, for example FirstPublishLocationId
+        progress_callback (function): Optional function called with (bytes_sent, total_bytes) as the file is sent
+
+    Returns:
+        dict: The new ContentVersion id, the MD5 checksum of the file and the file size in bytes
+    """
+
+    entity_content = {
+        "Title": title if title else os.path.splitext(os.path.basename(file_path))[0],
+        "PathOnClient": os.path.basename(file_path)
+    }
+    if fields:
+        entity_content.update(fields)
+
+    body = MultipartFileStream(file_path, entity_content, progress_callback)
+    response = sf.session.post(
+        f"{sf.base_url}sobjects/ContentVersion",
+        headers={
+            "Authorization": f"Bearer {sf.session_id}",
+            "Content-Type": body.content_type,
+            "Content-Length": str(len(body))
+        },
+        data=body
+    )
+
+    if response.status_code >= 400:
+        raise Exception(f"Unable to upload {file_path}. Error details: {response.text}")
+
+    return {
+        "id": response.json()["id"],
+        "checksum": body.checksum.hexdigest(),
+        "size": body.file_size
+    }
+
+
+def find_content_document(sf, file_path, checksum: Optional[str] = None) -> Optional[str]:
+    """
+    Looks for a file which has already been uploaded with the same name and contents
+
+    Args:
+        sf (simple_salesforce.Salesforce): Connected Salesforce API instance
+        file_path (str): Path to the local file
+        checksum (str): MD5 checksum of the file. Calculated from the file when not provided
+
+    Returns:
+        str: The ContentDocumentId of the matching file, or None when the file has not been uploaded
+    """
+
+    checksum = checksum or file_checksum(file_path)
+    file_name = os.path.basename(file_path).replace("\\", "\\\\").replace("'", "\\'")
+    result = sf.query(f"SELECT ContentDocumentId FROM ContentVersion WHERE IsLatest = true AND Checksum = '{checksum}' AND PathOnClient = '{file_name}' LIMIT 1")
+    if result["totalSize"] > 0:
+        return result["records"][0]["ContentDocumentId"]
+    return None
@@ -1,10 +1,120 @@
 import json
+import os
+import shutil
+import tempfile
 
 from os.path import exists
 from qbrix.tools.shared.qbrix_console_utils import init_logger
 
 log = init_logger()
 
+JSON_PATH_SEPARATOR = "."
+
+
+def _split_json_path(key_path):
+    """ Splits a key path into its keys. Paths can be a list of keys or a string using . between keys, e.g. settings.lightningExperienceSettings.enableS1DesktopEnabled """
+
+    keys = list(key_path) if isinstance(key_path, (list, tuple)) else str(key_path).split(JSON_PATH_SEPARATOR)
+    if not keys or any(k is None or k == "" for k in keys):
+        raise Exception("Error: Missing Key Name for JSON File Update. Please check you are passing a key name.")
+    return keys
+
+
+def _apply_json_operation(json_file_data, operation):
+    """ Applies a single get, set or delete operation to loaded json data and returns the value read (for get) """
+
+    action = operation[0]
+    keys = _split_json_path(operation[1])
+    parent = json_file_data
+
+    for key in keys[:-1]:
+        if not isinstance(parent, dict):
+            raise Exception(f"Error: Unable to follow key path {operation[1]}. {key} is not an object.")
+        if key not in parent:
+            if action != "set":
+                return None
+            parent[key] = {}
+        parent = parent[key]
+
+    if not isinstance(parent, dict):
+        raise Exception(f"Error: Unable to follow key path {operation[1]}. The parent is not an object.")
+
+    if action == "get":
+        return parent.get(keys[-1])
+    if action == "set":
+        parent[keys[-1]] = operation[2]
+        return None
+    if action == "delete":
+        parent.pop(keys[-1], None)
+        return None
+
+    raise Exception(f"Error: Unsupported JSON operation: {action}. Use get, set or delete.")
+
+
+def _write_json_file(file_location, json_file_data):
+    """ Writes json data to a temp file next to the target and then swaps it in, so the file is never left half written """
+
+    file_dir = os.path.dirname(os.path.abspath(file_location))
+    handle, temp_path = tempfile.mkstemp(dir=file_dir, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "w") as temp_file:
+            json.dump(json_file_data, temp_file, indent=2)
+        shutil.copymode(file_location, temp_path)
+        os.replace(temp_path, file_location)
+    except Exception:
+        if exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def edit_json_files(file_operations):
+    """ Applies a list of get, set and delete operations to one or more json files. Each file is parsed once and written once, and only if something changed.
+    No file is written unless every operation on every file succeeds.
+    :param file_operations: Dict of file path to a list of operations, for example {"orgs/dev.json": [("get", "edition"), ("set", "settings.lightningExperienceSettings.enableS1DesktopEnabled", True), ("delete", "release")]}. Key paths can be a list of keys or a string using . between keys
+    :return: Dict of file path to a dict of the values read by get operations, keyed by the key path as given
+    """
+
+    results = {}
+    updated_files = {}
+
+    for file_location, operations in file_operations.items():
+        if not exists(file_location):
+            raise Exception(f"Error: File Path does not exist. Check the file {file_location}")
+
+        if not str(file_location).endswith(".json"):
+            raise Exception(f"Error: File provided is not a json file. Check the file {file_location}")
+
+        with open(file_location) as json_file:
+            json_file_data = json.load(json_file)
+
+        original_data = json.dumps(json_file_data, sort_keys=True)
+        file_results = {}
+        for operation in operations:
+            value = _apply_json_operation(json_file_data, operation)
+            if operation[0] == "get":
+                key_path = operation[1] if isinstance(operation[1], str) else JSON_PATH_SEPARATOR.join(operation[1])
+                file_results[key_path] = value
+
+        results[file_location] = file_results
+        if json.dumps(json_file_data, sort_keys=True) != original_data:
+            updated_files[file_location] = json_file_data
+
+    for file_location, json_file_data in updated_files.items():
+        _write_json_file(file_location, json_file_data)
+        log.info(f"{file_location} has been updated!")
+
+    return results
+
+
+def edit_json_file(file_location, operations):
+    """ Applies a list of get, set and delete operations to a json file with one read and one write.
+    :param file_location: The path to the json file
+    :param operations: List of operations, e.g. [("get", "orgName"), ("set", "edition", "Enterprise"), ("delete", "release")]
+    :return: Dict of the values read by get operations, keyed by the key path as given
+    """
+
+    return edit_json_files({file_location: operations})[file_location]
+
 
 def remove_json_entry(file_location, key_name):
     """ Removes an entry from a json file.
@@ -1,30 +1,34 @@
 import datetime
 import filecmp
 import glob
+import hashlib
 import json
 import os
 import re
 import shutil
 import subprocess
 import yaml
-from io import BytesIO
 from os.path import exists
 import tempfile
 from typing import Optional
-from urllib.request import urlopen
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 from zipfile import ZipFile
 import xml.etree.ElementTree as ET
 from xml.dom import minidom
 
-from qbrix.tools.shared.qbrix_json_tasks import update_json_file_value, get_json_file_value, remove_json_entry
+from qbrix.tools.shared.qbrix_json_tasks import update_json_file_value, get_json_file_value, remove_json_entry, edit_json_files
 from qbrix.tools.shared.qbrix_console_utils import init_logger
 from qbrix.tools.utils.qbrix_fart import FART
-from qbrix.tools.shared.qbrix_cci_tasks import rebuild_cci_cache
+from qbrix.tools.shared.qbrix_cci_tasks import rebuild_cci_cache, rebuild_cci_cache_if_changed
 from qbrix.tools.shared.qbrix_shared_checks import is_github_url
 
 log = init_logger()
 
 DEFAULT_UPDATE_LOCATION = "https://qbrix-core.herokuapp.com/qbrix/q_update_package.zip"
+PROJECT_SOURCE_ROOT = os.path.join("force-app", "main", "default")
+UPDATE_CACHE_DIR = os.path.join(".qbrix", "update_cache")
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 
 
 def replace_file_text(file_location, search_string, replacement_string, show_info=False, number_of_replacements=-1):
@@ -328,9 +332,16 @@ def check_org_config_files(auto=False):
     if not os.path.exists("orgs/dev_preview.json"):
         raise Exception(f"The provided file path for the dev scratch org definition file, located at (orgs/dev_preview.json), does not exist.")
 
+    # Read both files once and collect any changes, so each file is only written once
+    current_values = edit_json_files({
+        'orgs/dev.json': [("get", "edition")],
+        'orgs/dev_preview.json': [("get", "edition"), ("get", "instance")]
+    })
+    file_updates = {}
+
     for scratch_config_file in ('orgs/dev.json', 'orgs/dev_preview.json'):
         # Check for "Enterprise" or "Partner Enterprise" edition in scratch org definition
-        current_edition = get_json_file_value(scratch_config_file, "edition")
+        current_edition = current_values[scratch_config_file]["edition"]
 
         if current_edition and "enterprise" not in current_edition.lower():
             log.info(f"Scratch Org File Check: [FAIL] Your {scratch_config_file} file is not set to Enterprise edition.")
@@ -340,10 +351,10 @@ def check_org_config_files(auto=False):
             else:
                 update_dev_input = 'y'
             if update_dev_input == 'y':
-                update_json_file_value('orgs/dev.json', 'edition', 'Enterprise')
-                log.info(f"Scratch Org File Check: Updated {scratch_config_file} to use Enterprise Edition")
+                file_updates.setdefault(scratch_config_file, []).append(("set", "edition", "Enterprise"))
+                log.info(f"Scratch Org File Check: Updating {scratch_config_file} to use Enterprise Edition")
 
-    instance = get_json_file_value("orgs/dev_preview.json", "instance") or ""
+    instance = current_values["orgs/dev_preview.json"]["instance"] or ""
     if "na135" not in instance.lower():
         log.error(
             "Scratch Org File Check: [FAIL] Your org/dev_preview.json file is not set to the NA135 Instance.")
@@ -354,8 +365,10 @@ def check_org_config_files(auto=False):
         else:
             update_dev_input = 'y'
         if update_dev_input == 'y':
-            update_json_file_value('orgs/dev_preview.json', 'instance', 'NA135')
-            remove_json_entry('orgs/dev_preview.json', 'release')
+            file_updates.setdefault('orgs/dev_preview.json', []).extend([("set", "instance", "NA135"), ("delete", "release")])
+
+    if file_updates:
+        edit_json_files(file_updates)
 
     if not error_found:
         log.info("Scratch Org File Check: [OK] All files have passed checks")
@@ -378,22 +391,26 @@ def check_api_versions(project_api_version):
         log.info("API Version Check: Updated sfdx-project.json File")
 
 
-def source_org_feature_checker(skip_rebuild=False, auto=False):
+def source_org_feature_checker(skip_rebuild=False, auto=False, only_if_changed=False):
     """Check all source project dev.json files for missing features from current project dev.json file
 
         Args:
             skip_rebuild (bool): Skips the rebuild step. Typically only used for testing purposes.
             auto (bool): Optional parameter to set the checker to automatically update errors when they are found.
+            only_if_changed (bool): Only rebuilds the CCI cache when the project dependencies have changed since the last rebuild.
     """
 
     log.info("Source Feature Check: Checking that all source dev.json file features are listed in the current orgs/dev.json file")
 
     # Prepare Project File
-    if not skip_rebuild:
+    if skip_rebuild:
+        log.info("Cache Rebuild Skipped")
+    elif only_if_changed:
+        if not rebuild_cci_cache_if_changed():
+            log.info("Cache Rebuild Skipped: No upstream changes found")
+    else:
         clean_project_files()
         rebuild_cci_cache()
-    else:
-        log.info("Cache Rebuild Skipped")
 
     # Locate all dev.json files in CCI Cache
     dev_files = glob.glob(".cci/projects" + "/**/dev.json", recursive=True)
@@ -437,6 +454,53 @@ def check_for_missing_files():
         log.error("[ERROR] Missing File: orgs/dev_preview.json")
 
 
+def download_update_package(url: Optional[str] = DEFAULT_UPDATE_LOCATION, cache_dir: Optional[str] = UPDATE_CACHE_DIR):
+    """
+    Downloads a .zip file to a local cache, streaming it to disk. The ETag and Last-Modified headers from the last download are sent with the request, so an unchanged package is not downloaded again.
+
+    Args:
+        url (str): The URL where the .zip file is located. Defaults to the QBrix Update Location
+        cache_dir (str): Relative path to the folder used to cache downloaded packages. Defaults to .qbrix/update_cache
+
+    Returns:
+        tuple(str, bool): Path to the cached .zip file and True when a new version was downloaded, or False when the cached copy is still current.
+    """
+
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_key = hashlib.md5(url.encode("utf-8")).hexdigest()
+    archive_path = os.path.join(cache_dir, f"{cache_key}.zip")
+    headers_path = os.path.join(cache_dir, f"{cache_key}.json")
+
+    request_headers = {}
+    if exists(archive_path) and exists(headers_path):
+        with open(headers_path, "r") as headers_file:
+            cached_headers = json.load(headers_file)
+        if cached_headers.get("etag"):
+            request_headers["If-None-Match"] = cached_headers["etag"]
+        if cached_headers.get("last_modified"):
+            request_headers["If-Modified-Since"] = cached_headers["last_modified"]
+
+    try:
+        response = urlopen(Request(url, headers=request_headers))
+    except HTTPError as e:
+        if e.code == 304:
+            return archive_path, False
+        raise
+
+    # Stream to a temp file first so a failed download never replaces the cached copy
+    temp_path = f"{archive_path}.part"
+    with response, open(temp_path, "wb") as archive_file:
+        shutil.copyfileobj(response, archive_file, DOWNLOAD_CHUNK_SIZE)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+    os.replace(temp_path, archive_path)
+
+    with open(headers_path, "w") as headers_file:
+        json.dump({"url": url, "etag": etag, "last_modified": last_modified}, headers_file)
+
+    return archive_path, True
+
+
 def download_and_unzip(url: Optional[str] = DEFAULT_UPDATE_LOCATION, archive_password: Optional[str] = None, ignore_optional_updates: Optional[bool] = False, q_update: Optional[bool] = False) -> bool:
     """
     Downloads a .zip file and extracts all contents to the root project directory in the same structure they are within the zip file.
@@ -453,7 +517,8 @@ def download_and_unzip(url: Optional[str] = DEFAULT_UPDATE_LOCATION, archive_pas
     """
 
     try:
-        zipfile = ZipFile(BytesIO(urlopen(url).read()))
+        archive_path, _ = download_update_package(url)
+        zipfile = ZipFile(archive_path)
 
         # Set Password if given
         if archive_password:
@@ -482,7 +547,8 @@ def download_and_unzip(url: Optional[str] = DEFAULT_UPDATE_LOCATION, archive_pas
                 os.mkdir(extract_path + d)
 
         # Extract Files
-        zipfile.extractall(path=extract_path)
+        with zipfile:
+            zipfile.extractall(path=extract_path)
 
         # Clean Up
         dirs = glob.glob(".qbrix/Update/**/__pycache__/", recursive=True)
@@ -544,9 +610,12 @@ def check_and_update_old_class_refs():
     replace_file_text("cumulusci.yml", "tasks.custom.testim.RunTestim", "qbrix.tools.testing.qbrix_testim.RunTestim")
 
 
-def clean_project_files():
+def clean_project_files(keep_cci_cache: Optional[bool] = False):
     """
     Removes known directories and files from a Q Brix Project folder which can be safely removed.
+
+    Args:
+        keep_cci_cache (bool): When True, the .cci/projects cache folder is kept. Defaults to False
     """
 
     # Add Directory Paths to this list to have them removed by cleaner
@@ -556,6 +625,9 @@ def clean_project_files():
         "browser"
     ]
 
+    if keep_cci_cache:
+        dirs_to_remove.remove(".cci/projects")
+
     # Add File Paths to this list to have them removed by cleaner
     files_to_remove = [
         "log.html",
@@ -574,23 +646,70 @@ def clean_project_files():
             check_and_delete_file(f)
 
 
-def delete_standard_fields():
+def scan_project_files(root: Optional[str] = PROJECT_SOURCE_ROOT) -> list:
+    """
+    Walks the project source folder once and returns the relative path of every file found, so several checks can share one scan.
+
+    Args:
+        root (str): Relative path to the folder to scan. Defaults to force-app/main/default
+
+    Returns:
+        list(str): File paths, using / as the separator
+    """
+
+    file_index = []
+    if not os.path.isdir(root):
+        return file_index
+
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            file_index.append(os.path.join(dir_path, file_name).replace(os.sep, "/"))
+
+    return file_index
+
+
+def filter_project_files(file_index, folder, suffix="") -> list:
+    """
+    Returns the files from a project file index which are within the given folder and end with the given suffix.
+
+    Args:
+        file_index (list(str)): File index, as returned by scan_project_files()
+        folder (str): Relative folder path, e.g. force-app/main/default/objects
+        suffix (str): File name ending to match, e.g. .field-meta.xml
+
+    Returns:
+        list(str): Matching file paths
+    """
+
+    prefix = folder.replace(os.sep, "/").rstrip("/") + "/"
+    return [f for f in file_index if f.startswith(prefix) and f.endswith(suffix)]
+
+
+def delete_standard_fields(file_index: Optional[list] = None):
     """
     Removes Core/Standard Fields from Project Source. These are fields which are often pulled down when a standard Object is changed, like Account. Only custom fields need to be stored in the project, so this cleans up the other fields.
+
+    Args:
+        file_index (list(str)): Optional file index from scan_project_files(). When not provided, the project is scanned.
     """
-    object_fields = glob.glob("force-app/main/default/objects/**/*.field-meta.xml", recursive=True)
+    if file_index is not None:
+        object_fields = filter_project_files(file_index, "force-app/main/default/objects", ".field-meta.xml")
+    else:
+        object_fields = glob.glob("force-app/main/default/objects/**/*.field-meta.xml", recursive=True)
     if object_fields and len(object_fields) > 0:
         for of in object_fields:
             if not os.path.basename(of).endswith("__c.field-meta.xml"):
                 os.remove(of)
 
 
-def update_file_api_versions(project_api_version) -> bool:
+def update_file_api_versions(project_api_version, file_index: Optional[list] = None) -> bool:
     """
     Scans specific files in the project which specify their own API version and updates them to be the same as the provided version
 
     Args:
         project_api_version: Target API Version you want to update the files to. e.g. 56
+        file_index (list(str)): Optional file index from scan_project_files(). When provided, source files are taken from the index instead of being searched for.
 
     Returns:
         bool: Returns True when complete. False if there was an issue.
@@ -612,6 +731,12 @@ def update_file_api_versions(project_api_version) -> bool:
     ]
 
     file_list = []
+    if file_index is not None:
+        file_list += filter_project_files(file_index, "force-app/main/default/classes", ".cls-meta.xml")
+        file_list += filter_project_files(file_index, "force-app/main/default/aura", ".cmp-meta.xml")
+        file_list += filter_project_files(file_index, "force-app/main/default/lwc", ".js-meta.xml")
+        file_pattern_locations = [p for p in file_pattern_locations if not p.startswith("force-app/")]
+
     if file_pattern_locations and len(file_pattern_locations) > 0:
         for pattern in file_pattern_locations:
             file_list += glob.glob(pattern, recursive=True)
@@ -666,11 +791,17 @@ def upsert_gitignore_entries(list_entries) -> bool:
     return True
 
 
-def check_permset_group_files():
+def check_permset_group_files(file_index: Optional[list] = None):
     """
     Checks Permission Set Group Metadata Files and ensures they are set as 'Outdated'. This ensures they are recalculated upon deployment to an org.
+
+    Args:
+        file_index (list(str)): Optional file index from scan_project_files(). When not provided, the project is scanned.
     """
-    psg_files = glob.glob("force-app/main/default/permissionsetgroups/**/*.permissionsetgroup-meta.xml", recursive=True)
+    if file_index is not None:
+        psg_files = filter_project_files(file_index, "force-app/main/default/permissionsetgroups", ".permissionsetgroup-meta.xml")
+    else:
+        psg_files = glob.glob("force-app/main/default/permissionsetgroups/**/*.permissionsetgroup-meta.xml", recursive=True)
     if len(psg_files) > 0:
         log.info("Checking Permission Set Group File(s)")
         for psg in psg_files:
@@ -856,12 +987,13 @@ def assign_prefix_to_files(prefix, parent_folder='force-app/main/default', inter
         print(f"FILE OR FOLDER RENAMED:\n    Previous Path: {path_to_update}\n    New Path: {new_updated_path}")
 
 
-def create_external_id_field(file_path: str = None):
+def create_external_id_field(file_path: str = None, file_index: Optional[list] = None):
     """
     Creates External ID Fields for a given list of Object Names. If no file is provided, this will generate External ID fields on all objects within the current project directory.
 
     Args:
         file_path (str): Relative Path within Project to a .txt file containing a list of objects to process. If not provided, will generate a list of objects from the current project.
+        file_index (list(str)): Optional file index from scan_project_files(), used to find the project objects instead of listing the objects folder.
     """
 
     object_list = []
@@ -871,6 +1003,11 @@ def create_external_id_field(file_path: str = None):
             for line in file:
                 if line and len(line) > 1:
                     object_list.append(line.strip())
+    elif file_index is not None:
+        for object_file in filter_project_files(file_index, "force-app/main/default/objects"):
+            obj = object_file.split("/")[4]
+            if obj not in object_list:
+                object_list.append(obj)
     else:
         for obj in os.listdir("force-app/main/default/objects"):
             object_list.append(obj)
@@ -1331,14 +1468,20 @@ def generate_stack_view(parent_directory_path='.cci/projects', output="terminal"
     if output != "terminal":
         log_file.close()
 
-def remove_empty_translations():
+def remove_empty_translations(file_index: Optional[list] = None):
     
     """
     Removes empty translations from the project directory. Defaults to the force-app/main/default/objectTranslations directory.
+
+    Args:
+        file_index (list(str)): Optional file index from scan_project_files(). Used to skip the check when the project has no translations.
     """
 
     # Define the path to the objectTranslations directory
     obj_trans_dir = os.path.join('force-app', 'main', 'default', 'objectTranslations')
+
+    if file_index is not None and not filter_project_files(file_index, obj_trans_dir):
+        return
     
     # Loop through all subdirectories in the objectTranslations directory
     for obj_dir in os.listdir(obj_trans_dir):
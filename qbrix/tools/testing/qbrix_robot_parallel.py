@@ -0,0 +1,155 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cumulusci.core.exceptions import CommandException
+from cumulusci.core.tasks import BaseTask
+
+SERIAL_TAG = "serial"
+OUTPUT_DIR = os.path.join("robot", "parallel")
+
+
+class ParallelRobot(BaseTask):
+    salesforce_task = True
+
+    task_docs = """
+    Runs Q Robot suites across several worker processes, each with its own browser, and merges the results into one report.
+
+    Tests are shared out round-robin across the workers. Tests tagged with the serialtag (default: serial) are run afterwards in a single worker, for tests which change org wide settings.
+    The first worker to log in saves its browser session so the other workers can skip the login. QRobot picks this up from the QROBOT_STORAGE_STATE variable.
+
+    Example: cci task run robot_parallel --suites qbrix_local/robot/tests --processes 4 --org dev
+    """
+
+    task_options = {
+        "suites": {
+            "description": "Path to the robot file or folder of robot files to run",
+            "required": True
+        },
+        "processes": {
+            "description": "Number of worker processes to run at once. Defaults to 4",
+            "required": False,
+            "default": 4
+        },
+        "serialtag": {
+            "description": "Tests with this tag are run one at a time after the parallel run. Defaults to serial",
+            "required": False,
+            "default": SERIAL_TAG
+        },
+        "vars": {
+            "description": "Comma separated list of name:value variables passed to each worker, for example browser:headlesschrome",
+            "required": False
+        },
+        "outputdir": {
+            "description": "Folder for the merged results. Defaults to robot/parallel",
+            "required": False
+        }
+    }
+
+    def _prepruntime(self):
+        self.suites = self.options["suites"]
+        self.processes = max(1, int(self.options.get("processes") or 4))
+        self.serialtag = str(self.options.get("serialtag") or SERIAL_TAG).lower()
+        self.outputdir = os.path.abspath(self.options.get("outputdir") or OUTPUT_DIR)
+        self.vars = []
+        if self.options.get("vars"):
+            self.vars = [v.strip() for v in str(self.options["vars"]).split(",") if v.strip()]
+        self.storagestate = None
+        self.outputlock = threading.Lock()
+
+    def _collecttests(self):
+        """Returns the (parallel, serial) test names found in the suites"""
+        from robot.api import TestSuiteBuilder
+
+        parallel_tests = []
+        serial_tests = []
+        pending = [TestSuiteBuilder().build(self.suites)]
+        while pending:
+            suite = pending.pop()
+            for test in suite.tests:
+                if self.serialtag in [str(tag).lower() for tag in test.tags]:
+                    serial_tests.append(test.longname)
+                else:
+                    parallel_tests.append(test.longname)
+            pending.extend(reversed(list(suite.suites)))
+
+        return parallel_tests, serial_tests
+
+    def _runworker(self, workername, tests):
+        """Runs the given tests in a robot process and returns the path to its output file"""
+        workerdir = os.path.join(self.outputdir, workername)
+        os.makedirs(workerdir, exist_ok=True)
+
+        command = [
+            sys.executable, "-m", "robot",
+            "--outputdir", workerdir,
+            "--report", "NONE",
+            "--log", "NONE",
+            "--variable", f"org:{self.org_config.name}",
+            "--variable", f"QROBOT_STORAGE_STATE:{self.storagestate}",
+        ]
+        for variable in self.vars:
+            command.extend(["--variable", variable])
+        for test in tests:
+            command.extend(["--test", test])
+        command.append(self.suites)
+
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+        for line in process.stdout:
+            with self.outputlock:
+                self.logger.info(f"[{workername}] {line.rstrip()}")
+        process.wait()
+
+        output = os.path.join(workerdir, "output.xml")
+        if not os.path.isfile(output):
+            raise CommandException(f"Robot worker {workername} did not produce any results (exit code {process.returncode})")
+        return output
+
+    def _run_task(self):
+        self._prepruntime()
+        os.makedirs(self.outputdir, exist_ok=True)
+
+        # The saved session holds live org cookies, so it is kept outside the project and removed after the run
+        sessiondir = tempfile.mkdtemp(prefix="qrobot_session_")
+        self.storagestate = os.path.join(sessiondir, "storage_state.json")
+        try:
+            self._runtests()
+        finally:
+            shutil.rmtree(sessiondir, ignore_errors=True)
+
+    def _runtests(self):
+        parallel_tests, serial_tests = self._collecttests()
+        if not parallel_tests and not serial_tests:
+            raise CommandException(f"No robot tests found in {self.suites}")
+
+        self.logger.info(f"Found {len(parallel_tests)} parallel and {len(serial_tests)} serial test(s)")
+
+        outputs = []
+        if parallel_tests:
+            # The first test logs in and saves the browser session for the other workers
+            outputs.append(self._runworker("login", parallel_tests[:1]))
+            remaining = parallel_tests[1:]
+            workercount = min(self.processes, len(remaining))
+            if workercount:
+                shards = [remaining[i::workercount] for i in range(workercount)]
+                with ThreadPoolExecutor(max_workers=workercount) as executor:
+                    futures = [executor.submit(self._runworker, f"worker{i + 1}", shard) for i, shard in enumerate(shards)]
+                    outputs.extend(future.result() for future in futures)
+
+        if serial_tests:
+            outputs.append(self._runworker("serial", serial_tests))
+
+        # Merge the worker results into a single report
+        result = subprocess.run(
+            [sys.executable, "-m", "robot.rebot", "--outputdir", self.outputdir, "--output", "output.xml", "--name", "Q Robot"] + outputs,
+            capture_output=True,
+            text=True
+        )
+        self.logger.info(f"Merged results saved to {self.outputdir}")
+
+        if result.returncode != 0:
+            raise CommandException(f"{result.returncode} robot test(s) failed. See {os.path.join(self.outputdir, 'report.html')}")
@@ -5,6 +5,10 @@ import time
 import subprocess
 import requests
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode
 
 from cumulusci.core.config import ScratchOrgConfig
 from cumulusci.tasks.sfdx import SFDXBaseTask
@@ -13,6 +17,114 @@ from cumulusci.core.keychain import BaseProjectKeychain
 
 LOAD_COMMAND = "sfdx apex run "
 
+# scheduled jobs never finish and batch workers are tracked through their parent batch
+TRACKED_JOB_TYPES = "('BatchApex','Queueable','Future')"
+JOB_POLL_INITIAL_SECONDS = 2
+JOB_POLL_MAX_SECONDS = 30
+# executeAnonymous takes the apex as a query parameter, so larger scripts are run from the file with sfdx
+MAX_ANONYMOUS_URL_LENGTH = 8000
+
+
+class AnonymousApexRunner:
+    """
+    Runs anonymous Apex in process through the Tooling executeAnonymous endpoint and tracks the async jobs it enqueues.
+    """
+
+    def __init__(self, instanceurl, accesstoken, apiversion, logger, sfdxsetup=None):
+        self.instanceurl = instanceurl
+        self.apiversion = apiversion
+        self.logger = logger
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {accesstoken}"})
+        self.accesstoken = accesstoken
+        self._userid = None
+        # sfdx only accepts an access token as the username once the instance url has been configured
+        self._sfdxsetup = sfdxsetup
+
+    def _get(self, path, **params):
+        response = self.session.get(f"{self.instanceurl}/services/data/v{self.apiversion}/{path}", params=params)
+        response.raise_for_status()
+        return response
+
+    def query(self, soql):
+        return self._get("query", q=soql).json()
+
+    def servertime(self):
+        """Returns the org server time, used as the starting point when looking for enqueued jobs"""
+        response = self._get("limits")
+        return parsedate_to_datetime(response.headers["Date"]) - timedelta(seconds=1)
+
+    @property
+    def userid(self):
+        if self._userid is None:
+            response = self.session.get(f"{self.instanceurl}/services/oauth2/userinfo")
+            response.raise_for_status()
+            self._userid = response.json()["user_id"]
+        return self._userid
+
+    def execute(self, filepath, cwd=None):
+        """Runs the anonymous apex in the given file and returns True when it compiled and ran successfully"""
+        with open(os.path.join(cwd, filepath) if cwd else filepath, "r") as apexfile:
+            apexbody = apexfile.read()
+
+        url = f"{self.instanceurl}/services/data/v{self.apiversion}/tooling/executeAnonymous"
+        if len(url) + len(urlencode({"anonymousBody": apexbody})) + 1 > MAX_ANONYMOUS_URL_LENGTH:
+            result = self._execute_via_sfdx(filepath, cwd)
+        else:
+            result = self._get("tooling/executeAnonymous", anonymousBody=apexbody).json()
+        self.logger.info(result)
+
+        if not result["compiled"]:
+            self.logger.error(f"Apex Script {filepath} failed to compile: {result['compileProblem']}")
+        elif not result["success"]:
+            self.logger.error(f"Apex Script {filepath} failed: {result['exceptionMessage']}")
+
+        return result["compiled"] and result["success"]
+
+    def _execute_via_sfdx(self, filepath, cwd=None):
+        """Runs the apex file with sfdx, returning the result in the same shape as executeAnonymous"""
+        self.logger.info(f"Apex Script {filepath} is too large to send through the API, running it with sfdx")
+        if self._sfdxsetup:
+            self._sfdxsetup()
+            self._sfdxsetup = None
+        resp = subprocess.run([f"{LOAD_COMMAND} -f {filepath} -u {self.accesstoken} --json"], shell=True, capture_output=True, cwd=cwd)
+
+        try:
+            jsonresult = json.loads(resp.stdout)
+        except ValueError:
+            jsonresult = {"message": resp.stderr.decode("utf-8") if resp.stderr else resp.stdout}
+
+        result = jsonresult.get("result") or {}
+        return {
+            "compiled": bool(result.get("compiled")),
+            "success": bool(result.get("success")),
+            "compileProblem": result.get("compileProblem") or jsonresult.get("message"),
+            "exceptionMessage": result.get("exceptionMessage") or jsonresult.get("message")
+        }
+
+    def wait_for_jobs(self, since: datetime, timeout):
+        """Waits until every async job the running user enqueued since the given time has finished"""
+        soql = (f"SELECT Id, Status FROM AsyncApexJob WHERE CreatedById = '{self.userid}' "
+                f"AND CreatedDate >= {since.strftime('%Y-%m-%dT%H:%M:%SZ')} AND JobType IN {TRACKED_JOB_TYPES} "
+                "AND Status NOT IN ('Completed','Failed','Aborted')")
+
+        deadline = time.time() + timeout
+        interval = JOB_POLL_INITIAL_SECONDS
+
+        while True:
+            # chained jobs are picked up as well, as they are created after the starting point
+            running = self.query(soql)["records"]
+            if len(running) == 0:
+                return True
+
+            if time.time() >= deadline:
+                self.logger.error(f"{len(running)} Apex jobs still running after {timeout} seconds")
+                return False
+
+            self.logger.info(f"Waiting on {len(running)} Apex jobs...")
+            time.sleep(min(interval, max(1, deadline - time.time())))
+            interval = min(interval * 2, JOB_POLL_MAX_SECONDS)
+
 
 class BatchAnonymousApex(SFDXBaseTask):
     keychain_class = BaseProjectKeychain
@@ -24,7 +136,19 @@ class BatchAnonymousApex(SFDXBaseTask):
     task_options = {
 
         "filepaths": {
-            "description": "When mode is set to File, each file is executed in order",
+            "description": "When mode is set to File, each file is executed in order. Entries can also be set as {path: file, order: n}, where files with the same order run at the same time",
+            "required": False
+        },
+        "maxparallel": {
+            "description": "Maximum number of scripts with the same order to run at the same time. Default is 4",
+            "required": False
+        },
+        "waitforjobs": {
+            "description": "When True, waits for the async jobs enqueued by each script (or group of scripts) to finish before moving on. Default is False",
+            "required": False
+        },
+        "jobtimeout": {
+            "description": "Maximum number of seconds to wait for enqueued jobs. Default is 600",
             "required": False
         },
         "org": {
@@ -106,20 +230,46 @@ class BatchAnonymousApex(SFDXBaseTask):
             self.filepaths = []
             self.logger.info("No File Paths provided")
 
+        self.maxparallel = int(self.options.get("maxparallel") or 4)
+        self.waitforjobs = str(self.options.get("waitforjobs", False)).lower() == "true"
+        self.jobtimeout = int(self.options.get("jobtimeout") or 600)
+
+        self.apexrunner = AnonymousApexRunner(self.instanceurl, self.accesstoken,
+                                              self.project_config.project__package__api_version or "57.0", self.logger,
+                                              sfdxsetup=lambda: self._setprojectdefaults(self.instanceurl))
+
+    def _get_script_groups(self):
+        # plain file paths keep running one after another, entries sharing an order key run together
+        groups = {}
+        for i, v in enumerate(self.filepaths):
+            if isinstance(v, dict):
+                groups.setdefault(float(v.get("order", i)), []).append(v["path"])
+            else:
+                groups.setdefault(float(i), []).append(v)
+
+        return [groups[k] for k in sorted(groups)]
+
+    def _run_script(self, filepath):
+        if os.path.isfile(os.path.join(self.options.get("dir") or "", filepath)):
+            self.logger.info(f'Running Apex Script in {filepath}')
+            return self.apexrunner.execute(filepath, cwd=self.options.get("dir"))
+
+        self.logger.error(f"File path {filepath} is not a valid file")
+        return False
+
     def _run_task(self):
 
         self._prepruntime(self)
-        self._setprojectdefaults(self.instanceurl)
 
         if hasattr(self, "filepaths") and self.filepaths is not None:
-            for i, v in enumerate(self.filepaths):
-                if os.path.isfile(v):
-                    runthiscmd = f"{LOAD_COMMAND} -f {v} -u {self.accesstoken} --json"
-                    self.logger.info(f'Running Apex Script in {v}')
-                    resp = subprocess.run([runthiscmd], shell=True, capture_output=True, cwd=self.options.get("dir"))
-                    self.logger.info(resp.stdout)
-                else:
-                    self.logger.error(f"File path {v} is not a valid file")
+            with ThreadPoolExecutor(max_workers=max(1, self.maxparallel)) as executor:
+                for group in self._get_script_groups():
+                    since = self.apexrunner.servertime() if self.waitforjobs else None
+
+                    list(executor.map(self._run_script, group))
+
+                    if self.waitforjobs:
+                        self.apexrunner.wait_for_jobs(since, self.jobtimeout)
 
     def _handle_returncode(self, returncode, stderr):
         if returncode:
@@ -266,49 +416,52 @@ class RunAnonymousApexAndWait(SFDXBaseTask):
         else:
             self.waitscript = None
 
+        self.maxwaithchecks = int(self.maxwaithchecks)
+        self.apexrunner = AnonymousApexRunner(self.instanceurl, self.accesstoken,
+                                              self.project_config.project__package__api_version or "57.0", self.logger,
+                                              sfdxsetup=lambda: self._setprojectdefaults(self.instanceurl))
+
     def _run_task(self):
 
         self._prepruntime(self)
-        self._setprojectdefaults(self.instanceurl)
 
         if hasattr(self, "filepath") and self.filepath is not None:
             
             if os.path.isfile(self.filepath):
-                runthiscmd = f"{LOAD_COMMAND} -f {self.filepath} -u {self.accesstoken} --json"
                 self.logger.info(f'Running Apex Script in {self.filepath}')
-                resp = subprocess.run([runthiscmd], shell=True, capture_output=True, cwd=self.options.get("dir"))
-                time.sleep(self.waitseconds)
-                if hasattr(self, "exitonsoqlzero") and self.exitonsoqlzero is not None:    
-                    while(self.maxwaithchecks>0):
-    
-                        if(self._is_zero_count(self.exitonsoqlzero)):
-                            time.sleep(30)
-                            if(self._is_zero_count(self.exitonsoqlzero)):
-                                self.maxwaithchecks=0
-                                continue
-                            
+                since = self.apexrunner.servertime()
+                self.apexrunner.execute(self.filepath, cwd=self.options.get("dir"))
+
+                # one deadline covers both the enqueued jobs and the soql check
+                deadline = time.time() + self.waitseconds * max(1, self.maxwaithchecks)
+
+                # the jobs enqueued by the script are tracked instead of sleeping for a fixed time
+                self.apexrunner.wait_for_jobs(since, max(0, deadline - time.time()))
+
+                if hasattr(self, "exitonsoqlzero") and self.exitonsoqlzero is not None:
+                    interval = JOB_POLL_INITIAL_SECONDS
+
+                    while(not self._is_zero_count(self.exitonsoqlzero)):
+
+                        if time.time() >= deadline:
+                            break
+
                         #if we want to run a scropt per wait
                         if(self.waitscript):
-                            runthiscmd = f"{LOAD_COMMAND} -f {self.waitscript} -u {self.accesstoken} --json"
                             self.logger.info(f'Running Additional Wait Apex Script in {self.waitscript}')
-                            resp = subprocess.run([runthiscmd], shell=True, capture_output=True, cwd=self.options.get("dir"))
-                            
-                        self.maxwaithchecks=self.maxwaithchecks-1
-                        time.sleep(self.waitseconds)
+                            waitsince = self.apexrunner.servertime()
+                            self.apexrunner.execute(self.waitscript, cwd=self.options.get("dir"))
+                            self.apexrunner.wait_for_jobs(waitsince, max(1, deadline - time.time()))
+
+                        time.sleep(min(interval, max(1, deadline - time.time())))
+                        interval = min(interval * 2, self.waitseconds)
                             
             else:
                 self.logger.error(f"File path {self.filepath} is not a valid file")
                 
                 
     def _is_zero_count(self,soql):
-        modsoql=soql.replace(" ","+")
-        url = f"{self.instanceurl}/services/data/v56.0/query/?q={modsoql}"
-        headers = {
-            'Authorization': f'Bearer {self.accesstoken}',
-            'Content-Type': 'application/json'
-        }
-        response = requests.request("GET", url, headers=headers)
-        data = json.loads(response.text)
+        data = self.apexrunner.query(soql)
         self.logger.info(data)
         return data["records"][0]["expr0"] == 0
     
@@ -6,6 +6,7 @@ import subprocess
 import keyring
 import hashlib
 import shutil
+import requests
 
 from abc import abstractmethod
 
@@ -134,10 +135,7 @@ class OmniscriptAlign(Command):
     def _run_task(self):
         self._prepruntime()
         self.create_working_area(self.accesstoken)
-        
-        self.retrieve_metadata(self.accesstoken)
-        self.prune_content(self.accesstoken)
-        
+
         targetnamespace = self.determinenamespace(self.accesstoken)
         oslist = self.getoslist(self.accesstoken, targetnamespace)
 
@@ -152,20 +150,33 @@ class OmniscriptAlign(Command):
         mergeoslist = oslist | omniprocesslist
         
         self.logger.info(f"OS List Size:{len(mergeoslist)}")
+
+        # only the LWCs generated for active OmniScripts are retrieved
+        lwcnames = self.getoslwcnames(mergeoslist)
+        self.logger.info(f"OS LWC List Size:{len(lwcnames)}")
+
+        self.retrieve_metadata(self.accesstoken, lwcnames)
+        self.prune_content(self.accesstoken)
+
         if len(mergeoslist) > 0:
             self.updatelwcsondisk(self.accesstoken, mergeoslist)
 
-        self._push_metadata()
-    def _push_metadata(self):
-        self.logger.info(f'Starting Push of OmniUICards...')
-        self.push_omniuicard_metadata(self.accesstoken)
-        self.logger.info(f'Completed Push of OmniUICards...')
-        self.logger.info(f'Starting Push of OmniScripts...')
-        self.push_omniscript_metadata(self.accesstoken)
-        self.logger.info(f'Completed Push of OmniScripts...')
-        self.logger.info(f'Starting Push of LWCs...')
-        self.push_lwcs(self.accesstoken)
-        self.logger.info(f'Completed Push of LWCs...')
+        self._push_metadata(mergeoslist)
+
+    def _push_metadata(self, oslist=None):
+        self.logger.info(f'Starting Push of OmniUICards and OmniScripts...')
+        self.push_omni_metadata(self.accesstoken)
+        self.logger.info(f'Completed Push of OmniUICards and OmniScripts...')
+
+        changedlwcs = [x for x in (oslist or {}).values() if x.updated]
+        if len(changedlwcs) == 0:
+            self.logger.info(f'No LWCs changed. Skipping Push of LWCs...')
+        else:
+            self.logger.info(f'Starting Push of {len(changedlwcs)} LWCs...')
+            self.push_lwcs(self.accesstoken, [x.disklocation for x in changedlwcs])
+            self.logger.info(f'Completed Push of LWCs...')
+
+        self.save_alignment_manifest(self.accesstoken, oslist or {})
 
     def _handle_returncode(self, returncode, stderr):
         if returncode:
@@ -192,9 +203,11 @@ class OmniscriptAlign(Command):
         hashname = hashlib.md5(username.encode()).hexdigest()
         qbrixtempdir = self.getqbrixdir(hashname)
 
-        # whack any existing dir to get ensure latest is pulled
-        if (os.path.isdir(qbrixtempdir)):
-            shutil.rmtree(qbrixtempdir)
+        # the project is kept between runs, only previously retrieved source is cleared to ensure latest is pulled
+        if (os.path.isfile(f"{qbrixtempdir}/sfdx-project.json")):
+            shutil.rmtree(f"{qbrixtempdir}/force-app", ignore_errors=True)
+            os.makedirs(f"{qbrixtempdir}/force-app/main/default", exist_ok=True)
+            return
 
         subprocess.run([f"sfdx force:project:create --projectname {hashname} --json"], shell=True, capture_output=True,
                        cwd=".qbrix")
@@ -207,20 +220,32 @@ class OmniscriptAlign(Command):
                        cwd=qbrixtempdir)
 
     
-    def retrieve_metadata(self, username: str):
+    def retrieve_metadata(self, username: str, lwcnames=None):
 
-        """Get all the Metadata locally."""
+        """Get all the Metadata locally. When lwcnames is given, only those LWCs are retrieved."""
 
         try:
 
             hashname = hashlib.md5(username.encode()).hexdigest()
             qbrixtempdir = self.getqbrixdir(hashname)
 
-            targetTypes =f"OmniScript,OmniUiCard,LightningComponentBundle"
-            #targetTypes =f"LightningComponentBundle:enrollPatientSvcProgramPatientServicesEnglish"
+            if lwcnames is None:
+                targetTypes = f"-m OmniScript,OmniUiCard,LightningComponentBundle"
+            else:
+                lwcmembers = "".join(f"<members>{x}</members>" for x in lwcnames)
+                lwctype = f"<types>{lwcmembers}<name>LightningComponentBundle</name></types>" if lwcnames else ""
+
+                with open(f"{qbrixtempdir}/qbrixalign-package.xml", "w") as tmpFile:
+                    tmpFile.write('<?xml version="1.0" encoding="UTF-8"?><Package xmlns="http://soap.sforce.com/2006/04/metadata">'
+                                  f'<types><members>*</members><name>OmniScript</name></types>'
+                                  f'<types><members>*</members><name>OmniUiCard</name></types>'
+                                  f'{lwctype}<version>{self.getapiversion()}</version></Package>')
+
+                targetTypes = f"-x qbrixalign-package.xml"
+
             # now we need to inject a sfdx session and into the cci runtimee for that temp dir
             subprocess.run([
-                               f"export SFDX_ACCESS_TOKEN='{self.accesstoken}' && sfdx force:auth:accesstoken:store --instanceurl {self.instanceurl} -a {hashname} --noprompt --json --loglevel DEBUG  && sfdx force:source:retrieve -u {hashname} -m {targetTypes}"],
+                               f"export SFDX_ACCESS_TOKEN='{self.accesstoken}' && sfdx force:auth:accesstoken:store --instanceurl {self.instanceurl} -a {hashname} --noprompt --json --loglevel DEBUG  && sfdx force:source:retrieve -u {hashname} {targetTypes}"],
                            shell=True, capture_output=True, cwd=qbrixtempdir)
                         
         except BaseException as err:
@@ -278,21 +303,46 @@ class OmniscriptAlign(Command):
         except BaseException as err:
             self.logger.error(f"Pull LWCs-> Unexpected {err}")
 
-    def push_lwcs(self, username: str):
+    def push_lwcs(self, username: str, lwcfolders=None):
 
-        """Push up the modified LWCs back up to the org."""
+        """Push up the modified LWCs back up to the org. When lwcfolders is given, only those LWCs are deployed."""
 
         try:
 
             hashname = hashlib.md5(username.encode()).hexdigest()
             qbrixtempdir = self.getqbrixdir(hashname)
 
+            targetsource = "-m LightningComponentBundle"
+            if lwcfolders is not None:
+                if len(lwcfolders) == 0:
+                    return
+                sourcepaths = ",".join(os.path.relpath(x, qbrixtempdir) for x in lwcfolders)
+                targetsource = f"-p \"{sourcepaths}\""
+
             # now we need to inject a sfdx session and into the cci runtimee for that temp dir
-            subprocess.run([f"sfdx force:source:deploy -u {hashname} -m LightningComponentBundle"], shell=True,
+            result = subprocess.run([f"sfdx force:source:deploy -u {hashname} {targetsource}"], shell=True,
                            capture_output=True, cwd=qbrixtempdir)
+            self.lwcdeploysucceeded = result.returncode == 0
 
         except BaseException as err:
+            self.lwcdeploysucceeded = False
             self.logger.error(f"Pull LWCs-> Unexpected {err}")
+
+    def push_omni_metadata(self, username: str):
+
+        """Push up the OmniUiCard and OmniScript Metadata back up to the org in a single deploy."""
+
+        try:
+
+            hashname = hashlib.md5(username.encode()).hexdigest()
+            qbrixtempdir = self.getqbrixdir(hashname)
+
+            # now we need to inject a sfdx session and into the cci runtimee for that temp dir
+            subprocess.run([f"sfdx force:source:deploy -u {hashname} -m OmniUiCard,OmniScript"], shell=True,
+                           capture_output=True, cwd=qbrixtempdir)
+
+        except BaseException as err:
+            self.logger.error(f"Push OmniScript-> Unexpected {err}")
             
             
     ###
@@ -380,26 +430,16 @@ class OmniscriptAlign(Command):
     def getoslist(self, username: str, namespaceprefix: str):
         """Get the list of all OmniScripts to use for matching."""
 
-        result = None
-
-        hashname = hashlib.md5(username.encode()).hexdigest()
-        qbrixtempdir = self.getqbrixdir(hashname)
-
         if namespaceprefix != "omnistudio":
-            result = subprocess.run([
-                f"sfdx force:data:soql:query -u {username} -q \"SELECT Id,Name,{namespaceprefix}__type__c,{namespaceprefix}__subtype__c,{namespaceprefix}__Language__c FROM {namespaceprefix}__Omniscript__c where {namespaceprefix}__IsActive__c=true and {namespaceprefix}__IsLwcEnabled__c=true and {namespaceprefix}__IsProcedure__c=false \" --json"],
-                shell=True, capture_output=True, cwd=qbrixtempdir)
+            records = self.query(f"SELECT Id,Name,{namespaceprefix}__type__c,{namespaceprefix}__subtype__c,{namespaceprefix}__Language__c FROM {namespaceprefix}__Omniscript__c where {namespaceprefix}__IsActive__c=true and {namespaceprefix}__IsLwcEnabled__c=true and {namespaceprefix}__IsProcedure__c=false ")
 
         else:
-            result = subprocess.run([
-                f"sfdx force:data:soql:query -u {username} -q \"SELECT Id,Name,Type,SubType,Language FROM OmniProcess  where IsActive=true and IsWebCompEnabled=true and IsTestProcedure=false \" --json"],
-                shell=True, capture_output=True, cwd=qbrixtempdir)
+            records = self.query(f"SELECT Id,Name,Type,SubType,Language FROM OmniProcess  where IsActive=true and IsWebCompEnabled=true and IsTestProcedure=false ")
 
-        jsondata = json.loads(result.stdout)
         oslistdata = {}
 
         # todo: move out to seperate method
-        for token in jsondata["result"]["records"]:
+        for token in records:
             if namespaceprefix != "omnistudio":
 
                 try:
@@ -420,28 +460,95 @@ class OmniscriptAlign(Command):
 
         return oslistdata
 
+    def getoslwcnames(self, oslist):
+        """Get the API names of the LWCs in the org which belong to the given OmniScripts."""
+
+        if oslist is None or len(oslist) == 0:
+            return []
+
+        try:
+            records = self.query("SELECT DeveloperName FROM LightningComponentBundle", tooling=True)
+        except Exception as e:
+            self.logger.error(e)
+            return []
+
+        return [x["DeveloperName"] for x in records if x["DeveloperName"].lower() in oslist]
+
     ###
     #
     ###
     def determinenamespace(self, username: str):
 
+        try:
+            records = self.query("SELECT NamespacePrefix FROM PackageLicense where NamespacePrefix in ('omnistudio','vlocity_cmt','vlocity_ps','vlocity_ins') LIMIT 1")
+        except Exception as e:
+            self.logger.error(e)
+            return "omnistudio"
+
+        if len(records) == 1:
+            return records[0]["NamespacePrefix"]
+
+        # fallback
+        return "omnistudio"
+
+    def getapiversion(self):
+        return self.project_config.project__package__api_version or "57.0"
+
+    def query(self, soql: str, tooling=False):
+        """Runs the SOQL query in process against the org and returns all records."""
+
+        headers = {"Authorization": f"Bearer {self.accesstoken}"}
+        endpoint = "tooling/query" if tooling else "query"
+
+        response = requests.get(f"{self.instanceurl}/services/data/v{self.getapiversion()}/{endpoint}",
+                                headers=headers, params={"q": soql})
+        response.raise_for_status()
+        jsondata = response.json()
+        records = jsondata["records"]
+
+        while not jsondata.get("done", True) and jsondata.get("nextRecordsUrl"):
+            response = requests.get(f"{self.instanceurl}{jsondata['nextRecordsUrl']}", headers=headers)
+            response.raise_for_status()
+            jsondata = response.json()
+            records.extend(jsondata["records"])
+
+        return records
+
+    def getalignmentmanifest(self, username: str):
+        """Loads the hashes of the _def.js files aligned by the last run."""
+
         hashname = hashlib.md5(username.encode()).hexdigest()
-        qbrixtempdir = self.getqbrixdir(hashname)
+        manifestfile = f"{self.getqbrixdir(hashname)}/qbrixalign-manifest.json"
 
-        result = subprocess.run([
-            f"sfdx force:data:soql:query -u {username} -q \"SELECT NamespacePrefix FROM PackageLicense where NamespacePrefix in ('omnistudio','vlocity_cmt','vlocity_ps','vlocity_ins') LIMIT 1\" --json"],
-            shell=True, capture_output=True, cwd=qbrixtempdir)
+        if not os.path.isfile(manifestfile):
+            return {}
 
-        if result is None: return "omnistudio"
+        try:
+            with open(manifestfile, "r") as tmpFile:
+                return json.load(tmpFile)
+        except Exception:
+            return {}
 
-        print(result.stdout)
-        jsonresult = json.loads(result.stdout)
+    def save_alignment_manifest(self, username: str, oslist):
+        """Records the hashes of the aligned _def.js files once they have been deployed."""
 
-        if jsonresult["result"]["totalSize"] == 1:
-            return jsonresult["result"]["records"][0]["NamespacePrefix"]
+        if not getattr(self, "lwcdeploysucceeded", True):
+            return
 
-        # fallback
-        return "omnistudio"
+        hashname = hashlib.md5(username.encode()).hexdigest()
+        manifest = self.getalignmentmanifest(username)
+
+        for omniscript in oslist.values():
+            deffile = f"{omniscript.disklocation}/{omniscript.foldername}_def.js"
+            if omniscript.disklocation and os.path.isfile(deffile):
+                manifest[omniscript.foldername] = {"id": omniscript.id, "hash": self.gethash(deffile)}
+
+        with open(f"{self.getqbrixdir(hashname)}/qbrixalign-manifest.json", "w") as tmpFile:
+            json.dump(manifest, tmpFile)
+
+    def gethash(self, filepath: str):
+        with open(filepath, "rb") as tmpFile:
+            return hashlib.sha256(tmpFile.read()).hexdigest()
 
     def updatelwcsondisk(self, username: str, oslist):
         if oslist is None or len(oslist) == 0: return;
@@ -449,6 +556,7 @@ class OmniscriptAlign(Command):
 
             hashname = hashlib.md5(username.encode()).hexdigest()
             qbrixtempdir = self.getqbrixdir(hashname)
+            manifest = self.getalignmentmanifest(username)
             #self.logger.info(oslist.keys())
             for i in os.listdir(f"{qbrixtempdir}/force-app/main/default/lwc"):
                 #self.logger.info(f"Checking for : {i}")
@@ -461,8 +569,19 @@ class OmniscriptAlign(Command):
                     #self.logger.info(oslist[f"{i}".lower()].disklocation)
                     #self.logger.info(oslist[f"{i}".lower()].foldername)
 
+                    omniscript = oslist[f"{i}".lower()]
+                    deffile = f"{omniscript.disklocation}/{omniscript.foldername}_def.js"
+                    if not os.path.isfile(deffile):
+                        continue
+
+                    # skip files which are exactly what the last run aligned and deployed
+                    originalhash = self.gethash(deffile)
+                    if manifest.get(i) == {"id": omniscript.id, "hash": originalhash}:
+                        continue
+
                     try:
-                        self.updateoslwcid(oslist[f"{i}".lower()])
+                        self.updateoslwcid(omniscript)
+                        omniscript.updated = self.gethash(deffile) != originalhash
                     except Exception as e:
                         self.logger.error(e)
 
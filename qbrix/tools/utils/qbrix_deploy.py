@@ -1,4 +1,5 @@
 from genericpath import isfile
+import hashlib
 import json
 import os
 import re
@@ -11,11 +12,12 @@ from abc import abstractmethod
 from time import sleep
 
 import yaml
-from cumulusci.core.config import ScratchOrgConfig
+from cumulusci.core.config import ScratchOrgConfig, SfdxOrgConfig
 from cumulusci.tasks.sfdx import SFDXBaseTask
 from cumulusci.core.exceptions import TaskOptionsError
 from cumulusci.core.exceptions import CommandException
 from cumulusci.core.keychain import BaseProjectKeychain
+from qbrix.tools.shared.qbrix_cci_tasks import run_cci_flow, run_cci_task
 
 LOAD_COMMAND = "sfdx force:apex:execute "
 
@@ -116,45 +118,39 @@ class Deploy(SFDXBaseTask):
             self.instanceurl = self.instanceurl.rstrip(self.instanceurl[-1])
 
 
+    def _get_target_org_config(self):
+        """Returns the org config to deploy to, registering the access token with sfdx and the keychain when it differs from the current org"""
+
+        if self.accesstoken == self.org_config.access_token and self.instanceurl == self.org_config.instance_url.rstrip('/'):
+            return self.org_config
+
+        hashedalias = "cciorg" + hashlib.sha256(self.accesstoken.encode("utf-8")).hexdigest()[:12]
+
+        # sfdx based tasks within the flow need the org stored under an sfdx alias
+        env = dict(os.environ, SFDX_ACCESS_TOKEN=self.accesstoken)
+        sfdximport = subprocess.run(["sfdx", "force:auth:accesstoken:store", "--instanceurl", self.instanceurl, "-a", hashedalias, "--noprompt", "--json"], env=env, capture_output=True, text=True)
+        if sfdximport.returncode != 0:
+            raise CommandException(f"Unable to store the access token for {self.instanceurl}: {sfdximport.stdout or sfdximport.stderr}")
+
+        # Equivalent of cci org import, without starting a new cci process
+        org_config = SfdxOrgConfig({"username": hashedalias, "sfdx": True}, hashedalias, self.project_config.keychain, global_org=False)
+        self.project_config.keychain.set_org(org_config, False)
+        return org_config
+
     def _deployqbrix(self):
-        
-        #self.logger.info(f'ENTRYPOINT::{self.entrypoint}')
-        #self.logger.info(f'ENTRYPOINTTYPE::{self.entrypointtype}')
-        #self.logger.info(f'TARGETORG::{self.cciorg}')
-        
-        orglist=subprocess.run([f"cci org list"], shell=True, capture_output=True)
-        #self.logger.info(orglist)
-        srvclist=subprocess.run([f"cci service list"], shell=True, capture_output=True)
-        #self.logger.info(srvclist)
-        srvclist=subprocess.run([f"cci org info {self.cciorg}"], shell=True, capture_output=True)
-        #self.logger.info(srvclist)
-        
-        hashedalias = "cciorg"+str(hash(self.accesstoken))
-        #self.logger.info(hashedalias)
-        
-        sfdximport=subprocess.run([f"export SFDX_ACCESS_TOKEN='{self.accesstoken}' && sfdx force:auth:accesstoken:store --instanceurl {self.instanceurl} -a {hashedalias} --noprompt --json --loglevel DEBUG "], shell=True, capture_output=True)
-        #self.logger.info(sfdximport)
-        
-        sfdximport=subprocess.run([f"cci org import {hashedalias} {hashedalias}"], shell=True, capture_output=True)
-        #self.logger.info(sfdximport)
-        
-        orglist=subprocess.run([f"cci org list"], shell=True, capture_output=True)
-        #self.logger.info(orglist)
-        
-    
-        with subprocess.Popen(['cci', self.entrypointtype, 'run', self.entrypoint, '--org', hashedalias],
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=1,
-                universal_newlines=True) as p:
-            for line in p.stdout:
-                self.logger.info(line[20:])  # process line here
-                
-            for line in p.stderr:
-                self.logger.error(line[20:])  # process line here
-
-        if p.returncode != 0:
-            raise subprocess.CalledProcessError(p.returncode, f"Failure running QBrix {self.entrypointtype} {self.entrypoint} ")
-        
-        
+
+        org_config = self._get_target_org_config()
+        self.logger.info(f"Running QBrix {self.entrypointtype} {self.entrypoint} against {org_config.name}")
+
+        # Run in this interpreter so the loaded project config and org session are reused, with output logged as it happens
+        try:
+            if self.entrypointtype == "task":
+                run_cci_task(self.entrypoint, org_config=org_config, project_config=self.project_config)
+            else:
+                run_cci_flow(self.entrypoint, org_config=org_config, project_config=self.project_config)
+        except Exception as e:
+            raise CommandException(f"Failure running QBrix {self.entrypointtype} {self.entrypoint}: {e}")
+
     def _run_task(self):
         self._prepruntime()
         self._deployqbrix()
@@ -1,8 +1,10 @@
+import time
 from abc import ABC
+from concurrent.futures import ThreadPoolExecutor
 from qbrix.tools.shared.qbrix_console_utils import init_logger
-from qbrix.tools.shared.qbrix_project_tasks import clean_project_files, check_api_versions, check_permset_group_files, check_and_update_old_class_refs, create_external_id_field, create_permission_set_file, delete_standard_fields, remove_empty_translations, source_org_feature_checker, org_feature_checker, check_org_config_files, update_file_api_versions, upsert_gitignore_entries, replace_file_text, get_qbrix_repo_url
+from qbrix.tools.shared.qbrix_project_tasks import scan_project_files, clean_project_files, check_api_versions, check_permset_group_files, check_and_update_old_class_refs, create_external_id_field, create_permission_set_file, delete_standard_fields, remove_empty_translations, source_org_feature_checker, org_feature_checker, check_org_config_files, update_file_api_versions, upsert_gitignore_entries, replace_file_text, get_qbrix_repo_url
 from cumulusci.core.tasks import BaseTask
-from qbrix.tools.shared.qbrix_json_tasks import update_json_file_value, get_json_file_value
+from qbrix.tools.shared.qbrix_json_tasks import edit_json_files
 
 log = init_logger()
 
@@ -33,6 +35,10 @@ class HealthChecker(BaseTask, ABC):
             "description": "When True, this generates a permission set file for the project qbrix with the project name. Defaults to False",
             "required": False
         },
+        "maxparallel": {
+            "description": "Maximum number of independent checks to run at the same time. Defaults to 4",
+            "required": False
+        },
     }
 
     task_docs = """
@@ -47,68 +53,77 @@ class HealthChecker(BaseTask, ABC):
         self.remove_empty_translations = self.options["remove_empty_translations"] if "remove_empty_translations" in self.options else False
         self.auto_generate_external_id_fields = self.options["auto_generate_external_id_fields"] if "auto_generate_external_id_fields" in self.options else False
         self.regenerate_permission_set = self.options["regenerate_permission_set"] if "regenerate_permission_set" in self.options else False
+        self.maxparallel = max(1, int(self.options["maxparallel"])) if "maxparallel" in self.options else 4
 
     def _run_task(self):
         self.logger.info("\nHealth Check: Starting Health Checker Tool")
+        self.check_timings = []
+        started = time.monotonic()
+
+        # Checks which rewrite cumulusci.yml or may prompt the user run first, one at a time
+        self._run_check("Removing cached/unneeded files and folders from project.", clean_project_files, True)
+        self._run_check("Checking for old class references and updating them...", check_and_update_old_class_refs)
+        self._run_check("Checking placeholder names have been replaced and other naming is correct.", self.check_project_file_naming)
+
+        # Scan the project source once and share the file index between the remaining checks
+        file_index = scan_project_files()
+
+        # Each group works on its own files, so the groups can run at the same time
+        independent_groups = [
+            [("Checking that all references to the API version, match the project version.", self._check_api_versions, file_index)],
+            [("Checking .gitignore file", self._check_gitignore_and_permset_groups, file_index)]
+        ]
+        if self.remove_standard_fields:
+            independent_groups.append([("Checking for standard object fields and removing them from the project", delete_standard_fields, file_index)])
+        if self.remove_empty_translations:
+            independent_groups.append([("Checking for and removing empty translations", remove_empty_translations, file_index)])
+        if self.auto_generate_external_id_fields:
+            independent_groups.append([("Checking for and adding External ID Fields to objects", create_external_id_field, None, file_index)])
 
-        self.logger.info("\nHealth Check: Removing cached/unneeded files and folders from project.")
-        clean_project_files()
-        self.logger.info(" -> Check Complete!")
+        with ThreadPoolExecutor(max_workers=self.maxparallel) as executor:
+            futures = [executor.submit(self._run_check_group, group) for group in independent_groups]
 
-        self.logger.info("\nHealth Check: Checking for old class references and updating them...")
-        check_and_update_old_class_refs()
-        self.logger.info(" -> Check Complete!")
+            # Scratch org file checks may ask for confirmation, so they stay on the main thread
+            self._run_check("Checking that orgs/dev.json has all features from all sources related to this Q Brix.", source_org_feature_checker, False, self.auto, True)
+            self._run_check("Checking that dev_preview has all features from dev.", org_feature_checker, self.auto)
+            self._run_check("Checking that scratch org files are configured with required settings", check_org_config_files, True)
 
-        self.logger.info("\nHealth Check: Checking placeholder names have been replaced and other naming is correct.")
-        self.check_project_file_naming()
-        self.logger.info(" -> Check Complete!")
+            errors = [future.exception() for future in futures if future.exception() is not None]
 
-        self.logger.info("\nHealth Check: Checking that all references to the API version, match the project version.")
-        check_api_versions(self.project_config.project__package__api_version)
-        if self.api_checker_include_code_files:
-            update_file_api_versions(self.project_config.project__package__api_version)
-        self.logger.info(" -> Check Complete!")
+        if self.regenerate_permission_set:
+            self._run_check("Checking and generating Permission Set for the Q Brix", self._regenerate_permission_set)
 
-        self.logger.info("\nHealth Check: Checking that orgs/dev.json has all features from all sources related to this Q Brix.")
-        source_org_feature_checker(False, self.auto)
-        self.logger.info(" -> Check Complete!")
+        self.logger.info("\nHealth Check: Check Timings")
+        for check_name, elapsed in self.check_timings:
+            self.logger.info(f" {elapsed:7.2f}s  {check_name}")
+        self.logger.info(f" {time.monotonic() - started:7.2f}s  Total")
 
-        self.logger.info("\nHealth Check: Checking that dev_preview has all features from dev.")
-        org_feature_checker(self.auto)
-        self.logger.info(" -> Check Complete!")
+        if errors:
+            raise errors[0]
 
-        self.logger.info("\nHealth Check: Checking that scratch org files are configured with required settings")
-        check_org_config_files(True)
-        self.logger.info(" -> Check Complete!")
+        self.logger.info("\n\nHealth Check: All Checks completed!")
 
-        if self.remove_standard_fields:
-            self.logger.info("\nHealth Check: Checking for standard object fields and removing them from the project")
-            delete_standard_fields()
-            self.logger.info(" -> Check Complete!")
+    def _run_check(self, check_name, check, *args):
+        """Runs a single check and records how long it took"""
+        self.logger.info(f"\nHealth Check: {check_name}")
+        check_started = time.monotonic()
+        try:
+            check(*args)
+        finally:
+            self.check_timings.append((check_name, time.monotonic() - check_started))
+        self.logger.info(" -> Check Complete!")
 
-        if self.remove_empty_translations:
-            self.logger.info("\nHealth Check: Checking for and removing empty translations")
-            remove_empty_translations()
-            self.logger.info(" -> Check Complete!")
+    def _run_check_group(self, group):
+        """Runs a group of dependent checks in order"""
+        for check in group:
+            self._run_check(*check)
 
-        if self.auto_generate_external_id_fields:
-            self.logger.info("\nHealth Check: Checking for and adding External ID Fields to objects")
-            create_external_id_field()
-            self.logger.info(" -> Check Complete!")
+    def _check_api_versions(self, file_index):
+        check_api_versions(self.project_config.project__package__api_version)
+        if self.api_checker_include_code_files:
+            update_file_api_versions(self.project_config.project__package__api_version, file_index)
 
-        if self.regenerate_permission_set:
-            project_name = self.project_config.project__name
-            if project_name:
-                self.logger.info("\nHealth Check: Checking and generating Permission Set for the Q Brix")
-                permission_set_file_name = project_name.replace(" ", "_")
-                permission_set_check = input(f"Please confirm that you understand that this will overwrite any existing file located at force-app/main/default/permissionsets/{permission_set_file_name}.permissionset-meta.xml: (y/n)")
-                if permission_set_check and permission_set_check.lower() == 'y':
-                    create_permission_set_file(permission_set_file_name, f"{project_name} Permission Set")
-                    self.logger.info(" -> Check Complete!")
-                else:
-                    self.logger.info("Confirmation was not received, skipping Permission Set check and rebuild.")
-
-        self.logger.info("\nHealth Check: Checking .gitignore file")
+    def _check_gitignore_and_permset_groups(self, file_index):
         test_list = []
 
         # ADD ENTRIES FOR THE .GITIGNORE FILE BELOW. LEFT THIS AS IS TO MAKE IT EASIER TO READ
@@ -140,11 +155,19 @@ class HealthChecker(BaseTask, ABC):
         replace_file_text(".gitignore", ".vscode/", "")
 
         # Check Permission Set Group Files are set to Outdated
-        check_permset_group_files()
+        check_permset_group_files(file_index)
 
-        self.logger.info(" -> Check Complete!")
+    def _regenerate_permission_set(self):
+        project_name = self.project_config.project__name
+        if not project_name:
+            return
 
-        self.logger.info("\n\nHealth Check: All Checks completed!")
+        permission_set_file_name = project_name.replace(" ", "_")
+        permission_set_check = input(f"Please confirm that you understand that this will overwrite any existing file located at force-app/main/default/permissionsets/{permission_set_file_name}.permissionset-meta.xml: (y/n)")
+        if permission_set_check and permission_set_check.lower() == 'y':
+            create_permission_set_file(permission_set_file_name, f"{project_name} Permission Set")
+        else:
+            self.logger.info("Confirmation was not received, skipping Permission Set check and rebuild.")
 
     def check_project_file_naming(self):
 
@@ -196,19 +219,23 @@ class HealthChecker(BaseTask, ABC):
                 self.logger.info(
                     f"Names Found:\nProject Name: {project_name}\nPackage Name: {package_name}\nRepo URL: {repo_url}\nQBrix Name (From Repo URL): {repo_qbrix_name}")
 
+            org_names = edit_json_files({"orgs/dev.json": [("get", "orgName")], "orgs/dev_preview.json": [("get", "orgName")]})
+            org_name_updates = {}
+
             # Check that the dev.json file has the correct qbrix name
-            if repo_qbrix_name not in get_json_file_value("orgs/dev.json", "orgName"):
+            if repo_qbrix_name not in (org_names["orgs/dev.json"]["orgName"] or ""):
                 log.debug("Naming Check: Updating OrgName in orgs/dev.json has not been updated. Updating now...")
-                update_json_file_value("orgs/dev.json", "orgName", f"{repo_qbrix_name} - Dev org")
-                self.logger.info("Naming Check: Updated orgs/dev.json")
+                org_name_updates["orgs/dev.json"] = [("set", "orgName", f"{repo_qbrix_name} - Dev org")]
 
             # Check that the dev_preview.json file has the correct qbrix name
-            if repo_qbrix_name not in get_json_file_value("orgs/dev_preview.json", "orgName"):
+            if repo_qbrix_name not in (org_names["orgs/dev_preview.json"]["orgName"] or ""):
                 log.debug(
                     "Naming Check: Updating OrgName in orgs/dev_preview.json has not been updated. Updating Now...")
-                update_json_file_value("orgs/dev_preview.json", "orgName", f"{repo_qbrix_name} - Preview Dev org")
-                log.debug(
-                    "Naming Check: Updated orgs/dev_preview.json")
+                org_name_updates["orgs/dev_preview.json"] = [("set", "orgName", f"{repo_qbrix_name} - Preview Dev org")]
+
+            if org_name_updates:
+                edit_json_files(org_name_updates)
+                self.logger.info(f"Naming Check: Updated {', '.join(org_name_updates)}")
 
         if not file_name_error:
             self.logger.info("Health Check: [OK] All naming Checks Passed!")
@@ -7,7 +7,10 @@ import re
 import sys
 import subprocess
 import base64
+import tempfile
+import time
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 
 from cumulusci.core.config import ScratchOrgConfig
 from cumulusci.tasks.sfdx import SFDXBaseTask
@@ -16,6 +19,9 @@ from cumulusci.core.exceptions import CommandException
 from cumulusci.core.keychain import BaseProjectKeychain
 
 LOAD_COMMAND = "sfdx force:apex:execute "
+NAMESPACE_TOKEN = "%vlocity_namespace%"
+STREAM_CHUNK_SIZE = 3 * 64 * 1024
+DEFAULT_ACTIVATION_TIMEOUT = 1800
 
 #TODO: MOVE OUT OT Industries BaseConfig
 class SFIDirectDatapackDeployer(SFDXBaseTask):
@@ -29,6 +35,14 @@ class SFIDirectDatapackDeployer(SFDXBaseTask):
         "datapacks": {
             "description": "1 or more paths to the vlocity datapack json file exported via the Org UI. VBT exports are not supported.",
             "required": False
+        },
+        "maxparallel": {
+            "description": "Number of DataPacks to deploy at the same time. Only raise this when the DataPacks do not depend on each other. Defaults to 1",
+            "required": False
+        },
+        "activationtimeout": {
+            "description": "Maximum number of seconds to spend deploying and activating each DataPack. Defaults to 1800",
+            "required": False
         }
     }
     
@@ -85,94 +99,151 @@ class SFIDirectDatapackDeployer(SFDXBaseTask):
         else:
             self.datapacks = []
             self.logger.info("No Datapacks Specified")
+
+        if "maxparallel" in self.options and not self.options["maxparallel"] is None:
+            self.maxparallel = max(1, int(self.options["maxparallel"]))
+        else:
+            self.maxparallel = 1
+
+        if "activationtimeout" in self.options and not self.options["activationtimeout"] is None:
+            self.activationtimeout = int(self.options["activationtimeout"])
+        else:
+            self.activationtimeout = DEFAULT_ACTIVATION_TIMEOUT
+
+        self.session = requests.Session()
+        self.session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=self.maxparallel))
+        self.session.headers.update({
+            'Authorization': f'Bearer {self.accesstoken}',
+            'Content-Type': 'application/json'
+        })
             
     def deploy_datapacks(self):
+        datapackfiles = []
         for datapackfile in self.datapacks:
             self.logger.info(f"DataPack::{datapackfile}")
             if os.path.isfile(datapackfile):
-                
-                targetnamespace = self.determinenamespace(self.accesstoken)
-                self.logger.info(f"TargetNamespace::{targetnamespace}")
-
-                with open(datapackfile, "r") as tmpFile:
-                    datapackcontents = tmpFile.read()
-                    tmpFile.close()
-                datapackcontents = datapackcontents.replace("%vlocity_namespace%",targetnamespace)
-                
-                dpdict={
-                    "VlocityDataPackData": json.loads(datapackcontents),
-                    "ignoreAllErrors": True
-                }
-                
-                dppayload =base64.b64encode(json.dumps(dpdict).encode("utf-8"))
-                
-                
-                dictpayload= {
-                    "payload": str(dppayload.decode()),
-                    "dpStep": "",
-                    "status": ""
-                    }
-                self.process_datapack_payload(json.dumps(dictpayload))
-                
+                datapackfiles.append(datapackfile)
             else:
                 self.logger.error(f"DataPack::{datapackfile}::File Not Found")
-                
-    def process_datapack_payload(self,payload:str):
+
+        if not datapackfiles:
+            return
+
+        # the namespace is the same for every datapack in the run
+        targetnamespace = self.determinenamespace()
+        self.logger.info(f"TargetNamespace::{targetnamespace}")
+
+        with ThreadPoolExecutor(max_workers=self.maxparallel) as executor:
+            list(executor.map(lambda x: self.deploy_datapack(x, targetnamespace), datapackfiles))
+
+    def deploy_datapack(self, datapackfile, targetnamespace):
+        # the request body is encoded to a temp file so large datapacks are never held in memory as base64
+        with tempfile.TemporaryFile() as payloadfile:
+            for chunk in self._streamdatapackpayload(datapackfile, targetnamespace):
+                payloadfile.write(chunk)
+            payloadfile.seek(0)
+
+            self.process_datapack_payload(payloadfile, datapackfile)
+
+    def _streamdatapackpayload(self, datapackfile, targetnamespace):
+        # same body as {"payload": b64(json({"VlocityDataPackData": <file>, "ignoreAllErrors": True})), "dpStep": "", "status": ""}
+        yield b'{"payload": "'
+
+        pending = b""
+        for chunk in self._readwithnamespace(datapackfile, targetnamespace):
+            pending += chunk
+            cut = len(pending) - len(pending) % 3
+            yield base64.b64encode(pending[:cut])
+            pending = pending[cut:]
+
+        yield base64.b64encode(pending)
+        yield b'", "dpStep": "", "status": ""}'
+
+    def _readwithnamespace(self, datapackfile, targetnamespace):
+        yield b'{"VlocityDataPackData": '
+
+        carry = ""
+        with open(datapackfile, "r") as tmpFile:
+            while True:
+                chunk = tmpFile.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                text = (carry + chunk).replace(NAMESPACE_TOKEN, targetnamespace)
+
+                # hold back a partial token at the end of the chunk until the next read
+                carry = ""
+                for i in range(len(NAMESPACE_TOKEN) - 1, 0, -1):
+                    if text.endswith(NAMESPACE_TOKEN[:i]):
+                        carry = text[-i:]
+                        text = text[:-i]
+                        break
+
+                yield text.encode("utf-8")
+
+        yield carry.encode("utf-8")
+        yield b', "ignoreAllErrors": true}'
+
+    def process_datapack_payload(self, payload, datapackfile=""):
         if(payload is None):
             return
         targeturl =f"{self.org_config.instance_url}/services/apexrest/SFIDirectDatapackAPI"
+
+        # start polling quickly and back off while the server reports no progress
+        interval = 0.5
+        laststep = None
+        deadline = time.time() + self.activationtimeout
+
         try:
-            url = targeturl
-            headers = {
-            'Authorization': f'Bearer {self.accesstoken}',
-            'Content-Type': 'application/json'
-            }
+            while True:
+                if time.time() >= deadline:
+                    self.logger.error(f"DataPack Processing Timed Out::{datapackfile}::Last Step::{laststep} after {self.activationtimeout} seconds")
+                    return None
+
+                response = self.session.post(targeturl, data=payload)
+                payloadresponse = json.loads(response.text)
 
-            #self.logger.info(f"Payload::{payload}")
-            response = requests.request("POST", url, headers=headers, data=payload)            
-            payloadresponse = json.loads(response.text)
-            
-            status =payloadresponse["status"]
-            msg=f"DataPack Processing::Status::{status}"
-            self.logger.info(msg)
-            
-        
-            # we will auto activate till we get a staus of error or dpStep and Status of complete Complete
-            #yes dpStep complete is lower case
-            if payloadresponse["status"] == "Error" or (payloadresponse["dpStep"] == "complete" and payloadresponse["status"] == "Complete"):
                 status =payloadresponse["status"]
-                msg=f"DataPack Processing Finished::Status::{status}"
-                #we either ran into an error or went all the way to activate complete
+                msg=f"DataPack Processing::{datapackfile}::Status::{status}"
                 self.logger.info(msg)
-                return None
-            else:
-                #echo it back through
-                sleep(2)
-                return  self.process_datapack_payload(response.text)
-            
-            
 
+                # we will auto activate till we get a staus of error or dpStep and Status of complete Complete
+                #yes dpStep complete is lower case
+                if payloadresponse["status"] == "Error" or (payloadresponse["dpStep"] == "complete" and payloadresponse["status"] == "Complete"):
+                    msg=f"DataPack Processing Finished::{datapackfile}::Status::{status}"
+                    #we either ran into an error or went all the way to activate complete
+                    self.logger.info(msg)
+                    return None
+
+                step = (payloadresponse["dpStep"], status)
+                interval = 0.5 if step != laststep else min(interval * 2, 10)
+                laststep = step
+
+                #echo it back through
+                payload = response.content
+                sleep(interval)
 
         except BaseException as err:
-            self.logger.error(f"Datapack Deploy Error::{err}")
-        
+            self.logger.error(f"Datapack Deploy Error::{datapackfile}::{err}")
 
     def _setprojectdefaults(self, instanceurl):
         subprocess.run([f"sfdx config:set instanceUrl={instanceurl}"], shell=True, capture_output=True)
         
-    def determinenamespace(self, username: str):
-
-        result = subprocess.run([
-            f"sfdx force:data:soql:query -u {username} -q \"SELECT NamespacePrefix FROM PackageLicense where NamespacePrefix in ('omnistudio','vlocity_cmt','vlocity_ps','vlocity_ins') LIMIT 1\" --json"],
-            shell=True, capture_output=True)
+    def determinenamespace(self):
 
-        self.logger.info(result.stdout)
-        if result is None: return "omnistudio"
+        apiversion = self.project_config.project__package__api_version or "57.0"
+        soql = "SELECT NamespacePrefix FROM PackageLicense where NamespacePrefix in ('omnistudio','vlocity_cmt','vlocity_ps','vlocity_ins') LIMIT 1"
 
-        jsonresult = json.loads(result.stdout)
-
-        if jsonresult["result"]["totalSize"] == 1:
-            return jsonresult["result"]["records"][0]["NamespacePrefix"]
+        try:
+            response = self.session.get(f"{self.instanceurl}/services/data/v{apiversion}/query", params={"q": soql})
+            jsonresult = response.json()
+            self.logger.info(jsonresult)
+        except Exception as err:
+            self.logger.error(f"Namespace Lookup Error::{err}")
+            return "omnistudio"
+
+        if isinstance(jsonresult, dict) and jsonresult.get("totalSize") == 1:
+            return jsonresult["records"][0]["NamespacePrefix"]
 
         # fallback
         return "omnistudio"
@@ -13,17 +13,110 @@ from time import sleep
 import atexit
 import uuid
 import socket
+import traceback
 from datetime import datetime
+from urllib.parse import quote
 
 
 
-from cumulusci.core.config import ScratchOrgConfig
 from cumulusci.tasks.sfdx import SFDXBaseTask
 from cumulusci.core.exceptions import TaskOptionsError
 from cumulusci.core.exceptions import CommandException
 from cumulusci.core.keychain import BaseProjectKeychain
 
 LOAD_COMMAND = "sfdx force:apex:execute "
+TRACKING_URL = "https://qbrix-core.herokuapp.com/qbrix/InstallTracking"
+TRACKING_SPOOL = os.path.join(".qbrix", "installtracking_spool")
+
+
+def spool_tracking_event(trackingdata, spooldir=TRACKING_SPOOL):
+    """
+    Writes a tracking event to the local spool folder, ready to be sent by the background sender.
+
+    Args:
+        trackingdata (dict): Tracking data to send
+        spooldir (str): Folder holding events waiting to be sent
+    """
+    os.makedirs(spooldir, exist_ok=True)
+    eventfile = os.path.join(spooldir, f"{time.time():.6f}_{uuid.uuid4().hex}.json")
+
+    with open(f"{eventfile}.tmp", "w") as f:
+        json.dump(trackingdata, f)
+    os.replace(f"{eventfile}.tmp", eventfile)
+
+
+def flush_tracking_spool(spooldir=TRACKING_SPOOL, retries=3):
+    """
+    Sends all spooled tracking events, oldest first. Events which still fail after the retries are left in the spool for the next flush.
+
+    Args:
+        spooldir (str): Folder holding events waiting to be sent
+        retries (int): Attempts per event, with an increasing pause between each one
+    """
+    if not os.path.isdir(spooldir):
+        return
+
+    for eventfile in sorted(f for f in os.listdir(spooldir) if f.endswith(".json")):
+        eventpath = os.path.join(spooldir, eventfile)
+        sendingpath = f"{eventpath}.sending"
+
+        # claim the event so parallel senders do not post it twice
+        try:
+            os.rename(eventpath, sendingpath)
+        except OSError:
+            continue
+
+        with open(sendingpath, "r") as f:
+            trackingdata = json.load(f)
+
+        for attempt in range(retries):
+            try:
+                response = requests.post(TRACKING_URL, data=json.dumps(trackingdata), verify=True, timeout=30)
+                if response.status_code < 500:
+                    os.remove(sendingpath)
+                    break
+            except requests.RequestException:
+                pass
+
+            sleep(2 ** attempt)
+        else:
+            with open(sendingpath, "w") as f:
+                json.dump(trackingdata, f)
+            os.rename(sendingpath, eventpath)
+
+
+def start_tracking_sender(spooldir=TRACKING_SPOOL):
+    """
+    Flushes the tracking spool from a detached process, so the calling process never waits on the network.
+
+    Args:
+        spooldir (str): Folder holding events waiting to be sent
+    """
+    code = f"from qbrix.tools.utils.qbrix_installtracking import flush_tracking_spool; flush_tracking_spool({spooldir!r})"
+    kwargs = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL, "stdin": subprocess.DEVNULL}
+
+    if sys.platform == "win32":
+        kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS
+    else:
+        kwargs["start_new_session"] = True
+
+    try:
+        subprocess.Popen([sys.executable, "-c", code], cwd=os.getcwd(), **kwargs)
+    except Exception:
+        # events stay in the spool and are sent on the next run
+        pass
+
+
+def _get_last_cci_error():
+    try:
+        result = subprocess.run("cci error info", shell=True, capture_output=True)
+        if result.stderr:
+            return "Unable to access last CCI error info"
+        else:
+            return result.stdout.decode("UTF-8")
+    except:
+        return ""
+
 
 class InstallRecorder(SFDXBaseTask):
     
@@ -178,34 +271,32 @@ class InstallRecorder(SFDXBaseTask):
             self.trackingdata["hostname"]=socket.gethostname()
             self.trackingdata["starttimestamp"]=(datetime.utcnow() - datetime(1970, 1, 1)).total_seconds()
             
-            orginzationdata = self._salesforce_query("select Id,CreatedDate,OrganizationType from Organization")
-            if(not orginzationdata is None):
-                self.trackingdata["orgid"] = orginzationdata["result"]["records"][0]["Id"]
-                self.trackingdata["orgcreatedate"] = orginzationdata["result"]["records"][0]["CreatedDate"]
-                self.trackingdata["organizationtype"] = orginzationdata["result"]["records"][0]["OrganizationType"]
+            lookups = self._gettrackinglookups()
+
+            orginzationdata = lookups.get("organization")
+            if(orginzationdata):
+                self.trackingdata["orgid"] = orginzationdata[0]["Id"]
+                self.trackingdata["orgcreatedate"] = orginzationdata[0]["CreatedDate"]
+                self.trackingdata["organizationtype"] = orginzationdata[0]["OrganizationType"]
             else:
                 self.trackingdata["orgid"] = ""
                 self.trackingdata["orgcreatedate"] = ""
                 self.trackingdata["organizationtype"] = ""
-            
-            
-            currentuserdata = self._salesforce_query(f"select Email from User where username='{self.org_config.username}'")
-            if(not currentuserdata is None):
-                self.trackingdata["installuseremail"] = currentuserdata["result"]["records"][0]["Email"]
+
+            currentuserdata = lookups.get("currentuser")
+            if(currentuserdata):
+                self.trackingdata["installuseremail"] = currentuserdata[0]["Email"]
             else:
                 self.trackingdata["installuseremail"] = ""
-                
-            qlaborgdata = self._salesforce_query("select Identifier__c,Org_Type__c from QLabs__mdt")
-            if(not qlaborgdata is None):
-                self.trackingdata["qlabsorgidentifier"] = qlaborgdata["result"]["records"][0]["Identifier__c"]
-                self.trackingdata["qlabsorgtype"] = qlaborgdata["result"]["records"][0]["Org_Type__c"]
+
+            qlaborgdata = lookups.get("qlabs")
+            if(qlaborgdata):
+                self.trackingdata["qlabsorgidentifier"] = qlaborgdata[0]["Identifier__c"]
+                self.trackingdata["qlabsorgtype"] = qlaborgdata[0]["Org_Type__c"]
             else:
                 self.trackingdata["qlabsorgidentifier"] = ""
                 self.trackingdata["qlabsorgtype"] = ""
-            
-                
-            
-            
+
             self.__writertrackingtofile()
         
        
@@ -215,47 +306,44 @@ class InstallRecorder(SFDXBaseTask):
         #raise Exception("fake error for testing")
         
 
-    def _salesforce_query(self,soql):
-        
-        if soql != "":
-
-            dx_command = f"sfdx force:data:soql:query -q \"{soql}\" --json "
-            subprocess.run(f"sfdx config:set instanceUrl={self.org_config.instance_url}", shell=True, capture_output=True)
-            if isinstance(self.org_config, ScratchOrgConfig):
-                dx_command += " -u {username}".format(username=self.org_config.username)
-            else:
-                dx_command += " -u {username}".format(username=self.org_config.access_token)
+    def _gettrackinglookups(self):
+        # the Organization, User and QLabs lookups are sent as one composite request
+        apiversion = self.project_config.project__package__api_version or "57.0"
+        queries = {
+            "organization": "select Id,CreatedDate,OrganizationType from Organization",
+            "currentuser": f"select Email from User where username='{self.org_config.username}'",
+            "qlabs": "select Identifier__c,Org_Type__c from QLabs__mdt"
+        }
 
-            result = subprocess.run(dx_command, shell=True, capture_output=True)
-            subprocess.run("sfdx config:unset instanceUrl", shell=True, capture_output=True)
-            
-            if result.returncode > 0:
+        payload = {
+            "allOrNone": False,
+            "compositeRequest": [
+                {"method": "GET", "url": f"/services/data/v{apiversion}/query?q={quote(soql)}", "referenceId": name}
+                for name, soql in queries.items()
+            ]
+        }
 
-                if result.stderr:
-                    error_detail = result.stderr.decode("UTF-8")
-                    self.logger.error(f"Salesforce Query Error - Details: {error_detail}")
-                else:
-                    self.logger.error("Salesforce Query Failed, although no error detail was returned.")
+        try:
+            response = requests.post(
+                f"{self.instanceurl}/services/data/v{apiversion}/composite",
+                headers={"Authorization": f"Bearer {self.accesstoken}", "Content-Type": "application/json"},
+                data=json.dumps(payload), timeout=60)
+            response.raise_for_status()
+        except Exception as e:
+            self.logger.error(f"Salesforce Query Error - Details: {e}")
+            return {}
+
+        lookups = {}
+        for subresponse in response.json()["compositeResponse"]:
+            if subresponse["httpStatusCode"] == 200:
+                lookups[subresponse["referenceId"]] = subresponse["body"]["records"]
+            else:
+                self.logger.error(f"Salesforce Query Error - Details: {subresponse['body']}")
 
-                return None
-                
-            json_result = json.loads(result.stdout)
-            self.logger.info(json_result)
-            return json_result
-        
+        return lookups
 
-        return None
- 
- 
     def _getlastccierror(self):
-        try:
-            result = subprocess.run("cci error info", shell=True, capture_output=True)
-            if result.stderr:
-                 return "Unable to access last CCI error info"
-            else:
-                return result.stdout.decode("UTF-8")
-        except:
-            return ""
+        return _get_last_cci_error()
 
     def __writertrackingtofile(self):
         if(self.project_config.project__name in self.trackingdata or self.trackingdata is None):
@@ -292,10 +380,12 @@ class InstallRecorder(SFDXBaseTask):
         if(self.trackingdata is None):
             return
         
-        url = "https://qbrix-core.herokuapp.com/qbrix/InstallTracking"
-        payload = json.dumps(self.trackingdata )
-        response = requests.request("POST", url, data=payload, verify=True)
-        print(response.text)
+        try:
+            spool_tracking_event(self.trackingdata)
+        except Exception as e:
+            self.logger.error(f"Unable to spool tracking data: {e}")
+
+        start_tracking_sender()
 
      
     def _exithandler(self):
@@ -309,6 +399,7 @@ class InstallRecorder(SFDXBaseTask):
             if self._hooks.exit_code is not None:
                 print("death by sys.exit(%d)" % self._hooks.exit_code)
                 self.trackingdata["status"]="Failed"
+                # captured now, as by the time the background sender runs a later run may have replaced it
                 self.trackingdata["lasterror"]=self._getlastccierror()
                 self.__writertrackingtofile()
                 self._recordtracking()
@@ -316,7 +407,8 @@ class InstallRecorder(SFDXBaseTask):
             elif self._hooks.exception is not None:
                 print("death by exception: %s" % self._hooks.exception)
                 self.trackingdata["status"]="Failed"
-                self.trackingdata["lasterror"]=self._getlastccierror()
+                self.trackingdata["lasterror"]="".join(traceback.format_exception(
+                    type(self._hooks.exception), self._hooks.exception, self._hooks.exception.__traceback__))
                 self.__writertrackingtofile()
                 self._recordtracking()
                 
@@ -1,25 +1,251 @@
 from abc import ABC
+import json
 import os
+import re
 import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import yaml
+from cumulusci.core.exceptions import CommandException
 from cumulusci.core.tasks import BaseTask
 from cumulusci.core.config import ScratchOrgConfig, TaskConfig
 from qbrix.salesforce.qbrix_salesforce_tasks import ComparePackages
 from qbrix.tools.bundled.sam.main import migrate
 from qbrix.tools.shared.qbrix_project_tasks import check_and_update_setting, generate_stack_view, update_file_api_versions, create_permission_set_file, push_changes, compare_metadata, delete_standard_fields, assign_prefix_to_files, create_external_id_field
 
+FLEET_CACHE_DIR = os.path.join(".qbrix", "fleet")
+FLEET_REPORT = "fleet_report.json"
+FLEET_BRANCH = "qbrix/fleet-update"
+FLEET_STEPS = ["update", "health_check", "api_versions", "prefix_check"]
+FLEET_OUTPUT_TAIL_LINES = 20
+
 
 class MassFileOps(BaseTask, ABC):
     task_docs = """
     Q Brix Mass Operations Utility has a number of helpful methods to save time when developing projects which store Salesforce metadata.
+
+    When the repos option is set, the utility runs as a fleet engine instead of showing the menu. Each repo is cloned (or fetched) into a shared cache, the pipeline steps are run against it and the results are written to a JSON report. Repos are processed in parallel.
+
+    Pipeline steps: update (update_qbrix), health_check (health_check), api_versions (updates file API versions to the repo's project API version) and prefix_check (reports custom objects without the given prefix).
+
+    Example: cci task run mass_qbrix_update --repos repos.txt --pipeline update,health_check --commitmessage "Q Brix update" --maxparallel 8
     """
 
-    task_options = {}
+    task_options = {
+        "repos": {
+            "description": "List of Q Brix repos (owner/name or clone URLs), or the path to a text file with one repo per line. When set, runs the fleet engine instead of the menu.",
+            "required": False
+        },
+        "pipeline": {
+            "description": "Comma separated list of steps to run against each repo. Defaults to update,health_check",
+            "required": False
+        },
+        "maxparallel": {
+            "description": "Number of repos to process at the same time. Defaults to 4",
+            "required": False
+        },
+        "prefix": {
+            "description": "Prefix used by the prefix_check step, e.g. FINS",
+            "required": False
+        },
+        "commitmessage": {
+            "description": "When set, any changes are committed to the qbrix/fleet-update branch with this message",
+            "required": False
+        },
+        "push": {
+            "description": "When True, the qbrix/fleet-update branch is pushed to origin after committing. Defaults to False",
+            "required": False
+        },
+        "cachedir": {
+            "description": "Folder for the shared clone cache. Defaults to .qbrix/fleet",
+            "required": False
+        },
+        "report": {
+            "description": "Path to the JSON report file. Defaults to fleet_report.json",
+            "required": False
+        }
+    }
 
     def _init_options(self, kwargs):
         super(MassFileOps, self)._init_options(kwargs)
+        self.repos = self.options["repos"] if "repos" in self.options else None
+        self.pipeline = self.options["pipeline"] if "pipeline" in self.options else "update,health_check"
+        self.maxparallel = int(self.options["maxparallel"]) if "maxparallel" in self.options else 4
+        self.prefix = self.options["prefix"] if "prefix" in self.options else None
+        self.commitmessage = self.options["commitmessage"] if "commitmessage" in self.options else None
+        self.push = str(self.options["push"]).lower() == "true" if "push" in self.options else False
+        self.cachedir = self.options["cachedir"] if "cachedir" in self.options else FLEET_CACHE_DIR
+        self.report = self.options["report"] if "report" in self.options else FLEET_REPORT
+
+    def _get_fleet_repos(self):
+        repos = self.repos
+        if isinstance(repos, str):
+            if os.path.isfile(repos):
+                with open(repos, "r") as repo_file:
+                    repos = [line.strip() for line in repo_file if line.strip() and not line.strip().startswith("#")]
+            else:
+                repos = [r.strip() for r in repos.split(",") if r.strip()]
+
+        fleet = []
+        for repo in repos:
+            repo_url = repo if "://" in repo or repo.startswith("git@") else f"https://github.com/{repo}"
+            repo_name = re.sub(r"\.git$", "", repo_url.rstrip("/").rsplit("/", 1)[-1].rsplit(":", 1)[-1])
+            fleet.append((repo_name, repo_url))
+        return fleet
+
+    def _run_repo_command(self, repo_name, command, cwd):
+        """Runs a command for a repo and returns the return code and output lines"""
+        result = subprocess.run(command, capture_output=True, text=True, cwd=cwd)
+        output = (result.stdout + result.stderr).splitlines()
+        for line in output:
+            self.logger.debug(f"[{repo_name}] {line}")
+        return result.returncode, output
+
+    def _sync_repo(self, repo_name, repo_url):
+        """Clones the repo into the shared cache, or fetches and resets an existing clone"""
+        repo_dir = os.path.join(self.cachedir, repo_name)
+
+        if os.path.isdir(os.path.join(repo_dir, ".git")):
+            return_code, output = self._run_repo_command(repo_name, ["git", "fetch", "--prune", "origin"], repo_dir)
+            if return_code == 0:
+                return_code, output = self._run_repo_command(repo_name, ["git", "checkout", "-B", FLEET_BRANCH, "origin/HEAD"], repo_dir)
+            if return_code == 0:
+                return_code, output = self._run_repo_command(repo_name, ["git", "reset", "--hard", "origin/HEAD"], repo_dir)
+            if return_code == 0:
+                # Ignored files (.cci, .qbrix) are kept so the caches in each repo are reused
+                return_code, output = self._run_repo_command(repo_name, ["git", "clean", "-fd"], repo_dir)
+            if return_code == 0:
+                return repo_dir
+
+            self.logger.info(f"[{repo_name}] Fetch failed. Clearing cached clone")
+            shutil.rmtree(repo_dir, ignore_errors=True)
+
+        os.makedirs(self.cachedir, exist_ok=True)
+        return_code, output = self._run_repo_command(repo_name, ["git", "clone", repo_url, repo_name], self.cachedir)
+        if return_code != 0:
+            raise CommandException("\n".join(output[-FLEET_OUTPUT_TAIL_LINES:]))
+        self._run_repo_command(repo_name, ["git", "checkout", "-B", FLEET_BRANCH], repo_dir)
+        return repo_dir
+
+    def _run_fleet_step(self, repo_name, repo_dir, step):
+        """Runs a single pipeline step against a repo clone and returns (success, output lines)"""
+        if step == "update":
+            return_code, output = self._run_repo_command(repo_name, ["cci", "task", "run", "update_qbrix"], repo_dir)
+            return return_code == 0, output
+
+        if step == "health_check":
+            return_code, output = self._run_repo_command(repo_name, ["cci", "task", "run", "health_check", "--auto", "True"], repo_dir)
+            return return_code == 0, output
+
+        if step == "api_versions":
+            with open(os.path.join(repo_dir, "cumulusci.yml"), "r") as cci_file:
+                cci_data = yaml.safe_load(cci_file) or {}
+            api_version = str(cci_data.get("project", {}).get("package", {}).get("api_version") or "")
+            if not api_version:
+                return False, ["Unable to read project API Version from cumulusci.yml"]
+            script = f"from qbrix.tools.shared.qbrix_project_tasks import update_file_api_versions; update_file_api_versions('{api_version}')"
+            return_code, output = self._run_repo_command(repo_name, [sys.executable, "-c", script], repo_dir)
+            return return_code == 0, output
+
+        if step == "prefix_check":
+            unprefixed = self._find_unprefixed_objects(repo_dir)
+            return not unprefixed, [f"Missing prefix: {name}" for name in unprefixed]
+
+        return False, [f"Unknown pipeline step: {step}"]
+
+    def _find_unprefixed_objects(self, repo_dir):
+        """Lists custom objects in a repo which do not start with the configured prefix"""
+        objects_dir = os.path.join(repo_dir, "force-app", "main", "default", "objects")
+        if not self.prefix or not os.path.isdir(objects_dir):
+            return []
+
+        prefix = self.prefix.replace("_", "").lower()
+        return sorted(
+            name for name in os.listdir(objects_dir)
+            if name.lower().endswith("__c") and not re.match(r'^[a-zA-Z]+__', name) and not name.lower().startswith(prefix)
+        )
+
+    def _process_repo(self, repo_name, repo_url, steps):
+        started = time.monotonic()
+        result = {"repo": repo_name, "url": repo_url, "status": "success", "steps": [], "changed_files": [], "commit": None}
+
+        try:
+            repo_dir = self._sync_repo(repo_name, repo_url)
+
+            for step in steps:
+                step_started = time.monotonic()
+                success, output = self._run_fleet_step(repo_name, repo_dir, step)
+                result["steps"].append({
+                    "name": step,
+                    "success": success,
+                    "seconds": round(time.monotonic() - step_started, 2),
+                    "output": output[-FLEET_OUTPUT_TAIL_LINES:]
+                })
+                self.logger.info(f"[{repo_name}] {step}: {'OK' if success else 'FAILED'}")
+                if not success:
+                    result["status"] = "failed"
+                    break
+
+            _, changed = self._run_repo_command(repo_name, ["git", "status", "--porcelain"], repo_dir)
+            result["changed_files"] = [line[3:] for line in changed if line.strip()]
+
+            if result["status"] == "success" and result["changed_files"] and self.commitmessage:
+                self._run_repo_command(repo_name, ["git", "add", "-A"], repo_dir)
+                return_code, output = self._run_repo_command(repo_name, ["git", "commit", "-m", self.commitmessage], repo_dir)
+                if return_code == 0:
+                    _, sha = self._run_repo_command(repo_name, ["git", "rev-parse", "HEAD"], repo_dir)
+                    result["commit"] = sha[0] if sha else None
+                    if self.push:
+                        return_code, output = self._run_repo_command(repo_name, ["git", "push", "--force-with-lease", "origin", FLEET_BRANCH], repo_dir)
+                if return_code != 0:
+                    result["status"] = "failed"
+                    result["error"] = "\n".join(output[-FLEET_OUTPUT_TAIL_LINES:])
+        except Exception as e:
+            result["status"] = "failed"
+            result["error"] = str(e)
+
+        result["seconds"] = round(time.monotonic() - started, 2)
+        return result
+
+    def _run_fleet(self):
+        fleet = self._get_fleet_repos()
+        steps = [s.strip() for s in str(self.pipeline).split(",") if s.strip()]
+        invalid_steps = [s for s in steps if s not in FLEET_STEPS]
+        if invalid_steps:
+            raise CommandException(f"Unknown pipeline step(s): {', '.join(invalid_steps)}. Valid steps are: {', '.join(FLEET_STEPS)}")
+
+        self.logger.info(f"Running pipeline [{', '.join(steps)}] across {len(fleet)} repo(s) with {self.maxparallel} worker(s)")
+        started = time.monotonic()
+
+        results = []
+        with ThreadPoolExecutor(max_workers=max(1, self.maxparallel)) as executor:
+            futures = [executor.submit(self._process_repo, repo_name, repo_url, steps) for repo_name, repo_url in fleet]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                self.logger.info(f"[{result['repo']}] {result['status'].upper()} in {result['seconds']}s ({len(results)}/{len(fleet)})")
+
+        results.sort(key=lambda r: r["repo"])
+        report = {
+            "pipeline": steps,
+            "seconds": round(time.monotonic() - started, 2),
+            "succeeded": len([r for r in results if r["status"] == "success"]),
+            "failed": len([r for r in results if r["status"] != "success"]),
+            "repos": results
+        }
+        with open(self.report, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+        self.logger.info(f"Fleet run complete: {report['succeeded']} succeeded, {report['failed']} failed. Report saved to {self.report}")
 
     def _run_task(self):
+        if self.repos:
+            self._run_fleet()
+            return
+
         self.logger.info(f""" 
         \nQ BRIX - MASS OPERATIONS UTILITY\n\n
         OPTION  DESCRIPTION\n
@@ -14,20 +14,29 @@ from cumulusci.core.keychain import BaseProjectKeychain
 
 log = init_logger()
 
+POLL_INITIAL_SECONDS = 2
+POLL_MAX_SECONDS = 15
+STATUS_LOOKUP_RETRIES = 3
+PENDING_JOB_STATES = ["waiting", "delayed"]
+
 
 class RunDataTool(SFDXBaseTask):
     keychain_class = BaseProjectKeychain
     task_options = {
         "data_keys": {
-            "description": "Data Collection Key or keys",
+            "description": "Data Collection Key or keys. To load a key after other keys have completed, use a dict with key and depends_on, e.g. {key: abc, depends_on: [xyz]}",
             "required": True
         },
+        "maxparallel": {
+            "description": "Maximum number of data loads to run at the same time. Defaults to 1, which loads the keys one after another in the order given",
+            "required": False
+        },
         "total_timeout": {
             "description": "Total Timeout in Seconds. Defaults to 8600 seconds.",
             "required": False
         },
         "wait": {
-            "description": "If defined, this is the total amount of time in seconds which the script will wait between each data load. If only one data collection is defined, this will be the wait time after the data load has completed.",
+            "description": "If defined, this is the amount of time in seconds which the script will wait between each data load when they run one at a time (including after the last one), and after the keys a data load depends on have completed. Defaults to 2 seconds.",
             "required": False
         },
         "org": {
@@ -38,6 +47,8 @@ class RunDataTool(SFDXBaseTask):
 
     task_docs = """
     Takes a list of data collection IDs which are then deployed using the NextGen Data Tool. At least one data collection ID must be specified.
+
+    Data collections are loaded one after another by default. Set maxparallel above 1 to load them at the same time, in which case any collection which lists other keys in depends_on starts once those keys have completed.
     """
     
     @property
@@ -88,6 +99,74 @@ class RunDataTool(SFDXBaseTask):
         self.data_keys = self.options["data_keys"]
         self.total_timeout = int(self.options["total_timeout"]) if "total_timeout" in self.options else 8600
         self.wait = int(self.options["wait"]) if "wait" in self.options else 2
+        self.maxparallel = max(1, int(self.options["maxparallel"])) if "maxparallel" in self.options else 1
+
+    def _get_data_loads(self):
+        """Returns the data keys, in order, with the keys each one depends on"""
+
+        data_keys = self.data_keys
+        if isinstance(data_keys, (str, dict)):
+            data_keys = [data_keys]
+
+        data_loads = {}
+        for data_key in data_keys:
+            depends_on = []
+            if isinstance(data_key, dict):
+                depends_on = data_key.get("depends_on") or []
+                data_key = data_key.get("key")
+                if isinstance(depends_on, str):
+                    depends_on = [d.strip() for d in depends_on.split(",") if d.strip()]
+
+            # Check for missing Data Collection Key
+            if data_key is None or data_key == "":
+                self.logger.error("NextGen Data Tool: Invalid or missing Data Collection ID. Skipping Job.")
+                continue
+
+            data_loads[str(data_key)] = [str(d) for d in depends_on]
+
+        for data_key, depends_on in data_loads.items():
+            missing = [d for d in depends_on if d not in data_loads]
+            if missing:
+                raise Exception(f"Data Collection {data_key} depends on {', '.join(missing)}, which is not in the data_keys list.")
+
+        return data_loads
+
+    def _start_job(self, data_key, email_address, is_scratch_org):
+        """Requests a data load for a data collection key and returns the Job ID"""
+
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        data = {
+            "username": self.org_config.username,
+            "email": email_address,
+            "collection_version_id": f"{data_key}",
+            "is_production": not is_scratch_org,
+            "instance_url": self.instanceurl,
+            "access_token": self.accesstoken
+        }
+
+        self.logger.info(
+            f"NextGen Data Tool: Starting Job\n\nRequesting Data Job with the following configuration:\n\nData Collection ID: {data_key}\nUsername: {self.org_config.username}\nEmail: {email_address}\nScratch Org Mode: {is_scratch_org}\n")
+        result = self.session.post(self.url, json=data, headers=headers)
+        json_response = result.json()
+
+        if json_response is None:
+            self.logger.error(
+                f"NextGen Data Tool: Error the job failed to start. This could be due to network issues or issues with the NextGen Data Load host.")
+            raise Exception("Data Load Job Failed to start.")
+
+        job_id = json_response["id"]
+        self.logger.info(f"NextGen Data Tool: Data Load started with ID {job_id}")
+        self.logger.info(f'JOB STATUS URL:: {self.url}/{job_id}')
+        return job_id
+
+    def _get_job_status(self, job_id):
+        """Returns the job status json, or None if the status could not be read"""
+
+        try:
+            return self.session.get(f"{self.url}/{job_id}").json()
+        except (requests.RequestException, ValueError) as e:
+            log.debug(f"NextGen Data Tool: Unable to lookup job status for {job_id}: {e}")
+            return None
 
     def _run_task(self):
 
@@ -99,9 +178,6 @@ class RunDataTool(SFDXBaseTask):
                 "NextGen Data Tool: Error, there were no data collection keys were passed! Please check your task definition and add the correct data keys.")
             raise Exception("No Data Keys Passed! Data Load Failed.")
 
-        data_load_job_counter = 1
-        total_keys = len(self.data_keys)
-
         # Get Email from target org
         email_address = salesforce_query(
             f"SELECT Email From User Where Username = '{self.org_config.username}' LIMIT 1", self.org_config)
@@ -113,84 +189,60 @@ class RunDataTool(SFDXBaseTask):
         if self.org_config.is_sandbox:
             IsScratchOrg = True
 
-        for data_key in self.data_keys:
+        if self.total_timeout < 500 or self.total_timeout > 8600:
+            self.total_timeout = 8600
 
-            # Set Start Time of Job
-            st = time.time()
-            self.logger.info(f"NextGen Data Tool: Processing Data Load {data_load_job_counter} of {total_keys}")
-
-            # Check for missing Data Collection Key
-            if data_key is None or data_key == "":
-                self.logger.error(
-                    f"NextGen Data Tool: Invalid or missing Data Collection ID. Skipping Job {data_load_job_counter} of {total_keys}.")
-                continue
+        data_loads = self._get_data_loads()
+        total_keys = len(data_loads)
+        self.session = requests.Session()
 
-            # Start Data Load and get Job ID
-            headers = {"Content-Type": "application/json; charset=utf-8"}
-            data = {
-                "username": self.org_config.username,
-                "email": email_address,
-                "collection_version_id": f"{data_key}",
-                "is_production": not IsScratchOrg,
-                "instance_url": self.instanceurl,
-                "access_token": self.accesstoken
-            }
-            
-            #self.logger.info(data)
+        pending = list(data_loads)
+        active = {}
+        completed = {}
+        last_status = {}
+        lookup_retries = {}
+        started = time.time()
+        poll_interval = POLL_INITIAL_SECONDS
 
-            self.logger.info(
-                f"NextGen Data Tool: Starting Job\n\nRequesting Data Job with the following configuration:\n\nData Collection ID: {data_key}\nUsername: {self.org_config.username}\nEmail: {email_address}\nScratch Org Mode: {IsScratchOrg}\n")
-            result = requests.post(self.url, json=data, headers=headers)
-            jsonResponse = result.json()
+        # Single monitor loop which starts any data load that is ready and checks on every running job
+        while pending or active:
 
-            if jsonResponse is not None:
-                job_id = jsonResponse["id"]
-                self.logger.info(f"NextGen Data Tool: Data Load started with ID {job_id}")
-            else:
+            # Handle Timeout
+            if time.time() - started > self.total_timeout:
                 self.logger.error(
-                    f"NextGen Data Tool: Error the job failed to start. This could be due to network issues or issues with the NextGen Data Load host.")
-                raise Exception("Data Load Job Failed to start.")
+                    f"NextGen Data Tool: Error Data Load Timeout Reached (Timeout set at {self.total_timeout} seconds)")
+                raise Exception("Data Load timed out. Data load failed.")
 
-            job_status_check_url = f"{self.url}/{job_id}"
+            ready = [k for k in pending if all(d in completed for d in data_loads[k])]
+            for data_key in ready[:self.maxparallel - len(active)]:
+                if self.wait and (data_loads[data_key] or (self.maxparallel == 1 and completed)):
+                    sleep(self.wait)
+                pending.remove(data_key)
+                self.logger.info(f"NextGen Data Tool: Processing Data Load {total_keys - len(pending)} of {total_keys}")
+                job_id = self._start_job(data_key, email_address, IsScratchOrg)
+                active[job_id] = (data_key, time.time())
+                poll_interval = POLL_INITIAL_SECONDS
 
-            # Check job for status updates
-            timeout = 0
-            total_retries = 0
+            if not active:
+                raise Exception(f"Unable to start Data Collection(s) {', '.join(pending)}. Check depends_on for circular references.")
 
-            if self.total_timeout < 500 or self.total_timeout > 8600:
-                self.total_timeout = 8600
+            sleep(poll_interval)
+            status_changed = False
 
-            self.logger.info(f'JOB STATUS URL:: {job_status_check_url}')
-            while True:
+            for job_id, (data_key, job_started) in list(active.items()):
 
                 # Get Job Status
-                check_job = requests.get(job_status_check_url)
-
-                # print("\nResult\n")
-                # print(check_job.json())
+                check_job_json = self._get_job_status(job_id)
 
                 # Handle issues with job status
-                if check_job.json() is None:
-                    if total_retries > 3:
+                if check_job_json is None:
+                    lookup_retries[job_id] = lookup_retries.get(job_id, 0) + 1
+                    if lookup_retries[job_id] > STATUS_LOOKUP_RETRIES:
                         self.logger.error("NextGen Data Tool: Unable to lookup job status. Check your internet connection.")
                         raise Exception("NextGen Data Tool Job Failed")
-                    else:
-                        total_retries += 1
-                        log.debug(
-                            f"NextGen Data Tool: Unable to lookup job status. Waiting 5 seconds and then retrying... retry attempt {total_retries}")
-                        sleep(5)
-                        continue
-
-                # Handle Timeout
-                if timeout > self.total_timeout:
-                    self.logger.error(
-                        f"NextGen Data Tool: Error Data Load Timeout Reached (Timeout set at {self.total_timeout} seconds)")
-                    raise Exception("Data Load timed out. Data load failed.")
-
-                check_job_json = check_job.json()
-                
-                #self.logger.info(check_job_json)
-                
+                    continue
+
+                lookup_retries[job_id] = 0
                 status = check_job_json["state"]
                 progress = check_job_json["progress"]
                 status_update = "Waiting to start."
@@ -198,26 +250,35 @@ class RunDataTool(SFDXBaseTask):
                 if isinstance(progress, dict):
                     status_update = f"Running - {progress['progress']}%"
 
+                if last_status.get(job_id) != (status, status_update):
+                    last_status[job_id] = (status, status_update)
+                    status_changed = True
+                else:
+                    continue
+
                 if status == "completed":
-                    et = time.time()
-                    elapsed_time = et - st
-                    self.logger.info(f"Job Complete! Total Time: " + time.strftime("%H:%M:%S", time.gmtime(elapsed_time)))
-                    break
+                    elapsed_time = time.time() - job_started
+                    self.logger.info(f"Job Complete! Data Collection: {data_key}. Total Time: " + time.strftime("%H:%M:%S", time.gmtime(elapsed_time)))
+                    completed[data_key] = job_id
+                    del active[job_id]
+                    continue
 
-                if status == "active":
+                if status == "active" or status in PENDING_JOB_STATES:
                     self.logger.info(f"NextGen Data Tool: Job ID {job_id}. {status_update}")
+                    continue
 
                 if status == "failed":
                     self.logger.error(f"The data load job has failed. Job ID: {job_id}")
                     self.logger.error(check_job_json)
                     raise Exception("Data Load Failed")
 
-                if status != "active" and status != "completed":
-                    self.logger.error(f"NextGen Data Tool: Unsupported status ({status}) read. Stopping deployment")
-                    raise Exception("Data Load Failed. An unsupported status was received from the NextGen Data Tool.")
+                self.logger.error(f"NextGen Data Tool: Unsupported status ({status}) read. Stopping deployment")
+                raise Exception("Data Load Failed. An unsupported status was received from the NextGen Data Tool.")
 
-                sleep(5)
-                timeout += 1
+            # Poll quickly while jobs are moving and back off while they are not
+            poll_interval = POLL_INITIAL_SECONDS if status_changed else min(poll_interval * 2, POLL_MAX_SECONDS)
 
-            data_load_job_counter += 1
+        if self.maxparallel == 1 and self.wait:
             sleep(self.wait)
+
+        self.logger.info(f"NextGen Data Tool: All Data Loads Complete! Total Time: " + time.strftime("%H:%M:%S", time.gmtime(time.time() - started)))
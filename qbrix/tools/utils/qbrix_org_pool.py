@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from time import sleep
+
+from cumulusci.core.exceptions import CommandException
+
+from qbrix.tools.utils.qbrix_org_generator import Spin
+
+POOL_FILE = os.path.join(".qbrix", "spin_pool.json")
+POOL_LOCK_TIMEOUT_SECONDS = 120
+SECONDS_PER_DAY = 86400
+
+# Task options which are passed to the background refill as environment variables
+SECRET_OPTION_ENV_VARS = {"githubpat": "GITHUB_PAT"}
+
+
+class SpinPool(Spin):
+    task_docs = """
+    Keeps a pool of pre-spun orgs, with the required Q Brix already deployed, for each spin configuration.
+
+    CHECKOUT hands out a ready org from the pool straight away (spinning one on demand if the pool is empty) and starts a background REFILL.
+    REFILL spins and deploys orgs until the pool is back to poolsize. STATUS lists the pool. Orgs are expired ahead of spinlength.
+
+    Example: cci task run spin_pool --action CHECKOUT --devhubuser hub@example.com --cciorg demo --poolsize 2
+    """
+
+    task_options = dict(Spin.task_options)
+    task_options.update({
+        "action": {
+            "description": "CHECKOUT, REFILL or STATUS. Defaults to CHECKOUT",
+            "required": False,
+            "default": "CHECKOUT"
+        },
+        "poolsize": {
+            "description": "Number of ready orgs to keep for this spin configuration. Defaults to 1",
+            "required": False,
+            "default": 1
+        },
+        "poolfile": {
+            "description": "Path to the local pool state file. Defaults to .qbrix/spin_pool.json",
+            "required": False
+        },
+        "expirybufferdays": {
+            "description": "Orgs within this many days of spinlength are expired instead of handed out. Defaults to 1",
+            "required": False,
+            "default": 1
+        }
+    })
+
+    def _prepruntime(self):
+        super(SpinPool, self)._prepruntime()
+
+        self.action = str(self.options.get("action") or "CHECKOUT").upper()
+        self.poolsize = int(self.options.get("poolsize") or 1)
+        self.poolfile = self.options.get("poolfile") or POOL_FILE
+        self.expirybufferdays = float(self.options.get("expirybufferdays") or 1)
+
+        # orgs from the same scratch config/template and qbrix set are interchangeable
+        self.poolconfig = {
+            "mode": self.mode,
+            "source": self.scratch_config if self.mode != "TEMPLATE" else self.templateid,
+            "spinlength": self.spinlength,
+            "deployqbrix": sorted(self.deployqbrix)
+        }
+        self.poolkey = hashlib.md5(json.dumps(self.poolconfig, sort_keys=True).encode()).hexdigest()[:12]
+
+    @contextmanager
+    def _lockpool(self):
+        lockfile = f"{self.poolfile}.lock"
+        poolfolder = os.path.dirname(self.poolfile)
+        if poolfolder and not os.path.isdir(poolfolder):
+            os.makedirs(poolfolder, exist_ok=True)
+
+        deadline = time.time() + POOL_LOCK_TIMEOUT_SECONDS
+        while True:
+            try:
+                handle = os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(handle)
+                break
+            except FileExistsError:
+                # a lock left behind by a killed process is cleared once it is older than the timeout
+                if time.time() - os.path.getmtime(lockfile) > POOL_LOCK_TIMEOUT_SECONDS:
+                    os.remove(lockfile)
+                elif time.time() >= deadline:
+                    raise CommandException(f"Unable to lock the pool file {self.poolfile}")
+                else:
+                    sleep(1)
+
+        try:
+            state = {"pools": {}}
+            if os.path.isfile(self.poolfile):
+                with open(self.poolfile, "r") as f:
+                    state = json.load(f)
+
+            pool = state["pools"].setdefault(self.poolkey, {"config": self.poolconfig, "orgs": []})
+            yield pool
+
+            with open(f"{self.poolfile}.tmp", "w") as f:
+                json.dump(state, f, indent=2)
+            os.replace(f"{self.poolfile}.tmp", self.poolfile)
+        finally:
+            os.remove(lockfile)
+
+    def _expirepool(self, pool):
+        cutoff = time.time() + self.expirybufferdays * SECONDS_PER_DAY
+
+        # warming orgs that never finished (e.g. the refill process was killed) are dropped after a day
+        stalled = time.time() - SECONDS_PER_DAY
+        expired = [org for org in pool["orgs"]
+                   if org["expires"] <= cutoff or (org["status"] == "warming" and org["created"] <= stalled)]
+
+        for org in expired:
+            self.logger.info(f"Expiring pooled org {org['alias']} ({org['username']})")
+            pool["orgs"].remove(org)
+
+            if org["mode"] != "TEMPLATE" and org["status"] == "ready":
+                subprocess.run(["sfdx", "force:org:delete", "-p", "-u", org["alias"]], capture_output=True)
+
+    def _checkout(self):
+        with self._lockpool() as pool:
+            self._expirepool(pool)
+            readyorgs = [org for org in pool["orgs"] if org["status"] == "ready"]
+
+            org = readyorgs[0] if readyorgs else None
+            if org is not None:
+                pool["orgs"].remove(org)
+
+        if org is None:
+            self.logger.info("No ready orgs in the pool. Spinning an org on demand.")
+            self._spinanddeploy()
+        else:
+            self.logger.info(f"Checked out pooled org {org['alias']} ({org['username']})")
+            self.spinusername = org["username"]
+            self._importspinusertocciorg(org["username"])
+
+        self._startbackgroundrefill()
+
+    def _startbackgroundrefill(self):
+        # the refill runs as its own cci process so it carries on after this task returns
+        cmd = ["cci", "task", "run", "spin_pool", "--action", "REFILL"]
+        env = os.environ.copy()
+        for option, value in self.options.items():
+            if option in ("action", "signuprequestid", "subdomain", "spinusername") or value is None:
+                continue
+            # secrets are passed through the environment so they do not show up in the process list
+            if option in SECRET_OPTION_ENV_VARS:
+                env[SECRET_OPTION_ENV_VARS[option]] = str(value)
+                continue
+            cmd.extend([f"--{option}", str(value)])
+
+        logfile = open(os.path.join(os.path.dirname(self.poolfile) or ".", f"spin_pool_{self.poolkey}.log"), "a")
+        kwargs = {"stdout": logfile, "stderr": subprocess.STDOUT, "stdin": subprocess.DEVNULL, "env": env}
+        if sys.platform == "win32":
+            kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS
+        else:
+            kwargs["start_new_session"] = True
+
+        subprocess.Popen(cmd, **kwargs)
+        logfile.close()
+        self.logger.info(f"Pool refill started in the background. Progress is logged to {logfile.name}")
+
+    def _refill(self):
+        basealias = self.cciorg
+
+        while True:
+            with self._lockpool() as pool:
+                self._expirepool(pool)
+                if len(pool["orgs"]) >= self.poolsize:
+                    break
+
+                # reserve the slot first so that parallel refills do not overshoot the pool size
+                t = int(time.time() * 1000)
+                org = {"alias": f"{basealias}_pool_{t}", "username": None, "mode": self.mode, "status": "warming",
+                       "created": time.time(), "expires": time.time() + self.spinlength * SECONDS_PER_DAY}
+                pool["orgs"].append(org)
+
+            self.cciorg = org["alias"]
+            self.subdomain = None
+            self.signuprequestid = None
+            self._generatesubdomain()
+            self._generateusername()
+
+            try:
+                self._spinanddeploy()
+                org["username"] = self.spinusername
+                org["status"] = "ready"
+            except Exception as e:
+                self.logger.error(f"Unable to warm pooled org {org['alias']}: {e}")
+                org = None
+
+            with self._lockpool() as pool:
+                pool["orgs"] = [x for x in pool["orgs"] if x["alias"] != self.cciorg]
+                if org is not None:
+                    pool["orgs"].append(org)
+                    self.logger.info(f"Pooled org {org['alias']} ({org['username']}) is ready")
+
+            if org is None:
+                raise CommandException("Pool refill failed.")
+
+        self.cciorg = basealias
+
+    def _status(self):
+        with self._lockpool() as pool:
+            self._expirepool(pool)
+            self.logger.info(f"Pool {self.poolkey}: {json.dumps(pool['config'])}")
+            for org in pool["orgs"]:
+                expires = time.strftime("%Y-%m-%d %H:%M", time.localtime(org["expires"]))
+                self.logger.info(f"  {org['alias']} {org['status']} {org['username'] or ''} expires {expires}")
+
+    def _run_task(self):
+        self._prepruntime()
+
+        if self.action == "REFILL":
+            self._refill()
+        elif self.action == "STATUS":
+            self._status()
+        elif self.action == "CHECKOUT":
+            self._checkout()
+        else:
+            raise CommandException(f"Unknown pool action {self.action}. Use CHECKOUT, REFILL or STATUS.")
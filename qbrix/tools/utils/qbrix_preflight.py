@@ -8,9 +8,8 @@ from cumulusci.core.keychain import BaseProjectKeychain
 from cumulusci.core.tasks import BaseTask
 from cumulusci.core.config import ScratchOrgConfig, TaskConfig
 from qbrix.tools.shared.qbrix_console_utils import init_logger
-from qbrix.salesforce.qbrix_salesforce_tasks import QbrixInstallCheck
+from qbrix.salesforce.qbrix_salesforce_tasks import get_installed_qbrix
 from qbrix.tools.shared.qbrix_cci_tasks import run_cci_task, run_cci_flow
-from qbrix.tools.shared.qbrix_project_tasks import run_command
 from qbrix.tools.utils.qbrix_orgconfig_hydrate import NGOrgConfig
 
 log = init_logger()
@@ -64,11 +63,22 @@ class RunPreflight(BaseTask, ABC):
             self.only_base_config = self.options["only_base_config"] if "only_base_config" in self.options else False
             self.skip_settings_deployment = self.options["skip_settings_deployment"] if "skip_settings_deployment" in self.options else False
             self.skip_hydrate = self.options["skip_hydrate"] if "skip_hydrate" in self.options else False
+            self.installed_qbrix = None
 
 
         except:
             print('Error on Preflight')
 
+    def is_qbrix_installed(self, qbrix_name):
+        """ Checks the Q Brix Register for the given Q Brix. The register is read from the org once per run. """
+
+        if self.installed_qbrix is None:
+            self.installed_qbrix = get_installed_qbrix(self.org_config, self.project_config.project__package__api_version or "57.0")
+
+        installed = any(qbrix_name.lower() in url for url in self.installed_qbrix)
+        self.logger.info(f"{qbrix_name} is {'installed' if installed else 'NOT installed'}.")
+        return installed
+
     def deploy_settings(self):
         
         settings_path = "force-app/main/default/settings"
@@ -83,12 +93,15 @@ class RunPreflight(BaseTask, ABC):
         # Deploy Settings if Present
         if os.path.exists(settings_path) and not self.skip_settings_deployment:
             self.logger.info("PREFLIGHT: Deploying Settings Directory from force-app/main/default/settings")
-            run_command(f"cci task run deploy --path force-app/main/default/settings --org {self.org_config.name}", os.getcwd())
+            try:
+                run_cci_task("deploy", self.org_config.name, path=settings_path)
+            except Exception as e:
+                log.error(f"PREFLIGHT: Settings Deployment Failed. {e}")
         else:
             self.logger.info("PREFLIGHT: Skipping Settings Deployment.")
 
     def deploy_qbrix_register(self):
-        if not QbrixInstallCheck("QBrix-1-xDO-Tool-QBrixRegister", self.org_config):
+        if not self.is_qbrix_installed("QBrix-1-xDO-Tool-QBrixRegister"):
             self.logger.info(f"PREFLIGHT: Deploying Q Brix Registration to Org {self.org_config.name}")
             checkreg_deploy_result = run_cci_task("base:check_register", self.org_config.name)
             if checkreg_deploy_result:
@@ -99,9 +112,9 @@ class RunPreflight(BaseTask, ABC):
     def deploy_base_config_and_data(self):
         self.logger.info("Checking and loading Q Brix Base Config and Data")
 
-        if not QbrixInstallCheck("QBrix-0-xDO-BaseConfig", self.org_config):
+        if not self.is_qbrix_installed("QBrix-0-xDO-BaseConfig"):
             self.logger.info("Installing Q Brix Base Config")
-            deploy_result = run_cci_flow(f"base:deploy_qbrix", self.org_config.name)
+            deploy_result = run_cci_flow(f"base:deploy_qbrix", self.org_config.name, org_config=self.org_config, project_config=self.project_config)
 
             if deploy_result:
                 self.logger.info(f"Q Brix Base Config Deployment Complete!")
@@ -111,9 +124,9 @@ class RunPreflight(BaseTask, ABC):
             self.logger.info("Q Brix Base Config Deployed")
 
         if not self.only_base_config:
-            if not QbrixInstallCheck("QBrix-0-xDO-BaseData", self.org_config):
+            if not self.is_qbrix_installed("QBrix-0-xDO-BaseData"):
                 self.logger.info("Installing Q Brix Base Data")
-                deploy_result = run_cci_flow(f"base:deploy_qbrix_base_data", self.org_config.name)
+                deploy_result = run_cci_flow(f"base:deploy_qbrix_base_data", self.org_config.name, org_config=self.org_config, project_config=self.project_config)
 
                 if deploy_result:
                     self.logger.info(f"Q Brix Base Data Deployment Complete!")
@@ -7,7 +7,7 @@ from os.path import exists
 from cumulusci.core.tasks import BaseTask
 from qbrix.tools.shared.qbrix_console_utils import init_logger
 from qbrix.tools.shared.qbrix_project_tasks import download_and_unzip, get_qbrix_repo_url, replace_file_text
-from qbrix.tools.shared.qbrix_json_tasks import update_json_file_value
+from qbrix.tools.shared.qbrix_json_tasks import edit_json_files
 
 log = init_logger()
 
@@ -191,10 +191,12 @@ class InitProject(BaseTask, ABC):
 
         # UPDATE SCRATCH ORG TEMPLATE FILES
 
+        scratch_org_updates = {}
         if exists("orgs/dev.json"):
-            update_json_file_value("orgs/dev.json", "orgName", f"{self.project_name} - Dev org")
+            scratch_org_updates["orgs/dev.json"] = [("set", "orgName", f"{self.project_name} - Dev org")]
         if exists("orgs/dev_preview.json"):
-            update_json_file_value("orgs/dev_preview.json", "orgName", f"{self.project_name} - Dev Preview org")
+            scratch_org_updates["orgs/dev_preview.json"] = [("set", "orgName", f"{self.project_name} - Dev Preview org")]
+        edit_json_files(scratch_org_updates)
 
         log.info("Q Brix Setup: Scratch Org Files Updated")
 
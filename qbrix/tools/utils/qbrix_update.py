@@ -1,15 +1,23 @@
-import filecmp
+import importlib
+import json
+import sys
+import zlib
 
 from abc import ABC
 import os
 import shutil
 from os.path import exists
+from zipfile import ZipFile
 from cumulusci.core.tasks import BaseTask
-from qbrix.tools.shared.qbrix_console_utils import init_logger, run_command
-from qbrix.tools.shared.qbrix_project_tasks import download_and_unzip, replace_file_text
+from qbrix.tools.shared.qbrix_console_utils import init_logger
+from qbrix.tools.shared.qbrix_project_tasks import download_and_unzip, download_update_package, replace_file_text
 
 log = init_logger()
 
+UPDATE_ARCHIVE_ROOT = "xDO-Template-main"
+UPDATE_MANIFEST = os.path.join(".qbrix", "update_manifest.json")
+UPDATE_FOLDERS = ["qbrix", ".vscode", ".github"]
+
 
 class QBrixUpdater(BaseTask, ABC):
     q_branch_location = "https://qbrix-core.herokuapp.com/qbrix/q_update_package.zip"
@@ -62,14 +70,93 @@ class QBrixUpdater(BaseTask, ABC):
                 replacement_text = f"# CUSTOM TASKS ADDED FOR Q BRIX DEVELOPMENT\n\n  {key}:\n    class_path: {value}"
                 replace_file_text("cumulusci.yml", "# CUSTOM TASKS ADDED FOR Q BRIX DEVELOPMENT", replacement_text)
 
-    def _update_folder(self, folder_path, update_dir, remove_existing):
+    def _load_manifest(self):
+        if not exists(UPDATE_MANIFEST):
+            return {}
         try:
-            if exists(folder_path) and remove_existing:
-                shutil.rmtree(folder_path)
-            update_path = os.path.join(update_dir, folder_path)
-            shutil.copytree(src=update_path, dst=folder_path, dirs_exist_ok=True)
-        except Exception as e:
-            raise Exception(f"Update Failed: Error details... {e}")
+            with open(UPDATE_MANIFEST, "r") as manifest_file:
+                return json.load(manifest_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, manifest):
+        with open(UPDATE_MANIFEST, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+
+    def _file_crc(self, file_path):
+        crc = 0
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                crc = zlib.crc32(chunk, crc)
+        return crc
+
+    def _is_current(self, file_path, file_info, manifest_entry):
+        """Checks whether the project file already matches the packaged file"""
+
+        if not exists(file_path):
+            return False
+
+        file_stat = os.stat(file_path)
+        if file_stat.st_size != file_info.file_size:
+            return False
+
+        # Unchanged since we last wrote it, so there is no need to read it again
+        if manifest_entry and manifest_entry.get("crc") == file_info.CRC and manifest_entry.get("mtime") == file_stat.st_mtime:
+            return True
+
+        return self._file_crc(file_path) == file_info.CRC
+
+    def _sync_folders(self, archive_path, folders):
+        """
+        Copies files from the update package into the project, skipping any file which already matches the package.
+
+        Returns:
+            list: Relative paths of the files which were written
+        """
+
+        manifest = self._load_manifest()
+        updated_files = []
+
+        with ZipFile(archive_path) as archive:
+            if self.ArchivePassword:
+                archive.setpassword(pwd=bytes(self.ArchivePassword, 'utf-8'))
+
+            for file_info in archive.infolist():
+                if file_info.is_dir() or "__pycache__/" in file_info.filename:
+                    continue
+
+                root, _, relative_path = file_info.filename.partition("/")
+                if root != UPDATE_ARCHIVE_ROOT or relative_path.split("/", 1)[0] not in folders:
+                    continue
+
+                target_path = os.path.join(*relative_path.split("/"))
+                if not self._is_current(target_path, file_info, manifest.get(relative_path)):
+                    target_dir = os.path.dirname(target_path)
+                    if target_dir:
+                        os.makedirs(target_dir, exist_ok=True)
+                    with archive.open(file_info) as source, open(f"{target_path}.qbrixtmp", "wb") as target:
+                        shutil.copyfileobj(source, target)
+                    os.replace(f"{target_path}.qbrixtmp", target_path)
+                    updated_files.append(relative_path)
+
+                manifest[relative_path] = {"crc": file_info.CRC, "mtime": os.stat(target_path).st_mtime}
+
+        self._save_manifest(manifest)
+        return updated_files
+
+    def _reload_updater(self, updated_files):
+        """Reloads any updated Q Brix modules which are already loaded and switches this task to the new updater class"""
+
+        updated_modules = [f[:-3].replace("/", ".") for f in updated_files if f.endswith(".py")]
+        updater_module = QBrixUpdater.__module__
+
+        # Reload shared modules first so the new updater picks them up
+        for module_name in sorted(updated_modules, key=lambda m: m == updater_module):
+            if module_name in sys.modules:
+                importlib.reload(sys.modules[module_name])
+
+        self.__class__ = sys.modules[updater_module].QBrixUpdater
+        self._init_options({})
 
     def _ensure_required_dirs(self):
 
@@ -87,22 +174,27 @@ class QBrixUpdater(BaseTask, ABC):
 
         self._ensure_required_dirs()
 
-        if os.path.exists("qbrix/tools/utils/qbrix_update.py"):
-            shutil.copyfile("qbrix/tools/utils/qbrix_update.py", ".qbrix/qbrix_update.py")
-
-        self.logger.info(" -> Downloading Latest version...")
-        if download_and_unzip(self.q_branch_location, self.ArchivePassword, False, True):
-            # ADD FOLDERS HERE WHICH YOU WANT TO UPDATE IN PROJECT DIRECTORIES
-            # PARAM1 = The folder as if it was from the root path
-            # PARAM2 = The location where the source files should be located
-            # PARAM3 = If True, it will delete the whole directory in project before updating
-            self._update_folder("qbrix", ".qbrix/Update/xDO-Template-main", False)
-            self._update_folder(".vscode", ".qbrix/Update/xDO-Template-main", False)
-            self._update_folder(".github", ".qbrix/Update/xDO-Template-main", False)
-
-            # Finally Clean Up Cached Folder
-            self.logger.info(" -> Cleaning up temp files...")
-            shutil.rmtree(".qbrix/Update")
+        self.logger.info(" -> Checking for the latest version...")
+        updated_files = []
+        try:
+            archive_path, downloaded = download_update_package(self.q_branch_location)
+            if downloaded:
+                self.logger.info(" -> Downloaded new version")
+                with ZipFile(archive_path) as archive:
+                    if self.ArchivePassword:
+                        archive.setpassword(pwd=bytes(self.ArchivePassword, 'utf-8'))
+                    bad_file = archive.testzip()
+                if bad_file:
+                    os.remove(archive_path)
+                    raise Exception(f"Downloaded update package is corrupt ({bad_file}). Please run the update again.")
+            else:
+                self.logger.info(" -> Update package has not changed since the last download")
+
+            # ADD FOLDERS TO UPDATE_FOLDERS WHICH YOU WANT TO UPDATE IN PROJECT DIRECTORIES
+            updated_files = self._sync_folders(archive_path, UPDATE_FOLDERS)
+            self.logger.info(f" -> {len(updated_files)} file(s) updated")
+        except Exception as e:
+            log.error(f"[ERROR] Update Failed! Error Message: {e}")
 
         self.logger.info(" -> Checking cumulusci.yml file...")
         
@@ -135,9 +227,11 @@ class QBrixUpdater(BaseTask, ABC):
 
         self.logger.info(" -> Checking for additional tasks to run...")
 
-        if not filecmp.cmp(".qbrix/qbrix_update.py", "qbrix/tools/utils/qbrix_update.py"):
+        if "qbrix/tools/utils/qbrix_update.py" in updated_files:
             self.logger.info(" -> Update Task has been upgraded, running update again...")
-            run_command("cci task run update_qbrix")
+            self._reload_updater(updated_files)
+            self._run_task()
+            return
 
         if os.path.exists("qbrix/qbrix_update.py"):
             os.remove("qbrix/qbrix_update.py")